@@ -0,0 +1,45 @@
+"""
+Compares evaluate_postfix with the functions postfix_compiler generates for the same postfix expressions.
+
+Usage: python benchmarks/bench_code_generation.py [--number 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexer_utils  # noqa: E402
+import postfix_evaluation_utils  # noqa: E402
+from postfix_compiler import compile_postfix  # noqa: E402
+
+EXPRESSIONS = (
+    "(10 @ 20) + (3 ^ 2) / (2 & 4)",
+    "12! / ((10@2) ^ (3&5)) + 5 * 3 - 7 % 4 $ 2 - ~3",
+    "123# * 4.5 - (6 $ 7 & 8) @ 9",
+    "1" + " + 1" * 200
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="the number of evaluations of every expression")
+    arguments = parser.parse_args(argv)
+
+    print(f"{'postfix length':>14} {'interpreted (s)':>16} {'compiled (s)':>14} {'speedup':>9}")
+    for expression in EXPRESSIONS:
+        token_list = lexer_utils.tokenize(expression)
+        postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+        compiled = compile_postfix(postfix_expression, token_list)
+        assert compiled.evaluate(token_list) == postfix_evaluation_utils.evaluate_postfix(postfix_expression,
+                                                                                           token_list)
+        interpreted_time = timeit.timeit(
+            lambda: postfix_evaluation_utils.evaluate_postfix(postfix_expression, token_list), number=arguments.number)
+        compiled_time = timeit.timeit(lambda: compiled.evaluate(token_list), number=arguments.number)
+        print(f"{len(postfix_expression):>14} {interpreted_time:>16.4f} {compiled_time:>14.4f} "
+              f"{interpreted_time / compiled_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares the hashtag (digit sum) operator with the original implementation, which converted the operand
+through str() and then peeled one digit at a time off the whole number.
+
+Usage: python benchmarks/bench_hashtag.py [--digits 10000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unary_operator import UnaryOperator  # noqa: E402
+
+
+def legacy_hashtag(operand):
+    operand = int(str(operand).replace(".", ""))
+    hashtag_sum = 0
+    while operand != 0:
+        hashtag_sum += operand % 10
+        operand //= 10
+    return hashtag_sum
+
+
+def best_time(function, operand, repeat):
+    return min(timeit.repeat(lambda: function(operand), number=1, repeat=repeat))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--digits", type=int, default=10000, help="the number of digits of the largest operand")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timed runs, the best one is shown")
+    arguments = parser.parse_args(argv)
+    sys.set_int_max_str_digits(0)  # The original implementation needs str() of the whole operand
+
+    random.seed(0)
+    print(f"{'digits':>8} {'original (s)':>14} {'current (s)':>14} {'speedup':>9}")
+    digits = 10
+    while digits <= arguments.digits:
+        operand = random.randrange(10 ** (digits - 1), 10 ** digits)
+        assert UnaryOperator.hashtag(operand) == legacy_hashtag(operand)
+        original = best_time(legacy_hashtag, operand, arguments.repeat)
+        current = best_time(UnaryOperator.hashtag, operand, arguments.repeat)
+        print(f"{digits:>8} {original:>14.6f} {current:>14.6f} {original / current:>8.1f}x")
+        digits = digits * 10 if digits * 10 <= arguments.digits or digits == arguments.digits else arguments.digits
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Counts the Operator lookups per token of the conversion and evaluation steps, and times them, for the opcode
+tables of operators.py against the original loops that called the Operator static methods for every operator.
+
+Usage: python benchmarks/bench_operator_dispatch.py [--terms 2000] [--number 20]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexer_utils  # noqa: E402
+import postfix_evaluation_utils  # noqa: E402
+from operators import Operator  # noqa: E402
+from exact_arithmetic import NUMBER_TYPES  # noqa: E402
+from unary_operator import FACTORIAL_LIMIT  # noqa: E402
+from variable import Variable  # noqa: E402
+
+_STATIC_METHODS = ("is_valid_operator", "get_operator_data", "get_type", "get_priority", "get_position",
+                   "get_operation")
+
+
+def legacy_infix_to_postfix(token_list):
+    output = []
+    operator_stack = []
+    for index, token in enumerate(token_list):
+        if isinstance(token, NUMBER_TYPES) or token.__class__ is Variable:
+            output.append((token, index))
+        elif token == "(":
+            operator_stack.append((token, index))
+        elif token == ")":
+            while operator_stack and operator_stack[-1][0] != "(":
+                output.append(operator_stack.pop())
+            operator_stack.pop()
+            if operator_stack and operator_stack[-1][0] == "s":
+                output.append(operator_stack.pop())
+        elif token == "-(":
+            operator_stack.append(("s", index))
+            operator_stack.append(("(", index))
+        elif Operator.is_valid_operator(token):
+            while (operator_stack and operator_stack[-1][0] != "(" and
+                   (Operator.get_priority(operator_stack[-1][0]) > Operator.get_priority(token) or
+                    (Operator.get_priority(operator_stack[-1][0]) == Operator.get_priority(token) and
+                     Operator.get_position(token) != "right"))):
+                output.append(operator_stack.pop())
+            operator_stack.append((token, index))
+    while operator_stack:
+        output.append(operator_stack.pop())
+    return output
+
+
+def legacy_evaluate_postfix(postfix_expression, token_list):
+    stack = []
+    for token, index in postfix_expression:
+        if isinstance(token, NUMBER_TYPES):
+            stack.append((token, index))
+        elif token.__class__ is Variable:
+            stack.append((token.value({}), index))
+        elif Operator.is_valid_operator(token):
+            operator_type = Operator.get_type(token)
+            operation = Operator.get_operation(token)
+            if operator_type == "binary":
+                right_operand, right_index = stack.pop()
+                left_operand, left_index = stack.pop()
+                if token == "/" and right_operand == 0:
+                    raise postfix_evaluation_utils.zero_division_error(index, right_index, token_list)
+                stack.append((operation(left_operand, right_operand), (left_index, right_index)))
+            elif operator_type == "unary":
+                operand, operand_index = stack.pop()
+                if token == "!" and (operand < 0 or not (operand == int(operand)) or operand > FACTORIAL_LIMIT):
+                    raise postfix_evaluation_utils.domain_error("factorial_domain", operand_index, token_list)
+                if token == "#" and operand < 0:
+                    raise postfix_evaluation_utils.domain_error("hashtag_domain", operand_index, token_list)
+                stack.append((operation(operand), operand_index))
+    return stack[0][0]
+
+
+def count_lookups(function, *args):
+    """
+    Runs a function with the Operator static methods wrapped in counters.
+    :return: The number of static method calls
+    """
+    calls = [0]
+    originals = {name: getattr(Operator, name) for name in _STATIC_METHODS}
+
+    def counted(method):
+        def wrapper(*method_args):
+            calls[0] += 1
+            return method(*method_args)
+        return staticmethod(wrapper)
+
+    for name, method in originals.items():
+        setattr(Operator, name, counted(method))
+    try:
+        function(*args)
+    finally:
+        for name, method in originals.items():
+            setattr(Operator, name, staticmethod(method))
+    return calls[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--terms", type=int, default=2000, help="the number of terms of the benchmark expression")
+    parser.add_argument("--number", type=int, default=20, help="the number of timed runs of every step")
+    arguments = parser.parse_args(argv)
+
+    expression = " + ".join(f"(3 * {term} ^ 2 - 5 @ {term} % 7)" for term in range(1, arguments.terms + 1))
+    token_list = lexer_utils.tokenize(expression)
+    postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+    assert legacy_infix_to_postfix(token_list) == postfix_expression
+    assert legacy_evaluate_postfix(postfix_expression, token_list) == postfix_evaluation_utils.evaluate_postfix(
+        postfix_expression, token_list)
+
+    steps = (
+        ("conversion", lambda: legacy_infix_to_postfix(token_list),
+         lambda: postfix_evaluation_utils.infix_to_postfix(token_list)),
+        ("evaluation", lambda: legacy_evaluate_postfix(postfix_expression, token_list),
+         lambda: postfix_evaluation_utils.evaluate_postfix(postfix_expression, token_list))
+    )
+    print(f"{len(token_list)} tokens")
+    print(f"{'step':<12} {'lookups/token before':>21} {'after':>7} {'before (s)':>11} {'after (s)':>10} {'speedup':>8}")
+    for name, legacy, current in steps:
+        legacy_lookups = count_lookups(legacy) / len(token_list)
+        current_lookups = count_lookups(current) / len(token_list)
+        legacy_time = timeit.timeit(legacy, number=arguments.number)
+        current_time = timeit.timeit(current, number=arguments.number)
+        print(f"{name:<12} {legacy_lookups:>21.2f} {current_lookups:>7.2f} {legacy_time:>11.4f} "
+              f"{current_time:>10.4f} {legacy_time / current_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
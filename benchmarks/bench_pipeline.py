@@ -0,0 +1,225 @@
+"""
+Times every stage of the calculator pipeline separately on generated expression corpora (see corpora.py) of
+10 to 10^6 tokens, writes the timings as JSON, compares them against a stored baseline and checks that every
+stage scales linearly with the size of its input.
+
+The stages are the ones of Calculator: preprocessor, tokenization, validation, infix_to_postfix and
+evaluate_postfix, and lexing, the fused lexer that replaces the first two. A stage that fails ends the
+pipeline of its expression, like it does in the calculator.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--sizes 10 100 ...] [--corpora realistic nested ...] [--output FILE]
+                                        [--baseline benchmarks/baseline.json] [--tolerance 1.5] [--max-slope 1.3]
+
+Exits with status 1 when a stage is slower than the baseline by more than the tolerance, or when its time grows
+faster than tokens ^ max-slope.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpora import CORPORA  # noqa: E402
+import preprocessor_utils  # noqa: E402
+import tokenization_utils  # noqa: E402
+import lexer_utils  # noqa: E402
+import validation_utils  # noqa: E402
+import postfix_evaluation_utils  # noqa: E402
+from invalid_expression_exception import InvalidExpressionException  # noqa: E402
+from diagnostics import DiagnosticReport  # noqa: E402
+from error_codes import HANDLED_ERRORS, error_code  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+STAGES = ("preprocessor", "tokenization", "lexing", "validation", "infix_to_postfix", "evaluate_postfix")
+
+# Timings below this are too noisy to be compared against the baseline
+MIN_COMPARED_SECONDS = 1e-4
+# The scaling slope is fitted on the sizes from this one up, the smaller ones are dominated by fixed costs
+MIN_SCALING_SIZE = 1000
+# The total time every timed measurement of a stage is aimed at, small inputs are run many times
+_TARGET_SECONDS = 0.02
+
+
+def preprocessor(expression):
+    expression = preprocessor_utils.only_valid_characters_check(expression.replace(" ", ""))
+    return preprocessor_utils.mark_special_minuses(preprocessor_utils.reduce_minuses(expression))
+
+
+def tokenization(preprocessed_expression):
+    return tokenization_utils.tokenize(tokenization_utils.decimal_point_check(preprocessed_expression))
+
+
+def validation(token_list):
+    found = validation_utils.diagnose(token_list)
+    if found:
+        raise InvalidExpressionException(DiagnosticReport(found))
+    return token_list
+
+
+def _time(repeat, function, *args):
+    """
+    Times a function call, repeated enough times for a stable measurement.
+    :param repeat: The number of measurements, the best is kept
+    :return: The (best seconds per call, result or exception raised) of the function
+    :rtype: tuple
+    """
+    outcome = None
+
+    def call():
+        nonlocal outcome
+        try:
+            outcome = function(*args)
+        except HANDLED_ERRORS as e:
+            outcome = e
+
+    timer = timeit.Timer(call)
+    seconds = timer.timeit(1)
+    number = max(1, min(10000, int(_TARGET_SECONDS / max(seconds, 1e-9))))
+    return min(seconds, min(timer.repeat(repeat - 1, number)) / number if repeat > 1 else seconds), outcome
+
+
+def run_pipeline(expression, repeat=3):
+    """
+    Times the stages of the pipeline on an expression, every stage on the output of the stage before.
+    :return: The (stage, seconds, error code) of every stage that ran
+    :rtype: list
+    """
+    timings = []
+
+    def stage(name, function, *args):
+        seconds, outcome = _time(repeat, function, *args)
+        error = error_code(outcome) if isinstance(outcome, Exception) else None
+        timings.append((name, seconds, error))
+        return None if error else outcome
+
+    preprocessed_expression = stage("preprocessor", preprocessor, expression)
+    if preprocessed_expression is not None:
+        stage("tokenization", tokenization, preprocessed_expression)
+    token_list = stage("lexing", lexer_utils.tokenize, expression)
+    if token_list and stage("validation", validation, token_list) is not None:
+        postfix_expression = stage("infix_to_postfix", postfix_evaluation_utils.infix_to_postfix, token_list)
+        stage("evaluate_postfix", postfix_evaluation_utils.evaluate_postfix, postfix_expression, token_list)
+    return timings
+
+
+def scaling_slope(points):
+    """
+    Fits time = c * size ^ slope to the measurements of a stage, by least squares on their logarithms.
+    :param points: The (size, seconds) measurements
+    :type points: list
+    :return: The slope, 1 for a linear stage and 2 for a quadratic one, None with less than two measurements
+    :rtype: float or None
+    """
+    points = [(math.log(size), math.log(seconds)) for size, seconds in points if seconds > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else None
+
+
+def run(sizes, corpora, seed=0, repeat=3):
+    """
+    Runs the benchmark over every corpus and size.
+    :return: The report, JSON serializable
+    :rtype: dict
+    """
+    results = []
+    for corpus in corpora:
+        for size in sizes:
+            expression = CORPORA[corpus](size, seed)
+            for stage, seconds, error in run_pipeline(expression, repeat):
+                results.append({"corpus": corpus, "size": size, "stage": stage, "seconds": seconds, "error": error})
+                print(f"{corpus:<16} {size:>8} {stage:<17} {seconds * 1e3:>11.4f} ms"
+                      f"{'  ' + error if error else ''}", file=sys.stderr)
+
+    scaling = []
+    for corpus in corpora:
+        for stage in STAGES:
+            points = [(result["size"], result["seconds"]) for result in results
+                      if result["corpus"] == corpus and result["stage"] == stage and
+                      result["size"] >= MIN_SCALING_SIZE]
+            slope = scaling_slope(points)
+            if slope is not None:
+                scaling.append({"corpus": corpus, "stage": stage, "slope": round(slope, 3)})
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "results": results,
+        "scaling": scaling
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Finds the stages that got slower than in the baseline.
+    :param tolerance: The largest accepted ratio between the time of a stage and its baseline time
+    :type tolerance: float
+    :return: A description of every regression
+    :rtype: list
+    """
+    baseline_seconds = {(result["corpus"], result["size"], result["stage"]): result["seconds"]
+                        for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        expected = baseline_seconds.get((result["corpus"], result["size"], result["stage"]))
+        if expected is None or max(expected, result["seconds"]) < MIN_COMPARED_SECONDS:
+            continue
+        if result["seconds"] > expected * tolerance:
+            regressions.append(f"{result['stage']} on {result['corpus']} ({result['size']} tokens): "
+                               f"{result['seconds'] / expected:.2f}x the baseline time")
+    return regressions
+
+
+def check_scaling(report, max_slope):
+    """
+    Finds the stages whose time grows faster than linearly.
+    :return: A description of every stage with a slope above max_slope
+    :rtype: list
+    """
+    return [f"{entry['stage']} on {entry['corpus']}: time grows as tokens ^ {entry['slope']}"
+            for entry in report["scaling"] if entry["slope"] > max_slope]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="the token counts")
+    parser.add_argument("--corpora", nargs="+", choices=tuple(CORPORA), default=tuple(CORPORA),
+                        help="the corpora to run")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the corpora")
+    parser.add_argument("--repeat", type=int, default=3, help="the measurements of every stage, the best is kept")
+    parser.add_argument("--output", help="write the JSON report to this file instead of the standard output")
+    parser.add_argument("--baseline", help="a JSON report to compare the timings against")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="the largest accepted ratio between a timing and its baseline")
+    parser.add_argument("--max-slope", type=float, default=1.3,
+                        help="the largest accepted scaling exponent of a stage, 1 is linear and 2 quadratic")
+    arguments = parser.parse_args(argv)
+
+    report = run(sorted(arguments.sizes), arguments.corpora, arguments.seed, arguments.repeat)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    failures = check_scaling(report, arguments.max_slope)
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            failures += compare(report, json.load(baseline_file), arguments.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
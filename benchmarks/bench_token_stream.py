@@ -0,0 +1,71 @@
+"""
+Measures the peak memory and the time of the lexing, validation, conversion and evaluation steps on a long
+expression, for the token list pipeline against the array-backed token stream of token_stream.py.
+
+Usage: python benchmarks/bench_token_stream.py [--tokens 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexer_utils  # noqa: E402
+import validation_utils  # noqa: E402
+import postfix_evaluation_utils  # noqa: E402
+import token_stream  # noqa: E402
+
+_TERM = "(12*3.5-7)"  # 7 tokens, 8 with the "+" joining the terms
+
+
+def list_pipeline(expression):
+    token_list = lexer_utils.tokenize(expression)
+    assert not validation_utils.diagnose(token_list)
+    postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+    return postfix_evaluation_utils.evaluate_postfix(postfix_expression, token_list), len(token_list)
+
+
+def stream_pipeline(expression):
+    stream = token_stream.from_expression(expression)
+    assert not any(token_stream.validate(stream))
+    postfix_expression = token_stream.to_postfix(stream)
+    return token_stream.evaluate_postfix(postfix_expression, stream), len(stream)
+
+
+def measure(pipeline, expression):
+    """
+    Runs a pipeline twice, once for its time and once under tracemalloc for its peak memory.
+    :return: The (result, token count, seconds, peak bytes) of the pipeline
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    result, token_count = pipeline(expression)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        pipeline(expression)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, token_count, seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1000000, help="the number of tokens of the expression")
+    arguments = parser.parse_args(argv)
+
+    expression = "+".join([_TERM] * max(1, arguments.tokens // 8))
+    results = {}
+    print(f"{'pipeline':<10} {'tokens':>9} {'time (s)':>9} {'peak (MiB)':>11} {'bytes/token':>12}")
+    for name, pipeline in (("list", list_pipeline), ("stream", stream_pipeline)):
+        result, token_count, seconds, peak = measure(pipeline, expression)
+        results[name] = result
+        print(f"{name:<10} {token_count:>9} {seconds:>9.3f} {peak / 2 ** 20:>11.1f} {peak / token_count:>12.1f}")
+    assert results["list"] == results["stream"]
+
+
+if __name__ == "__main__":
+    main()
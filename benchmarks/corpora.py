@@ -0,0 +1,112 @@
+"""
+Generators of the benchmark expressions. Every generator builds an expression of about the requested number of
+tokens from a seeded random generator, so the same size and seed always give the same expression.
+A token is a number, an operator or a parenthesis of the raw expression, every minus of a minus run counts.
+"""
+import random
+
+_NUMBERS = ("7", "12", "3.5", "0.25", "42", "1000", "2.75", "9")
+_BINARY_OPERATORS = ("+", "-", "*", "/", "%", "$", "&", "@")
+
+
+def _join(terms, operators, tokens, rng):
+    """
+    Joins generated terms with random operators until the expression has the requested number of tokens.
+    The operators don't include a binary minus, a minus after a factorial or a digit sum starts a minus sequence.
+    :param terms: A function returning the (text, token count) of a random term
+    :param operators: The operators the terms are joined with
+    :return: The expression
+    :rtype: str
+    """
+    text, count = terms(rng)
+    parts = [text]
+    while count < tokens:
+        text, term_count = terms(rng)
+        parts.append(rng.choice(operators))
+        parts.append(text)
+        count += term_count + 1
+    return "".join(parts)
+
+
+def _realistic_term(rng):
+    left, right = rng.choice(_NUMBERS), rng.choice(_NUMBERS)
+    shape = rng.randrange(5)
+    if shape == 0:
+        return f"({left} {rng.choice(_BINARY_OPERATORS)} {right})", 5
+    if shape == 1:
+        return f"{left} * {right}", 3
+    if shape == 2:
+        return f"~{left}", 2
+    if shape == 3:
+        return f"{rng.randint(1, 9)}!", 2
+    return f"(~{right} + {rng.randint(10, 999)}#)", 6
+
+
+def realistic(tokens, seed=0):
+    """
+    A mix of every operator over small numbers, the kind of expression a user types.
+    """
+    return _join(_realistic_term, (" + ", " * ", " @ ", " $ "), tokens, random.Random(seed))
+
+
+def nested(tokens, seed=0):
+    """
+    Parentheses nested tokens / 4 deep, ((1 + 1) + 1) + ... with every level open at once.
+    """
+    depth = max(1, tokens // 4)
+    return "(" * depth + "1" + "+1)" * depth
+
+
+def minus_runs(tokens, seed=0):
+    """
+    Numbers separated by long runs of minuses, for the minus sequence reduction.
+    """
+    rng = random.Random(seed)
+
+    def term(rng):
+        run = rng.randint(1, 64)
+        return "-" * run + rng.choice(_NUMBERS), run + 1
+
+    return rng.choice(_NUMBERS) + _join(term, ("",), tokens, rng)
+
+
+def _factorial_power_term(rng):
+    shape = rng.randrange(4)
+    if shape == 0:
+        return f"({rng.randint(3, 12)}! / {rng.randint(2, 10)}!)", 7
+    if shape == 1:
+        return f"({rng.choice(('1.5', '2', '0.5', '3'))} ^ {rng.randint(1, 5)}!)", 6
+    if shape == 2:
+        return f"({rng.randint(2, 9)} ^ {rng.randint(2, 20)})#", 6
+    return f"-({rng.randint(1, 4)}! ^ 0.5)", 6
+
+
+def factorial_power(tokens, seed=0):
+    """
+    Factorials, powers and digit sums, the operators with the most expensive operations.
+    """
+    return _join(_factorial_power_term, (" + ", " @ "), tokens, random.Random(seed))
+
+
+_ERRORS = (("2 + * 3", 4), ("()", 2), ("(4 *)", 4), ("5 ~", 2), ("!3", 2), ("(1 + 2", 4), ("7 8", 2))
+
+
+def errors(tokens, seed=0):
+    """
+    Valid terms with validation errors between them, about one error in every three terms.
+    """
+    def term(rng):
+        if rng.randrange(3):
+            return _realistic_term(rng)
+        return rng.choice(_ERRORS)
+
+    return _join(term, (" + ", " @ "), tokens, random.Random(seed))
+
+
+CORPORA = {
+    "realistic": realistic,
+    "nested": nested,
+    "minus_runs": minus_runs,
+    "factorial_power": factorial_power,
+    "errors": errors
+}
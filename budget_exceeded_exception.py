@@ -0,0 +1,15 @@
+class BudgetExceededException(Exception):
+    """
+    Custom exception for evaluations stopped by their budget: too long, too many tokens or steps, a value too big,
+    past the deadline, or cancelled.
+    """
+    def __init__(self, message, limit):
+        """
+        Initialize the exception with the exceeded limit.
+
+        :param message: The error message to display.
+        :param limit: The name of the exceeded limit, one of evaluation_budget.LIMITS.
+        """
+        self.message = message
+        self.limit = limit
+        super().__init__(message)
@@ -0,0 +1,289 @@
+import mmap
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from evaluation_engine import EvaluationEngine, EvaluationResult
+
+MIN_CHUNK_SIZE = 16
+MAX_CHUNK_SIZE = 8192
+TARGET_CHUNK_SECONDS = 0.05  # Long enough to hide the inter-process overhead, short enough to balance the workers
+
+# The status code of every row of the binary outputs, the position of its error code in the tuple, 0 on success.
+# New error codes go at the end, the codes are stored in files
+STATUS_CODES = ("ok", "invalid_character", "invalid_decimal_point", "invalid_expression", "zero_division",
+                "overflow", "memory", "value_error", "type_error", "empty_expression", "budget_exceeded", "error")
+_STATUSES = {code: status for status, code in enumerate(STATUS_CODES)}
+OUTPUT_FORMATS = ("npy", "bin", "csv")
+WRITE_BUFFER_ROWS = 65536  # The number of rows written to the output files at once
+
+_NPY_HEADER_LENGTH = 128  # The header is rewritten with the row count at the end, at the same length
+
+_worker_engine = None  # Every worker process keeps its own engine and cache
+
+
+def _evaluate_chunk(expressions):
+    """
+    Evaluates a chunk of expressions in a worker process.
+    Only the values and the error codes are sent back, the error messages stay in the worker.
+    :param expressions: The raw expressions
+    :type expressions: list
+    :return: The (value, error code) pairs and the time the chunk took
+    :rtype: tuple
+    """
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = EvaluationEngine()
+    start = time.perf_counter()
+    results = [(result.value, result.error_code) for result in _worker_engine.evaluate_many(expressions)]
+    return results, time.perf_counter() - start
+
+
+def _next_chunk_size(chunk_size, chunk_length, elapsed):
+    """
+    Sizes the next chunk so it takes about TARGET_CHUNK_SECONDS, based on how long the last chunk took.
+    """
+    if elapsed <= 0:
+        return min(chunk_size * 2, MAX_CHUNK_SIZE)
+    size = int(TARGET_CHUNK_SECONDS * chunk_length / elapsed)
+    return max(MIN_CHUNK_SIZE, min(size, chunk_size * 2, MAX_CHUNK_SIZE))
+
+
+def iter_evaluate_bulk(expressions, max_workers=None, chunk_size=None):
+    """
+    Evaluates expressions in a pool of processes and yields the results in the order of the expressions.
+    The expressions are read lazily, only a few chunks per worker are in flight at any time, so any number
+    of expressions can be evaluated in bounded memory. An error in one expression does not stop the others,
+    it is reported by the error code of its result.
+    :param expressions: The raw expressions
+    :type expressions: Iterable[str]
+    :param max_workers: The number of worker processes, the number of CPUs by default
+    :type max_workers: int
+    :param chunk_size: A fixed number of expressions sent to a worker at once, adapted to the expressions'
+        evaluation time by default
+    :type chunk_size: int
+    :return: The results, with the value or the error code of every expression
+    :rtype: Iterator[EvaluationResult]
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    adaptive = chunk_size is None
+    chunk_size = chunk_size or MIN_CHUNK_SIZE
+    expressions = iter(expressions)
+    in_flight = deque()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while len(in_flight) < max_workers * 2:
+                chunk = list(islice(expressions, chunk_size))
+                if not chunk:
+                    break
+                in_flight.append(executor.submit(_evaluate_chunk, chunk))
+            if not in_flight:
+                return
+            results, elapsed = in_flight.popleft().result()
+            if adaptive:
+                chunk_size = _next_chunk_size(chunk_size, len(results), elapsed)
+            for value, error_code in results:
+                yield EvaluationResult(value, None, error_code)
+
+
+def evaluate_bulk(expressions, max_workers=None, chunk_size=None):
+    """
+    Evaluates a list of expressions in a pool of processes.
+    :param expressions: The raw expressions
+    :type expressions: Iterable[str]
+    :param max_workers: The number of worker processes, the number of CPUs by default
+    :type max_workers: int
+    :param chunk_size: A fixed number of expressions sent to a worker at once, adaptive by default
+    :type chunk_size: int
+    :return: The results, in the order of the expressions
+    :rtype: list
+    """
+    return list(iter_evaluate_bulk(expressions, max_workers, chunk_size))
+
+
+def iter_evaluate_file(path, max_workers=None, chunk_size=None):
+    """
+    Evaluates a file with an expression in every line in a pool of processes.
+    :param path: The path of the file
+    :type path: str
+    :param max_workers: The number of worker processes, the number of CPUs by default
+    :type max_workers: int
+    :param chunk_size: A fixed number of expressions sent to a worker at once, adaptive by default
+    :type chunk_size: int
+    :return: The results, in the order of the lines
+    :rtype: Iterator[EvaluationResult]
+    """
+    with open(path, encoding="utf-8") as file:
+        lines = (line.rstrip("\r\n") for line in file)
+        yield from iter_evaluate_bulk(lines, max_workers, chunk_size)
+
+
+def iter_mapped_expressions(path):
+    """
+    Reads the expressions of a file with an expression in every line, through a memory map of the file.
+    Every expression is decoded straight from the mapped pages, there is no line buffer and no copy of the
+    line before it is decoded.
+    :param path: The path of the file, UTF-8
+    :type path: str
+    :return: The expressions, without the line endings
+    :rtype: Iterator[str]
+    """
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return  # An empty file can't be mapped
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                find = mapped.find
+                size = len(mapped)
+                start = 0
+                while start < size:
+                    end = find(b"\n", start)
+                    if end < 0:
+                        end = size
+                    line_end = end - 1 if end > start and view[end - 1] == 13 else end  # Without a "\r"
+                    yield str(view[start:line_end], "utf-8", "replace")
+                    start = end + 1
+            finally:
+                view.release()
+
+
+def status_path(path):
+    """
+    :return: The path of the status column written next to a binary value column, "results.status.npy" for
+        "results.npy"
+    :rtype: str
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.status{extension}"
+
+
+def _npy_header(dtype, rows):
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({rows},), }}"
+    header = header.ljust(_NPY_HEADER_LENGTH - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+
+class _ColumnWriter:
+    """
+    Writes a column of numbers to a raw binary file, or to a .npy file NumPy loads with numpy.load.
+    The .npy header is written first with a zero row count, and rewritten when the file is closed.
+    """
+
+    def __init__(self, path, typecode, dtype, npy):
+        self._file = open(path, "wb")
+        self._typecode = typecode
+        self._dtype = dtype
+        self._npy = npy
+        self.rows = 0
+        if npy:
+            self._file.write(_npy_header(dtype, 0))
+
+    def write(self, column):
+        if sys.byteorder == "big" and column.itemsize > 1:
+            column = array(self._typecode, column)
+            column.byteswap()  # The files are little-endian
+        column.tofile(self._file)
+        self.rows += len(column)
+
+    def close(self):
+        if self._npy:
+            self._file.seek(0)
+            self._file.write(_npy_header(self._dtype, self.rows))
+        self._file.close()
+
+
+def write_results(results, path, output_format="npy"):
+    """
+    Writes the results of a bulk evaluation, without stopping at the rows that failed.
+    The npy and bin formats write two columns: the values as little-endian float64, NaN for the rows that failed,
+    to the path, and the status code of every row as uint8 (see STATUS_CODES) to status_path(path). The npy files
+    load with numpy.load, the bin files with numpy.fromfile or array.fromfile. The csv format writes a
+    "value,status" line for every row, with the status code by name.
+    :param results: The results, in the order of the rows
+    :type results: Iterable[EvaluationResult]
+    :param path: The path of the output file
+    :type path: str
+    :param output_format: "npy", "bin" or "csv"
+    :type output_format: str
+    :return: The number of rows written, and the number of rows that failed
+    :rtype: tuple
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+    rows = failed = 0
+    if output_format == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write("value,status\n")
+            lines = []
+            for result in results:
+                if result.error_code is None:
+                    lines.append(f"{result.value},ok")
+                else:
+                    lines.append(f",{result.error_code}")
+                    failed += 1
+                if len(lines) >= WRITE_BUFFER_ROWS:
+                    file.write("\n".join(lines) + "\n")
+                    rows += len(lines)
+                    lines.clear()
+            if lines:
+                file.write("\n".join(lines) + "\n")
+                rows += len(lines)
+        return rows, failed
+
+    npy = output_format == "npy"
+    values_writer = _ColumnWriter(path, "d", "<f8", npy)
+    statuses_writer = _ColumnWriter(status_path(path), "B", "|u1", npy)
+    values = array("d")
+    statuses = array("B")
+    nan = float("nan")
+    error_status = _STATUSES["error"]
+    try:
+        for result in results:
+            code = result.error_code
+            if code is None:
+                values.append(result.value)
+                statuses.append(0)
+            else:
+                values.append(nan)
+                statuses.append(_STATUSES.get(code, error_status))
+                failed += 1
+            if len(values) >= WRITE_BUFFER_ROWS:
+                values_writer.write(values)
+                statuses_writer.write(statuses)
+                values = array("d")
+                statuses = array("B")
+        values_writer.write(values)
+        statuses_writer.write(statuses)
+    finally:
+        values_writer.close()
+        statuses_writer.close()
+    return values_writer.rows, failed
+
+
+def evaluate_file(input_path, output_path, output_format="npy", max_workers=1):
+    """
+    Evaluates a file with an expression in every line, read through a memory map, and writes the result of every
+    line to the output (see write_results). Nothing is printed.
+    :param input_path: The path of the expressions file
+    :type input_path: str
+    :param output_path: The path of the output file
+    :type output_path: str
+    :param output_format: "npy", "bin" or "csv"
+    :type output_format: str
+    :param max_workers: The number of worker processes, 1 evaluates in this process, None uses every CPU
+    :type max_workers: int
+    :return: The number of rows written, and the number of rows that failed
+    :rtype: tuple
+    """
+    expressions = iter_mapped_expressions(input_path)
+    if max_workers == 1:
+        results = map(EvaluationEngine().evaluate, expressions)
+    else:
+        results = iter_evaluate_bulk(expressions, max_workers)
+    return write_results(results, output_path, output_format)
@@ -1,13 +1,22 @@
+from time import perf_counter
+
 from invalid_character_exception import InvalidCharacterException
 from invalid_decimal_point_exception import InvalidDecimalPointException
 from invalid_expression_exception import InvalidExpressionException
+from budget_exceeded_exception import BudgetExceededException
 from operators import Operator
 import preprocessor_utils
 import tokenization_utils
+import lexer_utils
 import validation_utils
 import postfix_evaluation_utils
 import history_utils
+from history_store import HistoryStore
 from colors import Colors
+from expression_cache import ExpressionCache
+from diagnostics import DiagnosticReport
+from error_codes import error_code, EMPTY_EXPRESSION
+import instrumentation
 
 
 class Calculator:
@@ -19,10 +28,21 @@ class Calculator:
             _expression (str or list): The mathematical expression to evaluate, initially in string form and
                 tokenized as a list during processing.
             _postfix_expression (list): The expression converted into postfix notation for evaluation.
-            history (list): The 5 most recent expressions calculated.
+            _fail_fast (bool): Stop the validation at the first error, for callers that only need to know
+                whether the expression is valid.
+            expression_history (HistoryStore): The most recent expressions calculated and their results, shared by
+                all the instances, 5 by default and optionally logged to disk (see history_store).
+            expression_cache (ExpressionCache): An LRU cache of compiled expressions shared by all the instances,
+                repeated expressions skip straight to the evaluation step.
+            collector (HistogramCollector): Receives the metrics of every calculation (see instrumentation),
+                None to disable the instrumentation. Any object with a record(metrics) method can be used.
+            _metrics (ExpressionMetrics): The metrics of the calculation running with a collector, None otherwise.
+            budget (EvaluationBudget): The limits of every calculation (see evaluation_budget), checked while the
+                expression is lexed and evaluated, None for no limits.
+            _meter (BudgetMeter): The budget spent by the running calculation, None without a budget.
 
         Methods:
-            __init__(expression):
+            __init__(expression, fail_fast):
                 Initializes the Calculator instance with a mathematical expression.
 
             preprocessor():
@@ -37,6 +57,10 @@ class Calculator:
                 - Ensures valid placement of decimal points.
                 - Handles negative numbers.
 
+            lexing():
+                Runs the preprocessing and tokenization steps in a single pass over the expression.
+                - Falls back to the separate steps to report errors.
+
             validation():
                 Validates the tokenized expression against predefined rules:
                 - Ensures parentheses are balanced and used correctly.
@@ -55,16 +79,26 @@ class Calculator:
                 - Performs error handling for division by zero.
                 - Validates factorials and hashtags (custom operators) for valid input.
 
+            compile():
+                Runs the steps up to the conversion, or takes the compiled expression from the cache.
+
             calculate():
                 The main calculation method that combines all the steps:
                 - Preprocessing, tokenization, validation, conversion, and evaluation.
                 - Handles exceptions such as invalid expressions, division by zero, and overflow errors.
+                - Reports the metrics of the calculation to the collector, if there is one.
         """
-    expression_history = []
+    expression_history = HistoryStore()
+    expression_cache = ExpressionCache()
+    collector = None
+    budget = None
 
-    def __init__(self, expression):
+    def __init__(self, expression, fail_fast=False):
         self._expression = expression
         self._postfix_expression = None
+        self._fail_fast = fail_fast
+        self._metrics = None
+        self._meter = None
 
     def preprocessor(self):
         """
@@ -92,6 +126,7 @@ class Calculator:
             else:
                 self._expression = expression
         except InvalidCharacterException as e:
+            Calculator._record_error(self, e)
             valid_operators_list = list(Operator.get_operators_keys())
             valid_operators_list.remove('u')  # mark for unary minus, should not be inserted by user
             print(
@@ -115,47 +150,36 @@ class Calculator:
             validated_expression = tokenization_utils.decimal_point_check(self._expression)
 
             # Tokenization process
-            token_list = []
-            current_token = ""
-            processed_expression = validated_expression
-
-            for index, char in enumerate(processed_expression):
-                next_char = processed_expression[index + 1] if index + 1 < len(processed_expression) else None
-
-                if char.isdecimal():
-                    current_token += char
-                    if not (next_char and (next_char.isdecimal() or next_char == ".")):
-                        number = float(current_token)
-                        if number.is_integer():
-                            token_list.append(int(current_token))
-                        else:
-                            token_list.append(number)  # Add a float token
-                        current_token = ""  # Reset for next token
-                elif char == ".":
-                    current_token += char
-                    if next_char:
-                        if not next_char.isdecimal():
-                            token_list.append(float(current_token))
-                            current_token = ""
-                elif char == "s":  # Handle sign minus
-                    current_token += "-"
-                else:
-                    current_token += char
-                    token_list.append(current_token)
-                    current_token = ""  # Add operator or special character
-
-            # Add any remaining token at the end
-            if current_token:
-                token_list.append(float(current_token))
-            self._expression = token_list
+            self._expression = tokenization_utils.tokenize(validated_expression)
         except InvalidDecimalPointException as e:
+            Calculator._record_error(self, e)
             print(f"{e} \n{Colors.GREEN}Valid Placement of Decimal Point: {Colors.ENDC}(0).123, 1.23, 123.(0)")
             self._expression = None  # Expression is not valid
 
+    def lexing(self):
+        """
+        Preprocesses and tokenizes the expression in a single pass, producing the same token list as
+        running preprocessor() and then tokenization().
+        If the expression has errors, the separate steps are run to report them.
+        """
+        token_list = lexer_utils.scan(self._expression, meter=self._meter)
+        if token_list is None:
+            Calculator._timed(self, "preprocessor", Calculator.preprocessor)
+            if self._expression is not None:
+                Calculator._timed(self, "tokenization", Calculator.tokenization)
+        elif not token_list:
+            # Empty expression
+            self._expression = None
+            print(f"\n{Colors.WARNING}\033[1mEmpty Expression.{Colors.ENDC}")
+        else:
+            self._expression = token_list
+
     def validation(self):
         """
         A validation step to catch errors that don't follow the rules that should be in every valid expression.
         The validation step highlights the errors and presents them to the user if needed.
+        All the checks are done in a single walk over the tokens, see validation_utils.validate, and the errors
+        are kept as diagnostics that are rendered only when the exception message is used.
 
         The steps in the validation process:
         1. Check for balanced parentheses
@@ -165,92 +189,20 @@ class Calculator:
         5. Check for stand-alone unary operators
         6. Check for missing operators between operands
 
-        :return: The error message showing the user every error highlighted in red
-        :rtype: str
+        :raises InvalidExpressionException: with the diagnostics of every failed check.
         """
-        error_message = ""
-
-        # 1. Check for balanced parentheses
-        check_passed, error_expression = validation_utils.parentheses_check(self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"Parentheses are not balanced.")
-
-        # 2. Check for empty parentheses
-        check_passed, error_expression = validation_utils.empty_parentheses_check(self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"Empty parentheses are not allowed.")
-
-        # 3. Check binary operator placement
-        check_passed, error_expression = validation_utils.binary_operators_between_valid_operands_check(
-            self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"Binary operators should be between two operands or expressions.")
-
-        # 4. Check negation operator placement
-        check_passed, error_expression = validation_utils.negation_operator_next_to_number_check(self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"Negation operator (~) should only be next to a number.")
-
-        # 5. Check for stand-alone unary operators
-        check_passed, error_expression = validation_utils.stand_alone_unary_operators_check(self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"Unary operators cannot be stand-alone.")
-
-        # 6. Check for missing operators between operands
-        check_passed, error_expression = validation_utils.missing_operator_check(self._expression)
-        if not check_passed:
-            error_message += (f"\n\n{error_expression}\n{Colors.FAIL}Invalid Expression: {Colors.ENDC}"
-                              f"There are some missing operators.")
-        if error_message:
+        # All the checks run in a single walk, the errors are rendered only when the message is printed
+        diagnostics = validation_utils.diagnose(self._expression, self._fail_fast)
+        if diagnostics:
             self._expression = None
-            raise InvalidExpressionException(f"\n{error_message}")
+            raise InvalidExpressionException(DiagnosticReport(diagnostics))
 
     def infix_to_postfix(self):
         """
         Converts an infix expression to postfix notation while preserving token indexes to present them
         in an error message later if needed in a convenient way.
         """
-        token_list = self._expression
-        output = []
-        operator_stack = []
-
-        for index, token in enumerate(token_list):
-            if isinstance(token, float) or isinstance(token, int):  # Numbers go directly to the output
-                output.append((token, index))
-            elif token == "(":
-                operator_stack.append((token, index))
-            elif token == ")":
-                # Pop until matching opening parenthesis
-                while operator_stack and operator_stack[-1][0] != "(":
-                    output.append(operator_stack.pop())
-                operator_stack.pop()  # Remove the opening parenthesis
-
-                # Check if a sign minus ("s") is in the stack
-                if operator_stack and operator_stack[-1][0] == "s":
-                    output.append(operator_stack.pop())
-            elif token == "-(":
-                # Treat "-(" as a signal for sign minus
-                operator_stack.append(("s", index))
-                operator_stack.append(("(", index))
-            elif Operator.is_valid_operator(token):
-                # Handle valid operators based on priority and position
-                while (operator_stack and operator_stack[-1][0] != "(" and
-                       (Operator.get_priority(operator_stack[-1][0]) > Operator.get_priority(token) or
-                        (Operator.get_priority(operator_stack[-1][0]) == Operator.get_priority(token) and
-                         Operator.get_position(token) != "right"))):
-                    output.append(operator_stack.pop())
-                operator_stack.append((token, index))
-
-        # Pop all remaining operators in the stack
-        while operator_stack:
-            output.append(operator_stack.pop())
-
-        self._postfix_expression = output
+        self._postfix_expression = postfix_evaluation_utils.infix_to_postfix(self._expression)
 
     def evaluate_postfix(self):
         """
@@ -260,102 +212,147 @@ class Calculator:
         :raises ValueError: If the postfix expression is invalid or contains runtime errors.
         :raises ZeroDivisionError: when a division by zero occurs.
         """
-        stack = []
-
-        for token, index in self._postfix_expression:
-            if isinstance(token, float) or isinstance(token, int):  # Operands
-                stack.append((token, index))
-            elif Operator.is_valid_operator(token):  # Operators
-                operator_type = Operator.get_type(token)
-                operation = Operator.get_operation(token)
-
-                if operator_type == "binary":
-                    # Binary operator requires two operands
-                    try:
-                        right_operand, right_index = stack.pop()
-                        left_operand, left_index = stack.pop()
-                    except IndexError:  # Incase the checks somehow don't catch it before
-                        raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
-
-                    # Division by zero check
-                    if token == "/" and right_operand == 0:
-                        highlighted_expression = postfix_evaluation_utils.highlight_infix_error(
-                            self._expression, (right_index - 1, right_index)).replace("u", "-")  # highlights the "/0"
-                        raise ZeroDivisionError(f"\n{highlighted_expression}\n{Colors.FAIL}Zero Division Error: "
-                                                f"{Colors.ENDC}Division by zero is not allowed.")
-
-                    # Perform the operation
-                    result = operation(left_operand, right_operand)
-                    combined_index = (left_index, right_index)
-                    stack.append((result, combined_index))
-
-                elif operator_type == "unary":
-                    # Unary operator requires one operand
-                    try:
-                        operand, operand_index = stack.pop()
-                    except IndexError:  # Incase the checks somehow don't catch it before
-                        raise ValueError("Invalid postfix expression: insufficient operand for unary operator.")
-
-                    if token == "!" and (operand < 0 or not (operand == int(operand)) or operand > 170):
-                        highlighted_expression = postfix_evaluation_utils.highlight_infix_error(
-                            self._expression, (operand_index, operand_index + 1)).replace("u", "-")
-                        # highlights the "{operand}!"
-                        raise ValueError(
-                            f"\n{highlighted_expression}\n{Colors.FAIL}Value Error: {Colors.ENDC}"
-                            f"Factorial is only defined for non-negative integers up to 170.")
-
-                    if token == "#" and operand < 0:
-                        highlighted_expression = postfix_evaluation_utils.highlight_infix_error(
-                            self._expression, (operand_index, operand_index + 1)).replace("u", "-")
-                        # highlights the "{operand}#"
-                        raise ValueError(
-                            f"\n{highlighted_expression}\n{Colors.FAIL}Value Error: {Colors.ENDC}"
-                            f"Hashtag is only defined for non-negative numbers")
-
-                    # Perform the operation
-                    result = operation(operand)
-                    stack.append((result, operand_index))
-
-        # Final validation
-        if len(stack) != 1:
-            # Incase the checks somehow don't catch it before
-            raise ValueError("Invalid postfix expression: too many operands or insufficient operators.")
-
-        return stack[0][0]  # Return only the result
+        return postfix_evaluation_utils.evaluate_postfix(self._postfix_expression, self._expression, meter=self._meter)
+
+    def compile(self):
+        """
+        Runs the lexing, validation and conversion steps. Expressions that were already
+        compiled are taken from the cache, and expressions that already failed the validation raise a new
+        exception with the cached message without being re-validated.
+
+        :raises InvalidExpressionException: if the validation step fails.
+        :raises BudgetExceededException: if the expression is longer than the budget allows.
+        """
+        if self._meter is not None:
+            self._meter.check_input(self._expression)
+        key = Calculator.expression_cache.canonicalize(self._expression)
+        if key:
+            cached = Calculator.expression_cache.get(key)
+            if cached is not None:
+                if self._meter is not None:
+                    # The expression may have been cached before the budget was set, the lexer didn't count it
+                    self._meter.check_tokens(len(cached[0]))
+                self._expression, self._postfix_expression = cached
+                return
+            failure = Calculator.expression_cache.get_failure(key)
+            if failure is not None:
+                self._expression = None
+                # A new exception every time, raising the cached one again would grow its traceback on every hit
+                raise InvalidExpressionException(failure.message)
+
+        Calculator._timed(self, "lexing", Calculator.lexing)
+        if self._expression is not None:
+            try:
+                Calculator._timed(self, "validation", Calculator.validation)
+            except InvalidExpressionException as e:
+                if key and not self._fail_fast:  # A fail-fast report only has the first error
+                    Calculator.expression_cache.put_failure(key, e)
+                raise
+        if self._expression is not None:
+            Calculator._timed(self, "infix_to_postfix", Calculator.infix_to_postfix)
+            if key:
+                Calculator.expression_cache.put(key, self._expression, self._postfix_expression)
 
     def calculate(self):
         """
         The final step the calculates the expression if all the steps before were completed.
         """
+        if Calculator.collector is not None and self._metrics is None:
+            return Calculator._instrumented_calculate(self, Calculator.collector)
+        if Calculator.budget is not None:
+            self._meter = Calculator.budget.start()
         try:
-            Calculator.preprocessor(self)
-            if self._expression is not None:
-                Calculator.tokenization(self)
-            if self._expression is not None:
-                Calculator.validation(self)
-            if self._expression is not None:
-                Calculator.infix_to_postfix(self)
+            Calculator.compile(self)
             if self._expression is not None:
-                result = float(Calculator.evaluate_postfix(self))
-                if result.is_integer():
-                    result = int(result)
+                result = postfix_evaluation_utils.normalize_result(
+                    Calculator._timed(self, "evaluate_postfix", Calculator.evaluate_postfix))
                 print(f"{Colors.GREEN}Result:{Colors.ENDC} {result}")
                 # Add to history only if calculation is successful
                 expression_str = " ".join(map(str, self._expression))
                 history_utils.add_to_history(Calculator.expression_history, expression_str, result)
                 return result
         except InvalidExpressionException as e:
+            Calculator._record_error(self, e)
             print(f"{e}")
+        except BudgetExceededException as e:
+            Calculator._record_error(self, e)
+            print(f"\n{Colors.WARNING}{e}{Colors.ENDC}")
         except ValueError as e:
+            Calculator._record_error(self, e)
             print(f"{e}")
         except ZeroDivisionError as e:
+            Calculator._record_error(self, e)
             print(f"{e}")
         except TypeError as e:
             # If something in the checks goes terrible
+            Calculator._record_error(self, e)
             print(f"{e}")
-        except OverflowError:
+        except OverflowError as e:
+            Calculator._record_error(self, e)
             print(f"\n{Colors.WARNING}Calculation is too big for the calculator to handle!{Colors.ENDC}")
-        except MemoryError:
+        except MemoryError as e:
             # Just for safety :)
+            Calculator._record_error(self, e)
             print(
                 f"\n{Colors.WARNING}Calculation exceeds available memory. Please simplify your expression.{Colors.ENDC}")
+
+    def _timed(self, stage, step):
+        """
+        Runs a step, and measures its wall time when the calculation is instrumented.
+        :param stage: The name the time is recorded under
+        :type stage: str
+        :param step: The step, a Calculator method
+        :return: What the step returns
+        """
+        metrics = self._metrics
+        if metrics is None:
+            return step(self)
+        start = perf_counter()
+        try:
+            return step(self)
+        finally:
+            metrics.stage_seconds[stage] = perf_counter() - start
+
+    def _record_error(self, error):
+        """
+        Records the category of the error a calculation ended with, when the calculation is instrumented.
+        :param error: The error
+        :type error: Exception
+        """
+        metrics = self._metrics
+        if metrics is not None:
+            metrics.error = error_code(error)
+            diagnostics = getattr(error, "diagnostics", None)
+            if diagnostics:
+                metrics.failed_checks = tuple(diagnostic.message_id for diagnostic in diagnostics)
+                metrics.token_list = diagnostics[0].tokens
+
+    def _instrumented_calculate(self, collector):
+        """
+        Runs calculate() with its stages timed, and reports the metrics to the collector. The token count and
+        the stack high-water marks are computed after the calculation, so the steps themselves are not slowed.
+        :param collector: The collector the metrics are reported to
+        :type collector: HistogramCollector
+        :return: The result of calculate()
+        """
+        metrics = self._metrics = instrumentation.ExpressionMetrics()
+        cache_hits = Calculator.expression_cache.hits
+        start = perf_counter()
+        try:
+            result = Calculator.calculate(self)
+        finally:
+            metrics.total_seconds = perf_counter() - start
+            self._metrics = None
+        metrics.cache_hit = Calculator.expression_cache.hits != cache_hits
+        if result is None and metrics.error is None:
+            metrics.error = EMPTY_EXPRESSION
+
+        token_list = self._expression if self._expression.__class__ is list else metrics.token_list
+        if token_list is not None:
+            metrics.token_count = len(token_list)
+            if self._postfix_expression is not None and self._expression is token_list:
+                metrics.operator_stack_peak = instrumentation.operator_stack_peak(token_list)
+                metrics.operand_stack_peak = instrumentation.operand_stack_peak(self._postfix_expression)
+        metrics.token_list = None
+        collector.record(metrics)
+        return result
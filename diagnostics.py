@@ -0,0 +1,165 @@
+from colors import Colors
+import postfix_evaluation_utils
+
+# The number of tokens shown on each side of an error when a message is rendered
+DEFAULT_WINDOW = 40
+
+# The title and the text of every message id
+MESSAGES = {
+    "unbalanced_parentheses": ("Invalid Expression", "Parentheses are not balanced."),
+    "empty_parentheses": ("Invalid Expression", "Empty parentheses are not allowed."),
+    "misplaced_binary_operator": ("Invalid Expression",
+                                  "Binary operators should be between two operands or expressions."),
+    "misplaced_negation_operator": ("Invalid Expression", "Negation operator (~) should only be next to a number."),
+    "stand_alone_unary_operator": ("Invalid Expression", "Unary operators cannot be stand-alone."),
+    "missing_operator": ("Invalid Expression", "There are some missing operators."),
+    "zero_division": ("Zero Division Error", "Division by zero is not allowed."),
+    "factorial_domain": ("Value Error", "Factorial is only defined for non-negative integers up to 170."),
+    "exact_factorial_domain": ("Value Error", "Factorial is only defined for non-negative integers."),
+    "hashtag_domain": ("Value Error", "Hashtag is only defined for non-negative numbers"),
+    "unbound_variable": ("Value Error", "Variables must be given a value.")
+}
+
+
+def _highlight(text):
+    return f"{Colors.BOLD}{Colors.FAIL}{text}{Colors.ENDC}"
+
+
+def index_span(index):
+    """
+    Flattens the index of an evaluated operand into the span of tokens it was calculated from.
+    :param index: A token index, or a nested tuple of the token indexes of a combined operand
+    :type index: int or tuple
+    :return: The first and the last token indexes
+    :rtype: tuple
+    """
+    first = last = index
+    while isinstance(first, tuple):
+        first = first[0]
+    while isinstance(last, tuple):
+        last = last[-1]
+    return first, last
+
+
+class Diagnostic:
+    """
+    A structured error found in an expression. Holds only the error kind, the token spans and a message id,
+    the colored message is rendered on demand when the diagnostic is converted to a string.
+
+    Attributes:
+        kind (str): The kind of the error, "validation" or "evaluation".
+        message_id (str): The id of the message in MESSAGES.
+        spans (list): The (first, last) token indexes of every error of this kind.
+        tokens (list): The token list of the expression, used to render the message.
+
+    Methods:
+        render(window):
+            Renders the highlighted expression around the first error.
+    """
+    __slots__ = ("kind", "message_id", "spans", "tokens")
+
+    def __init__(self, kind, message_id, spans, tokens):
+        self.kind = kind
+        self.message_id = message_id
+        self.spans = spans
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"Diagnostic({self.kind!r}, {self.message_id!r}, {self.spans!r})"
+
+    def __str__(self):
+        title, text = MESSAGES[self.message_id]
+        return f"\n{self.render()}\n{Colors.FAIL}{title}: {Colors.ENDC}{text}"
+
+    def render(self, window=DEFAULT_WINDOW):
+        """
+        Renders the expression with the errors highlighted. Only the tokens within the window around the first
+        error are rendered, so the message stays small for huge expressions.
+        :param window: The number of tokens shown on each side of the first error, None to render everything
+        :type window: int or None
+        :return: The highlighted expression
+        :rtype: str
+        """
+        tokens = self.tokens
+        start, end = 0, len(tokens)
+        if window is not None:
+            first, last = self.spans[0]
+            start, end = max(0, first - window), min(len(tokens), last + window + 1)
+        shown_tokens = tokens[start:end]
+        if self.message_id != "misplaced_negation_operator":
+            shown_tokens = ["-" if token == "u" else token for token in shown_tokens]  # Unary minuses as minuses
+        spans = [(first - start, last - start) for first, last in self.spans]
+        rendered = _RENDERERS[self.message_id](shown_tokens, spans)
+        return ("..." if start else "") + rendered + ("..." if end < len(tokens) else "")
+
+
+class DiagnosticReport:
+    """
+    The diagnostics of an expression that failed the validation, rendered together on demand.
+
+    Attributes:
+        diagnostics (list): The diagnostics, in the check order.
+    """
+    __slots__ = ("diagnostics",)
+
+    def __init__(self, diagnostics):
+        self.diagnostics = diagnostics
+
+    def __str__(self):
+        return "\n" + "".join(f"\n{diagnostic}" for diagnostic in self.diagnostics)
+
+
+def _render_tokens(tokens, spans, highlight_token):
+    first_indexes = {first for first, _ in spans}
+    rendered = []
+    index = 0
+    while index < len(tokens):
+        if index in first_indexes:
+            text, index = highlight_token(tokens, index)
+            rendered.append(text)
+        else:
+            rendered.append(str(tokens[index]))
+            index += 1
+    return "".join(rendered)
+
+
+def _render_parentheses(tokens, spans):
+    def highlight(tokens, index):
+        if tokens[index] == "-(":
+            return "-" + _highlight("("), index + 1
+        return _highlight(tokens[index]), index + 1
+    return _render_tokens(tokens, spans, highlight)
+
+
+def _render_empty_parentheses(tokens, spans):
+    def highlight(tokens, index):
+        return ("-" if tokens[index] == "-(" else "") + _highlight("()"), index + 2
+    return _render_tokens(tokens, spans, highlight)
+
+
+def _render_operators(tokens, spans):
+    return _render_tokens(tokens, spans, lambda tokens, index: (_highlight(tokens[index]), index + 1))
+
+
+def _render_missing_operators(tokens, spans):
+    return _render_tokens(tokens, spans,
+                          lambda tokens, index: (f"{tokens[index]}{_highlight('|?|')}", index + 1))
+
+
+def _render_range(tokens, spans):
+    return postfix_evaluation_utils.highlight_infix_error(tokens, spans[0])
+
+
+_RENDERERS = {
+    "unbalanced_parentheses": _render_parentheses,
+    "empty_parentheses": _render_empty_parentheses,
+    "misplaced_binary_operator": _render_operators,
+    "misplaced_negation_operator": _render_operators,
+    "stand_alone_unary_operator": _render_operators,
+    "missing_operator": _render_missing_operators,
+    "zero_division": _render_range,
+    "factorial_domain": _render_range,
+    "exact_factorial_domain": _render_range,
+    "hashtag_domain": _render_range,
+    "unbound_variable": _render_range
+}
@@ -0,0 +1,38 @@
+import decimal
+
+from invalid_character_exception import InvalidCharacterException
+from invalid_decimal_point_exception import InvalidDecimalPointException
+from invalid_expression_exception import InvalidExpressionException
+from budget_exceeded_exception import BudgetExceededException
+
+# The error code of every error an evaluation can end with, checked in order
+ERROR_CODES = (
+    (BudgetExceededException, "budget_exceeded"),
+    (InvalidCharacterException, "invalid_character"),
+    (InvalidDecimalPointException, "invalid_decimal_point"),
+    (InvalidExpressionException, "invalid_expression"),
+    (ZeroDivisionError, "zero_division"),
+    (OverflowError, "overflow"),
+    (decimal.Overflow, "overflow"),
+    (MemoryError, "memory"),
+    (ValueError, "value_error"),
+    (decimal.InvalidOperation, "value_error"),
+    (TypeError, "type_error")
+)
+EMPTY_EXPRESSION = "empty_expression"
+# The errors an evaluation reports with an error code instead of raising them
+HANDLED_ERRORS = tuple(error_type for error_type, _ in ERROR_CODES)
+
+
+def error_code(error):
+    """
+    Retrieve the error code of an exception raised by an evaluation.
+    :param error: The raised exception
+    :type error: Exception
+    :return: The error code
+    :rtype: str
+    """
+    for error_type, code in ERROR_CODES:
+        if isinstance(error, error_type):
+            return code
+    return "error"
@@ -0,0 +1,229 @@
+import math
+import threading
+from decimal import Decimal
+from fractions import Fraction
+from time import monotonic
+
+from budget_exceeded_exception import BudgetExceededException
+
+# The limits a budget can set, the limit attribute of BudgetExceededException
+INPUT_LENGTH = "input_length"
+TOKENS = "tokens"
+STEPS = "steps"
+BITS = "bits"
+DEADLINE = "deadline"
+CANCELLED = "cancelled"
+LIMITS = (INPUT_LENGTH, TOKENS, STEPS, BITS, DEADLINE, CANCELLED)
+
+# The deadline and the cancel token are checked once every this many tokens or operator steps,
+# reading the clock on every step would slow the loops down
+CHECK_INTERVAL = 64
+
+_LOG2_10 = math.log2(10)
+
+
+def bit_length(value):
+    """
+    Estimates the size of a number, like int.bit_length() does for integers.
+    :param value: The number
+    :type value: int, float, Fraction or Decimal
+    :return: The number of bits of the integer part of the number, of the largest of the numerator and the
+        denominator of a fraction, 0 for the numbers that aren't finite
+    :rtype: int
+    """
+    value_class = value.__class__
+    if value_class is int:
+        return value.bit_length()
+    if value_class is float:
+        return math.frexp(value)[1] if math.isfinite(value) else 0
+    if value_class is Fraction:
+        return max(value.numerator.bit_length(), value.denominator.bit_length())
+    if value_class is Decimal:
+        return max(0, int((value.adjusted() + 1) * _LOG2_10)) if value.is_finite() else 0
+    return 0
+
+
+class CancelToken:
+    """
+    Lets another thread stop an evaluation in progress. The evaluation checks the token between its steps, and
+    raises BudgetExceededException when it is cancelled. A token can be shared by many evaluations.
+
+    Attributes:
+        _event (threading.Event): Set when the token is cancelled.
+
+    Methods:
+        cancel():
+            Asks the evaluations using the token to stop.
+    """
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class EvaluationBudget:
+    """
+    The limits of a single evaluation, None for no limit. The limits are checked cooperatively, inside the
+    tokenization and the evaluation loops, so an evaluation is stopped early instead of running into an
+    OverflowError or a MemoryError after the fact.
+
+    The bits limit is checked before the powers and the factorials, from the size of their operands, so a power
+    that would produce a huge number is never calculated. A single operation still runs to its end: the deadline
+    and the cancel token are checked between the operations.
+
+    Attributes:
+        max_input_length (int): The longest expression, in characters.
+        max_tokens (int): The largest number of tokens.
+        max_steps (int): The largest number of operators evaluated.
+        max_bits (int): The largest size of an intermediate value, see bit_length().
+        timeout (float): The seconds an evaluation may take, from the moment it starts.
+
+    Methods:
+        start(cancel_token):
+            Starts the metering of an evaluation.
+    """
+    __slots__ = ("max_input_length", "max_tokens", "max_steps", "max_bits", "timeout")
+
+    def __init__(self, max_input_length=None, max_tokens=None, max_steps=None, max_bits=None, timeout=None):
+        """
+        :param max_input_length: The longest expression, in characters
+        :type max_input_length: int
+        :param max_tokens: The largest number of tokens
+        :type max_tokens: int
+        :param max_steps: The largest number of operators evaluated
+        :type max_steps: int
+        :param max_bits: The largest size of an intermediate value in bits
+        :type max_bits: int
+        :param timeout: The seconds an evaluation may take
+        :type timeout: float
+        """
+        self.max_input_length = max_input_length
+        self.max_tokens = max_tokens
+        self.max_steps = max_steps
+        self.max_bits = max_bits
+        self.timeout = timeout
+
+    def start(self, cancel_token=None):
+        """
+        :param cancel_token: A token another thread can cancel the evaluation with
+        :type cancel_token: CancelToken
+        :return: The meter of an evaluation starting now
+        :rtype: BudgetMeter
+        """
+        return BudgetMeter(self, cancel_token)
+
+
+class BudgetMeter:
+    """
+    Counts what a single evaluation spends of its budget, and stops it when a limit is exceeded.
+
+    Attributes:
+        budget (EvaluationBudget): The limits.
+        cancel_token (CancelToken): The token the evaluation can be cancelled with, None if it can't.
+        deadline (float): The monotonic time the evaluation must end by, None for no deadline.
+        steps (int): The number of operators evaluated.
+        _countdown (int): The steps left before the next check of the deadline and the cancel token.
+
+    Methods:
+        check_input(expression):
+            Checks the length of the expression.
+
+        check_tokens(count):
+            Checks the number of tokens, called by the tokenization loop.
+
+        step(token, left_operand, right_operand):
+            Checks an operator before it is evaluated, called by the evaluation loop.
+
+        check_value(value):
+            Checks the size of an intermediate value.
+
+        check_time():
+            Checks the deadline and the cancel token.
+    """
+    __slots__ = ("budget", "cancel_token", "deadline", "steps", "_countdown")
+
+    def __init__(self, budget, cancel_token=None):
+        self.budget = budget
+        self.cancel_token = cancel_token
+        self.deadline = None if budget.timeout is None else monotonic() + budget.timeout
+        self.steps = 0
+        self._countdown = CHECK_INTERVAL
+
+    def check_input(self, expression):
+        """
+        :raises BudgetExceededException: if the expression is too long, or the evaluation was already cancelled.
+        """
+        limit = self.budget.max_input_length
+        if limit is not None and len(expression) > limit:
+            raise BudgetExceededException(
+                f"The expression is too long ({len(expression)} characters, at most {limit}).", INPUT_LENGTH)
+        self.check_time()
+
+    def check_tokens(self, count):
+        """
+        :param count: The number of tokens so far
+        :type count: int
+        :raises BudgetExceededException: if there are too many tokens, the deadline passed or the evaluation was
+            cancelled.
+        """
+        limit = self.budget.max_tokens
+        if limit is not None and count > limit:
+            raise BudgetExceededException(f"The expression has too many tokens (at most {limit}).", TOKENS)
+        self._countdown -= 1
+        if not self._countdown:
+            self.check_time()
+
+    def step(self, token, left_operand, right_operand=None):
+        """
+        Counts an operator, and checks that its result won't be too big.
+        :param token: The operator
+        :type token: str
+        :param left_operand: The left operand, the only operand of a unary operator
+        :param right_operand: The right operand of a binary operator
+        :raises BudgetExceededException: if there are too many steps, the result would be too big, the deadline
+            passed or the evaluation was cancelled.
+        """
+        budget = self.budget
+        self.steps += 1
+        if budget.max_steps is not None and self.steps > budget.max_steps:
+            raise BudgetExceededException(f"The evaluation takes too many steps (at most {budget.max_steps}).", STEPS)
+        self._countdown -= 1
+        if not self._countdown:
+            self.check_time()
+        max_bits = budget.max_bits
+        if max_bits is None:
+            return
+        if token == "^":
+            # At least this big, a result within the limit is never refused, check_value() catches the rest
+            base_bits = bit_length(left_operand) - 1
+            if base_bits > 0 and base_bits * abs(right_operand) > max_bits:
+                raise BudgetExceededException(f"The power would be bigger than {max_bits} bits.", BITS)
+        elif token == "!" and left_operand > 1:
+            if bit_length(left_operand) > 64 or math.lgamma(float(left_operand) + 1) / math.log(2) > max_bits:
+                raise BudgetExceededException(f"The factorial would be bigger than {max_bits} bits.", BITS)
+
+    def check_value(self, value):
+        """
+        :raises BudgetExceededException: if the value is too big.
+        """
+        max_bits = self.budget.max_bits
+        if max_bits is not None and bit_length(value) > max_bits:
+            raise BudgetExceededException(f"An intermediate value is bigger than {max_bits} bits.", BITS)
+
+    def check_time(self):
+        """
+        :raises BudgetExceededException: if the deadline passed or the evaluation was cancelled.
+        """
+        self._countdown = CHECK_INTERVAL
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise BudgetExceededException("The evaluation was cancelled.", CANCELLED)
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise BudgetExceededException(
+                f"The evaluation took longer than {self.budget.timeout} seconds.", DEADLINE)
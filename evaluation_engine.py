@@ -0,0 +1,277 @@
+import decimal
+from array import array
+from functools import partial
+
+from invalid_expression_exception import InvalidExpressionException
+from evaluation_budget import EvaluationBudget
+from diagnostics import DiagnosticReport
+from error_codes import EMPTY_EXPRESSION, HANDLED_ERRORS, error_code
+from expression_cache import ExpressionCache
+from exact_arithmetic import ExactArithmetic, DEFAULT_PRECISION
+from expression_dag import build_dag
+from postfix_compiler import compile_postfix
+import token_stream
+import lexer_utils
+import validation_utils
+import postfix_evaluation_utils
+import postfix_optimization_utils
+
+# Float expressions at least this long are compiled into a compact token stream (see token_stream), shorter ones
+# are faster to handle as token lists
+TOKEN_STREAM_MIN_LENGTH = 4096
+# The budget of the evaluations with a cancel token and no budget
+_NO_LIMITS = EvaluationBudget()
+
+
+class EvaluationResult:
+    """
+    The outcome of evaluating one expression: either a value or an error.
+
+    Attributes:
+        value (int, float, Fraction or Decimal): The result, None if the evaluation failed.
+        error (Exception): The exception the evaluation failed with, None if it succeeded or the expression is empty.
+            Its message is rendered only when it is converted to a string.
+        error_code (str): A short code of the error (see error_codes.ERROR_CODES), None if the evaluation succeeded.
+    """
+    __slots__ = ("value", "error", "error_code")
+
+    def __init__(self, value, error=None, code=None):
+        self.value = value
+        self.error = error
+        self.error_code = code
+
+    @property
+    def ok(self):
+        return self.error_code is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"EvaluationResult({self.value!r})"
+        return f"EvaluationResult(error_code={self.error_code!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, EvaluationResult):
+            return NotImplemented
+        return self.value == other.value and self.error_code == other.error_code
+
+
+class EvaluationEngine:
+    """
+    A reusable evaluator running the same pipeline as Calculator.calculate, without printing anything and without
+    touching the calculator history. One engine can evaluate any number of expressions, the compiled expressions
+    are kept in its own LRU cache.
+
+    Attributes:
+        _cache (ExpressionCache): The compiled expressions and the expressions that failed the validation.
+        _fail_fast (bool): Stop the validation at the first error.
+        _allow_variables (bool): Accept variable names as operands, their values are given to evaluate().
+        _arithmetic (ExactArithmetic): The operations of the exact mode, None for float arithmetic.
+        _eliminate_common_subexpressions (bool): Compile the expressions into DAGs that evaluate every repeated
+            subexpression once (see expression_dag).
+        _code_generation (bool): Compile the expressions into Python functions (see postfix_compiler), takes
+            precedence over the elimination of common subexpressions.
+        _budget (EvaluationBudget): The limits of every evaluation (see evaluation_budget), None for no limits.
+
+    Methods:
+        compile(expression):
+            Runs the lexing, validation and conversion steps, or takes them from the cache.
+
+        evaluate(expression, variables, cancel_token):
+            Evaluates a single expression and returns its result or error.
+
+        evaluate_compiled(compiled, variables, meter):
+            Evaluates an expression returned by compile().
+
+        evaluate_many(expressions, cancel_token):
+            Evaluates a batch of expressions.
+
+        cache_stats():
+            Returns the cache counters.
+    """
+    __slots__ = ("_cache", "_fail_fast", "_allow_variables", "_arithmetic", "_eliminate_common_subexpressions",
+                 "_code_generation", "_budget")
+
+    def __init__(self, cache_size=1024, fail_fast=False, allow_variables=False, exact=None,
+                 precision=DEFAULT_PRECISION, eliminate_common_subexpressions=False, code_generation=False,
+                 budget=None):
+        """
+        :param cache_size: The number of compiled expressions kept in the cache
+        :type cache_size: int
+        :param fail_fast: Stop the validation at the first error
+        :type fail_fast: bool
+        :param allow_variables: Accept variable names as operands
+        :type allow_variables: bool
+        :param exact: The exact mode, "fraction" or "decimal" (see exact_arithmetic), None for float arithmetic
+        :type exact: str
+        :param precision: The number of significant digits of the results in decimal mode
+        :type precision: int
+        :param eliminate_common_subexpressions: Evaluate every repeated subexpression once
+        :type eliminate_common_subexpressions: bool
+        :param code_generation: Compile the expressions into Python functions, for expressions evaluated many times
+        :type code_generation: bool
+        :param budget: The limits of every evaluation. The budget is only checked by the loops of lexer_utils and
+            evaluate_postfix, so a budget turns off the token stream, the code generation and the elimination of
+            common subexpressions
+        :type budget: EvaluationBudget
+        """
+        self._cache = ExpressionCache(cache_size)
+        self._fail_fast = fail_fast
+        self._allow_variables = allow_variables
+        self._arithmetic = ExactArithmetic(exact, precision) if exact else None
+        self._eliminate_common_subexpressions = eliminate_common_subexpressions and budget is None
+        self._code_generation = code_generation and budget is None
+        self._budget = budget
+
+    def compile(self, expression, meter=None):
+        """
+        Runs the lexing, validation and conversion steps. Compiled expressions are taken from the cache, and
+        expressions that already failed the validation raise a new exception with the cached message.
+        :param expression: The raw expression
+        :type expression: str
+        :param meter: The budget of the evaluation, checked while the expression is tokenized
+        :type meter: BudgetMeter
+        :return: The (token list, postfix expression) pair, None for an empty expression. The postfix expression is
+            compiled into a CompiledExpression with code generation, or an ExpressionDag when the common
+            subexpressions are eliminated. Long float expressions are compiled into a (TokenStream, postfix array)
+            pair instead
+        :rtype: tuple or None
+        :raises InvalidCharacterException: if invalid characters appear in the expression.
+        :raises InvalidDecimalPointException: if the decimal points are misplaced.
+        :raises InvalidExpressionException: if the validation fails.
+        :raises BudgetExceededException: if the budget is exceeded.
+        """
+        if meter is not None:
+            meter.check_input(expression)
+        cache = self._cache
+        key = cache.canonicalize(expression)
+        if not key:
+            return None
+        compiled = cache.get(key)
+        if compiled is not None:
+            return compiled
+        failure = cache.get_failure(key)
+        if failure is not None:
+            # A new exception for every caller, raising the cached one again would grow its traceback on every hit
+            raise InvalidExpressionException(failure.message)
+
+        if len(expression) >= TOKEN_STREAM_MIN_LENGTH and meter is None and self._streams_tokens():
+            stream = token_stream.from_expression(expression)
+            if stream is not None and len(stream):
+                if not any(token_stream.validate(stream, self._fail_fast)):
+                    postfix_expression = token_stream.flatten_chains(token_stream.to_postfix(stream), stream)
+                    cache.put(key, stream, postfix_expression)
+                    return stream, postfix_expression
+                self._fail(key, validation_utils.diagnose(stream.to_list(), self._fail_fast))
+            # Otherwise the lexer errors are raised by the token list path
+
+        # In exact mode the number literals are read as exact decimals
+        number = float if self._arithmetic is None else decimal.Decimal
+        token_list = lexer_utils.tokenize(expression, self._allow_variables, number, meter)
+        if not token_list:
+            return None
+        found = validation_utils.diagnose(token_list, self._fail_fast)
+        if found:
+            self._fail(key, found)
+        postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+        if self._code_generation:
+            postfix_expression = compile_postfix(postfix_expression, token_list, self._arithmetic) or postfix_expression
+        elif self._eliminate_common_subexpressions:
+            postfix_expression = build_dag(postfix_expression) or postfix_expression
+        elif self._arithmetic is not None:
+            postfix_expression = postfix_optimization_utils.fuse_power_modulo(postfix_expression)
+        elif self._budget is None:
+            postfix_expression = postfix_optimization_utils.flatten_chains(postfix_expression)
+        cache.put(key, token_list, postfix_expression)
+        return token_list, postfix_expression
+
+    def _streams_tokens(self):
+        # The token stream holds float numbers only, and is evaluated by its own evaluation loop
+        return (self._arithmetic is None and not self._allow_variables and not self._code_generation and
+                not self._eliminate_common_subexpressions and self._budget is None)
+
+    def _fail(self, key, found):
+        """
+        Raises the validation errors of an expression, and caches them unless the validation stopped at the first.
+        :raises InvalidExpressionException: always.
+        """
+        failure = InvalidExpressionException(DiagnosticReport(found))
+        if not self._fail_fast:
+            self._cache.put_failure(key, failure)
+        raise failure
+
+    def evaluate(self, expression, variables=None, cancel_token=None):
+        """
+        Evaluates a single expression, within the budget of the engine.
+        :param expression: The raw expression
+        :type expression: str
+        :param variables: The values of the variables in the expression by name
+        :type variables: dict
+        :param cancel_token: A token another thread can stop the evaluation with. Without a budget, the long
+            expressions compiled into token streams, generated code or DAGs only check it before they are evaluated
+        :type cancel_token: CancelToken
+        :return: The result of the expression or the error it failed with
+        :rtype: EvaluationResult
+        """
+        budget = self._budget
+        meter = None
+        if budget is not None or cancel_token is not None:
+            meter = (budget or _NO_LIMITS).start(cancel_token)
+        try:
+            compiled = self.compile(expression, meter)
+        except HANDLED_ERRORS as e:
+            return EvaluationResult(None, e, error_code(e))
+        return self.evaluate_compiled(compiled, variables, meter)
+
+    def evaluate_compiled(self, compiled, variables=None, meter=None):
+        """
+        Evaluates an expression compiled by compile(), for callers that keep the compiled expressions themselves.
+        :param compiled: The (token list, postfix expression) pair returned by compile(), None for an empty expression
+        :type compiled: tuple
+        :param variables: The values of the variables in the expression by name
+        :type variables: dict
+        :param meter: The budget of the evaluation, see evaluate()
+        :type meter: BudgetMeter
+        :return: The result of the expression or the error it failed with
+        :rtype: EvaluationResult
+        """
+        if compiled is None:
+            return EvaluationResult(None, None, EMPTY_EXPRESSION)
+        try:
+            token_list, postfix_expression = compiled
+            arithmetic = self._arithmetic
+            if meter is not None:
+                meter.check_time()
+            if postfix_expression.__class__ is list:
+                evaluate = partial(postfix_evaluation_utils.evaluate_postfix, postfix_expression, meter=meter)
+            elif postfix_expression.__class__ is array:
+                evaluate = partial(token_stream.evaluate_postfix, postfix_expression)
+            else:
+                evaluate = postfix_expression.evaluate  # A compiled expression or a DAG
+            if arithmetic is None:
+                return EvaluationResult(postfix_evaluation_utils.normalize_result(evaluate(token_list, variables)))
+            with arithmetic.context():
+                return EvaluationResult(arithmetic.normalize(evaluate(token_list, variables, arithmetic)))
+        except HANDLED_ERRORS as e:
+            return EvaluationResult(None, e, error_code(e))
+
+    def evaluate_many(self, expressions, cancel_token=None):
+        """
+        Evaluates a batch of expressions, an error in one expression does not stop the others.
+        :param expressions: The raw expressions
+        :type expressions: Iterable[str]
+        :param cancel_token: A token another thread can stop the batch with, the expressions left get a
+            budget_exceeded error
+        :type cancel_token: CancelToken
+        :return: The results, in the order of the expressions
+        :rtype: list
+        """
+        evaluate = self.evaluate
+        return [evaluate(expression, None, cancel_token) for expression in expressions]
+
+    def cache_stats(self):
+        """
+        Returns the counters of the engine's cache.
+        :return: A dictionary of the cache statistics
+        :rtype: dict
+        """
+        return self._cache.stats()
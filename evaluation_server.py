@@ -0,0 +1,346 @@
+"""
+A long-lived evaluation service speaking line-delimited JSON over TCP or a Unix socket.
+
+Every request is a line with a JSON object, {"id": 7, "expression": "2 * (3 + 4)"}, and gets a response line
+with the same id, {"id": 7, "value": 14} or {"id": 7, "error": "zero_division"}. The error is an error code of
+error_codes.ERROR_CODES, or one of the protocol errors below. The responses of a connection are written in
+the order of its requests, so clients can pipeline requests without waiting for the responses.
+
+Usage: python evaluation_server.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--exact {fraction,decimal}]
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from evaluation_engine import EvaluationEngine
+from evaluation_budget import EvaluationBudget
+from exact_arithmetic import MODES, DEFAULT_PRECISION
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# The protocol errors, reported like the evaluation errors
+BAD_REQUEST = "bad_request"  # The line is not a JSON object with an "expression" string
+LINE_TOO_LONG = "line_too_long"  # The line is longer than max_line_length, the connection is closed after it
+INTERNAL_ERROR = "internal_error"  # The evaluation failed with an unexpected exception
+
+
+def _json_value(value):
+    """
+    :return: The value as a JSON number, or as a string if JSON has no number for it (fractions, decimals,
+        infinities and NaN)
+    :rtype: int, float or str
+    """
+    if value.__class__ is int or (value.__class__ is float and math.isfinite(value)):
+        return value
+    return str(value)
+
+
+def encode_response(request_id, result):
+    """
+    Encodes the response line of a request.
+    :param request_id: The id of the request, any JSON value
+    :param result: The result of the expression, or a protocol error code
+    :type result: EvaluationResult or str
+    :return: The response line
+    :rtype: bytes
+    """
+    if result.__class__ is str:
+        response = {"id": request_id, "error": result}
+    elif result.ok:
+        response = {"id": request_id, "value": _json_value(result.value)}
+    else:
+        response = {"id": request_id, "error": result.error_code}
+    return json.dumps(response, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_request(line):
+    """
+    Decodes a request line.
+    :param line: The request line
+    :type line: bytes
+    :return: The (id, expression) of the request, the expression is None if the request is malformed
+    :rtype: tuple
+    """
+    try:
+        request = json.loads(line)
+    except ValueError:  # Invalid JSON or UTF-8
+        return None, None
+    if not isinstance(request, dict):
+        return None, None
+    expression = request.get("expression")
+    return request.get("id"), expression if isinstance(expression, str) else None
+
+
+class EvaluationServer:
+    """
+    An asyncio server that evaluates the expressions of many connections in micro-batches.
+
+    The connections put their requests into a single bounded queue. A batching task takes up to batch_size
+    requests from it at a time, waiting at most batch_delay seconds for a batch to fill, and evaluates the batch
+    with EvaluationEngine.evaluate_many in a worker thread, off the event loop. The engine runs the same pipeline
+    as Calculator.calculate, so the results are the ones of the CLI. While a batch is evaluated the next
+    requests accumulate in the queue, so the batches grow with the load.
+
+    Backpressure: when the queue is full the connections stop reading, and a connection with max_pending
+    requests awaiting their responses stops reading too, so a fast client is slowed down by TCP flow control
+    instead of growing the server's memory. The responses are written with drain(), so a client that doesn't
+    read its responses stops its own requests from being read.
+
+    Attributes:
+        batch_size (int): The largest number of expressions evaluated at once.
+        batch_delay (float): The longest time in seconds a batch waits to fill once it has a request,
+            0 evaluates whatever is queued right away.
+        max_pending (int): The largest number of requests of a single connection awaiting their responses.
+        max_line_length (int): The longest request line in bytes.
+        idle_timeout (float): The seconds a connection may stay silent before it is closed, None for no limit.
+        _engine (EvaluationEngine): The engine, only used by the worker thread.
+        _executor (ThreadPoolExecutor): The single worker thread that evaluates the batches.
+        _queue (asyncio.Queue): The (expression, future) of every request waiting to be evaluated.
+        _batcher (asyncio.Task): The task that evaluates the batches, created when the server starts.
+        _connections (set): The tasks serving the open connections.
+
+    Methods:
+        start_tcp(host, port):
+            Starts listening on a TCP socket.
+
+        start_unix(path):
+            Starts listening on a Unix socket.
+
+        close():
+            Closes the open connections, and stops the batching task and the worker thread.
+    """
+
+    def __init__(self, exact=None, precision=DEFAULT_PRECISION, batch_size=64, batch_delay=0.0, queue_size=1024,
+                 max_pending=64, max_line_length=65536, idle_timeout=None, budget=None):
+        """
+        :param exact: The exact mode, "fraction" or "decimal" (see exact_arithmetic), None for float arithmetic
+        :type exact: str
+        :param precision: The number of significant digits of the results in decimal mode
+        :type precision: int
+        :param batch_size: The largest number of expressions evaluated at once
+        :type batch_size: int
+        :param batch_delay: The longest time in seconds a batch waits to fill
+        :type batch_delay: float
+        :param queue_size: The largest number of requests of all the connections waiting to be evaluated
+        :type queue_size: int
+        :param max_pending: The largest number of requests of a connection awaiting their responses
+        :type max_pending: int
+        :param max_line_length: The longest request line in bytes
+        :type max_line_length: int
+        :param idle_timeout: The seconds a connection may stay silent, None for no limit
+        :type idle_timeout: float
+        :param budget: The limits of every evaluation, so a single expression can't hold up the worker thread
+        :type budget: EvaluationBudget
+        """
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.max_line_length = max_line_length
+        self.idle_timeout = idle_timeout
+        self._engine = EvaluationEngine(exact=exact, precision=precision, budget=budget)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluation")
+        self._queue = asyncio.Queue(queue_size)
+        self._batcher = None
+        self._connections = set()
+
+    async def start_tcp(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        :return: The listening server
+        :rtype: asyncio.Server
+        """
+        self._start()
+        return await asyncio.start_server(self._serve_connection, host, port, limit=self.max_line_length)
+
+    async def start_unix(self, path):
+        """
+        :return: The listening server
+        :rtype: asyncio.Server
+        """
+        self._start()
+        return await asyncio.start_unix_server(self._serve_connection, path, limit=self.max_line_length)
+
+    def _start(self):
+        if self._batcher is None:
+            self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def close(self):
+        """
+        Closes the open connections without answering their pending requests, and stops the batching task and
+        the worker thread. Stop the listening servers first, or new connections keep coming.
+        """
+        connections = list(self._connections)
+        for connection in connections:
+            connection.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        self._executor.shutdown(wait=True)
+
+    async def _next_batch(self):
+        """
+        Waits for a request, then takes the requests that arrive within batch_delay, up to batch_size.
+        :return: The (expression, future) of every request of the batch
+        :rtype: list
+        """
+        queue = self._queue
+        batch = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            expressions = [expression for expression, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._engine.evaluate_many, expressions)
+            except Exception:  # Anything evaluate() doesn't turn into an error code, the server keeps running
+                results = [INTERNAL_ERROR] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():  # Cancelled when its connection was lost
+                    future.set_result(result)
+
+    async def _submit(self, line):
+        """
+        Queues the expression of a request line for evaluation.
+        :return: The id of the request and a future of its result
+        :rtype: tuple
+        """
+        future = asyncio.get_running_loop().create_future()
+        request_id, expression = decode_request(line)
+        if expression is None:
+            future.set_result(BAD_REQUEST)
+        else:
+            await self._queue.put((expression, future))  # Waits while the queue is full
+        return request_id, future
+
+    async def _serve_connection(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        pending = asyncio.Queue(self.max_pending)  # The (id, future) of the requests, in order, None at the end
+        responder = asyncio.get_running_loop().create_task(self._write_responses(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except ValueError:  # The line is longer than the stream limit
+                    await pending.put((None, _resolved(LINE_TOO_LONG)))
+                    break
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await pending.put(await self._submit(line))  # Waits while max_pending requests are pending
+            await pending.put(None)
+            await responder
+        except asyncio.CancelledError:
+            pass  # The server is closing, the connection task ends quietly
+        finally:
+            responder.cancel()  # Only still running if the server is closing
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    @staticmethod
+    async def _write_responses(pending, writer):
+        """
+        Writes the responses of a connection in the order of its requests, until the None after the last request.
+        Once the client is gone the remaining requests are cancelled instead.
+        """
+        connected = True
+        while True:
+            request = await pending.get()
+            if request is None:
+                return
+            request_id, future = request
+            if not connected:
+                future.cancel()
+                continue
+            writer.write(encode_response(request_id, await future))
+            try:
+                await writer.drain()  # Waits while the client is not reading its responses
+            except ConnectionError:
+                connected = False
+
+
+def _resolved(result):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="MAX CALCULATOR evaluation server")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="the address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the TCP port (default: %(default)s)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--exact", choices=MODES, help="evaluate with exact fractions or decimals instead of floats")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION,
+                        help="the number of significant digits of decimal results (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=64, help="the largest batch (default: %(default)s)")
+    parser.add_argument("--batch-delay", type=float, default=0.0,
+                        help="the seconds a batch waits to fill (default: %(default)s)")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="the requests a connection may have awaiting responses (default: %(default)s)")
+    parser.add_argument("--max-line-length", type=int, default=65536,
+                        help="the longest request line in bytes (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, help="close the connections silent for this many seconds")
+    parser.add_argument("--max-tokens", type=int, help="the largest number of tokens of an expression")
+    parser.add_argument("--max-steps", type=int, help="the largest number of operators evaluated per expression")
+    parser.add_argument("--max-bits", type=int, help="the largest size of an intermediate value in bits")
+    parser.add_argument("--timeout", type=float, help="the seconds an evaluation may take")
+    return parser.parse_args(argv)
+
+
+async def serve(arguments):
+    budget = None
+    if any(limit is not None for limit in (arguments.max_tokens, arguments.max_steps, arguments.max_bits,
+                                            arguments.timeout)):
+        budget = EvaluationBudget(max_tokens=arguments.max_tokens, max_steps=arguments.max_steps,
+                                  max_bits=arguments.max_bits, timeout=arguments.timeout)
+    server = EvaluationServer(arguments.exact, arguments.precision, arguments.batch_size, arguments.batch_delay,
+                              max_pending=arguments.max_pending, max_line_length=arguments.max_line_length,
+                              idle_timeout=arguments.idle_timeout, budget=budget)
+    if arguments.unix:
+        listener = await server.start_unix(arguments.unix)
+    else:
+        listener = await server.start_tcp(arguments.host, arguments.port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.exact:
+        sys.set_int_max_str_digits(0)  # Exact integer results can have any number of digits
+    try:
+        asyncio.run(serve(arguments))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
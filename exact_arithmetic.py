@@ -0,0 +1,230 @@
+import decimal
+import math
+from decimal import Decimal
+from fractions import Fraction
+
+from binary_operator import BinaryOperator
+from unary_operator import UnaryOperator
+
+FRACTION = "fraction"  # Rationals, exact for every operator but a power with a fraction exponent
+DECIMAL = "decimal"  # Decimal numbers rounded to a configurable number of significant digits
+MODES = (FRACTION, DECIMAL)
+DEFAULT_PRECISION = 28
+
+# The largest exact result a power or a factorial may produce, bigger results raise OverflowError instead of
+# taking minutes and all the memory to calculate
+MAX_EXACT_BITS = 1 << 24
+
+# The types a number token can have, the number literals are read as exact decimals in exact mode
+NUMBER_TYPES = (int, float, Decimal, Fraction)
+
+
+def _simplify(number):
+    """
+    Keeps a number in the cheapest exact type, a whole fraction becomes an int.
+    """
+    if number.__class__ is Fraction and number.denominator == 1:
+        return number.numerator
+    return number
+
+
+def _rational(number):
+    """
+    Converts a decimal literal to a fraction, exactly.
+    """
+    if number.__class__ is Decimal:
+        return _simplify(Fraction(number))
+    return number
+
+
+def _is_whole(number):
+    return number.__class__ is int or number == int(number)
+
+
+def _check_power_size(base, exponent):
+    if base.__class__ is Fraction:
+        bits = base.numerator.bit_length() + base.denominator.bit_length()
+    elif abs(base) <= 1:
+        return
+    else:
+        bits = int(abs(base)).bit_length()
+    if bits * abs(exponent) > MAX_EXACT_BITS:
+        raise OverflowError("The exact result of the power is too big.")
+
+
+def _exact_factorial(operand):
+    operand = int(operand)
+    if math.lgamma(operand + 1) / math.log(2) > MAX_EXACT_BITS:
+        raise OverflowError("The exact result of the factorial is too big.")
+    return UnaryOperator.exact_factorial(operand)
+
+
+def _fraction_hashtag(operand):
+    """
+    Sums the digits of a fraction with a finite decimal expansion, 3/8 has the digits of 0.375.
+    """
+    operand = _rational(operand)
+    if operand.__class__ is not Fraction:
+        return UnaryOperator.hashtag(operand)
+    denominator = operand.denominator
+    twos = (denominator & -denominator).bit_length() - 1
+    fives = 0
+    while denominator % 5 == 0:
+        denominator //= 5
+        fives += 1
+    if denominator >> twos != 1:
+        raise ValueError(f"{operand} has infinitely many decimal digits")
+    # Shifting the decimal point by max(twos, fives) digits makes the fraction whole
+    return UnaryOperator.hashtag(operand.numerator * 10 ** max(twos, fives) // operand.denominator)
+
+
+def _fraction_divide(left_operand, right_operand):
+    return _simplify(Fraction(_rational(left_operand)) / _rational(right_operand))
+
+
+def _fraction_power(base, exponent):
+    """
+    Raises a rational to a power. Python raises ints and fractions to integer powers by repeated squaring,
+    a fraction exponent falls back to the float power.
+    """
+    base, exponent = _rational(base), _rational(exponent)
+    if exponent.__class__ is not int:
+        return BinaryOperator.power(float(base), float(exponent))
+    if base == 0 and exponent < 0:
+        raise ValueError("math domain error")  # Like math.pow
+    _check_power_size(Fraction(base) if exponent < 0 else base, exponent)
+    return _simplify(Fraction(base) ** exponent) if exponent < 0 else base ** exponent
+
+
+def _fraction_modulo(left_operand, right_operand):
+    return _simplify(_rational(left_operand) % _rational(right_operand))  # Floor modulo, like floats
+
+
+def _decimal_divide(left_operand, right_operand):
+    if left_operand.__class__ is int and right_operand.__class__ is int and not left_operand % right_operand:
+        return left_operand // right_operand
+    return Decimal(left_operand) / right_operand
+
+
+def _decimal_power(base, exponent):
+    """
+    Raises a decimal to a power, rounded to the precision of the current context. Decimals are raised to
+    integer powers by repeated squaring, and ints to non-negative integer powers stay exact ints.
+    """
+    if base == 0 and exponent < 0:
+        raise ValueError("math domain error")  # Like math.pow
+    if _is_whole(exponent):
+        exponent = int(exponent)
+        if base.__class__ is int and exponent >= 0:
+            _check_power_size(base, exponent)
+            return base ** exponent
+    try:
+        return Decimal(base) ** exponent
+    except decimal.InvalidOperation:
+        raise ValueError("math domain error")  # A negative base with a fraction exponent, like math.pow
+
+
+def _decimal_modulo(left_operand, right_operand):
+    if right_operand == 0:
+        raise ZeroDivisionError("integer modulo by zero")
+    result = left_operand % right_operand
+    if result and (result < 0) != (right_operand < 0):
+        result += right_operand  # Decimal's modulo keeps the sign of the dividend, floats keep the divisor's
+    return result
+
+
+_FRACTION_OPERATIONS = {
+    "+": lambda left_operand, right_operand: _simplify(_rational(left_operand) + _rational(right_operand)),
+    "-": lambda left_operand, right_operand: _simplify(_rational(left_operand) - _rational(right_operand)),
+    "*": lambda left_operand, right_operand: _simplify(_rational(left_operand) * _rational(right_operand)),
+    "/": _fraction_divide,
+    "^": _fraction_power,
+    "%": _fraction_modulo,
+    "$": lambda left_operand, right_operand: max(_rational(left_operand), _rational(right_operand)),
+    "&": lambda left_operand, right_operand: min(_rational(left_operand), _rational(right_operand)),
+    "@": lambda left_operand, right_operand: _fraction_divide(
+        _rational(left_operand) + _rational(right_operand), 2),
+    "u": UnaryOperator.negative,
+    "~": UnaryOperator.negative,
+    "!": _exact_factorial,
+    "#": _fraction_hashtag
+}
+
+_DECIMAL_OPERATIONS = {
+    "+": BinaryOperator.add,
+    "-": BinaryOperator.subtract,
+    "*": BinaryOperator.multiply,
+    "/": _decimal_divide,
+    "^": _decimal_power,
+    "%": _decimal_modulo,
+    "$": BinaryOperator.max,
+    "&": BinaryOperator.min,
+    "@": lambda left_operand, right_operand: _decimal_divide(left_operand + right_operand, 2),
+    "u": UnaryOperator.negative,
+    "~": UnaryOperator.negative,
+    "!": _exact_factorial,
+    "#": UnaryOperator.hashtag
+}
+
+
+class ExactArithmetic:
+    """
+    The operations of the exact mode, a replacement for the operations of Operator.operators_dict.
+    Operands are kept in the cheapest exact type that holds them: ints stay ints as long as the results are whole,
+    and are promoted to fractions or decimals only by a division, a negative power or a decimal literal.
+    The factorial has no 170 limit in exact mode.
+
+    Attributes:
+        mode (str): FRACTION or DECIMAL.
+        precision (int): The number of significant digits of decimal results.
+        operations (dict): The operation of every operator.
+        factorial_limit (int): The largest factorial operand, None for no limit.
+
+    Methods:
+        context():
+            Returns the context manager the evaluation should run in.
+
+        normalize(result):
+            Converts an evaluated result to the number presented to the user.
+    """
+    __slots__ = ("mode", "precision", "operations", "factorial_limit", "_context")
+
+    def __init__(self, mode=FRACTION, precision=DEFAULT_PRECISION):
+        """
+        :param mode: FRACTION or DECIMAL
+        :type mode: str
+        :param precision: The number of significant digits of decimal results
+        :type precision: int
+        :raises ValueError: if the mode is unknown.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown exact mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.precision = precision
+        self.operations = _FRACTION_OPERATIONS if mode == FRACTION else _DECIMAL_OPERATIONS
+        self.factorial_limit = None
+        self._context = decimal.Context(prec=precision)
+
+    def context(self):
+        """
+        :return: A context manager that rounds the decimal operations to the precision
+        :rtype: contextlib.AbstractContextManager
+        """
+        return decimal.localcontext(self._context)
+
+    def normalize(self, result):
+        """
+        Converts an evaluated result to the number presented to the user, without losing its exactness.
+        :param result: The evaluated result
+        :type result: int, float, Fraction or Decimal
+        :return: An int for whole fractions, a fraction or a decimal rounded to the precision otherwise,
+            and the normalized float if a float power made the result inexact
+        :rtype: int, float, Fraction or Decimal
+        """
+        if result.__class__ is float:
+            return int(result) if result.is_integer() else result
+        if self.mode == FRACTION:
+            return _rational(result)
+        if result.__class__ is Decimal:
+            return self._context.plus(result)
+        return result
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+
+import lexer_utils
+
+
+class ExpressionCache:
+    """
+    A bounded LRU cache of compiled expressions, keyed on the canonical form of the expression.
+
+    Successfully compiled expressions are stored as the (token list, postfix expression) pair the
+    pipeline produced for them, so a repeated expression can skip straight to the evaluation step.
+    Expressions that failed the validation step are kept in a separate negative cache together with
+    the exception that was raised, so the same error can be reported again without re-validating.
+
+    Attributes:
+        max_size (int): The maximum number of entries kept in each of the two caches.
+        hits (int): The number of lookups that found a compiled expression.
+        negative_hits (int): The number of lookups that found a previously failed expression.
+        misses (int): The number of lookups that found nothing.
+        evictions (int): The number of entries dropped to keep the caches within max_size.
+
+    Methods:
+        canonicalize(expression):
+            Returns the key an expression is cached under.
+
+        get(key):
+            Looks up a compiled expression.
+
+        get_failure(key):
+            Looks up the exception of a previously failed expression.
+
+        put(key, token_list, postfix_expression):
+            Stores a compiled expression.
+
+        put_failure(key, exception):
+            Stores the exception of a failed expression.
+
+        resize(max_size):
+            Changes the maximum size, evicting the least recently used entries if needed.
+
+        clear():
+            Drops all the entries and resets the counters.
+
+        stats():
+            Returns the counters and current sizes as a dictionary.
+    """
+
+    def __init__(self, max_size=1024):
+        if max_size < 0:
+            raise ValueError("The cache size cannot be negative.")
+        self.max_size = max_size
+        self._compiled = OrderedDict()
+        self._failed = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._compiled) + len(self._failed)
+
+    @staticmethod
+    def canonicalize(expression):
+        """
+        Returns the key an expression is cached under: the expression without whitespaces and with
+        its minus sequences reduced, exactly as the preprocessor sees it.
+        :param expression: The raw expression
+        :type expression: str
+        :return: The canonical form of the expression
+        :rtype: str
+        """
+        return lexer_utils.canonicalize(expression)
+
+    def get(self, key):
+        """
+        Looks up a compiled expression and marks it as the most recently used.
+        :param key: The canonical form of the expression
+        :type key: str
+        :return: The (token list, postfix expression) pair, or None if it is not cached
+        :rtype: tuple or None
+        """
+        entry = self._compiled.get(key)
+        if entry is not None:
+            self._compiled.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def get_failure(self, key):
+        """
+        Looks up the exception raised by a previously failed expression. Counts a miss when the
+        expression is in neither of the caches, so it should be called after get().
+        :param key: The canonical form of the expression
+        :type key: str
+        :return: The exception, or None if it is not cached
+        :rtype: Exception or None
+        """
+        exception = self._failed.get(key)
+        if exception is not None:
+            self._failed.move_to_end(key)
+            self.negative_hits += 1
+        else:
+            self.misses += 1
+        return exception
+
+    def put(self, key, token_list, postfix_expression):
+        """
+        Stores a compiled expression.
+        :param key: The canonical form of the expression
+        :type key: str
+        :param token_list: The validated token list of the expression
+        :type token_list: list
+        :param postfix_expression: The expression in postfix notation
+        :type postfix_expression: list
+        """
+        self._store(self._compiled, key, (token_list, postfix_expression))
+
+    def put_failure(self, key, exception):
+        """
+        Stores the exception raised by an expression that failed the validation.
+        :param key: The canonical form of the expression
+        :type key: str
+        :param exception: The raised exception
+        :type exception: Exception
+        """
+        self._store(self._failed, key, exception)
+
+    def resize(self, max_size):
+        """
+        Changes the maximum size of the caches, evicting the least recently used entries if needed.
+        :param max_size: The new maximum size
+        :type max_size: int
+        """
+        if max_size < 0:
+            raise ValueError("The cache size cannot be negative.")
+        self.max_size = max_size
+        self._evict(self._compiled)
+        self._evict(self._failed)
+
+    def clear(self):
+        """
+        Drops all the entries and resets the counters.
+        """
+        self._compiled.clear()
+        self._failed.clear()
+        self.hits = self.negative_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the counters and the current sizes of the caches.
+        :return: A dictionary of the cache statistics
+        :rtype: dict
+        """
+        return {
+            "max_size": self.max_size,
+            "size": len(self._compiled),
+            "failed_size": len(self._failed),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def _store(self, entries, key, value):
+        if self.max_size == 0:
+            return
+        entries[key] = value
+        entries.move_to_end(key)
+        self._evict(entries)
+
+    def _evict(self, entries):
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)  # Drop the least recently used entry
+            self.evictions += 1
@@ -0,0 +1,141 @@
+from operators import OPCODES, ARITIES, OPERATIONS
+from variable import Variable
+from exact_arithmetic import NUMBER_TYPES
+from unary_operator import FACTORIAL_LIMIT
+import postfix_evaluation_utils
+
+# The kinds of the DAG nodes
+NUMBER, VARIABLE, BINARY, UNARY = range(4)
+
+
+class ExpressionDag:
+    """
+    A postfix expression compiled into a hash-consed DAG: every distinct subexpression is a single node,
+    so a subexpression repeated in the expression is evaluated once.
+    The nodes are kept in the order of their first occurrence in the postfix expression, a node's operands always
+    come before it, and the nodes are evaluated in that order.
+
+    Every node keeps the token indexes of its first occurrence, so the errors highlight the same tokens as
+    evaluate_postfix: an error in a repeated subexpression is raised at its first occurrence, which is also where
+    evaluate_postfix raises it.
+
+    Attributes:
+        nodes (list): The (kind, token, operand nodes, index) of every node. The operand nodes are the positions of
+            the operands in the list, and the index is the token index of a number or a variable, the token indexes
+            of the operand of a unary operator, or the token index of a binary operator and the token indexes of its
+            right operand, nested like the indexes of evaluate_postfix.
+        root (int): The node of the whole expression.
+        occurrences (int): The number of operands and operators in the postfix expression, the number of nodes
+            without the elimination.
+
+    Methods:
+        evaluate(token_list, variables, arithmetic):
+            Evaluates every node once and returns the value of the root.
+    """
+    __slots__ = ("nodes", "root", "occurrences")
+
+    def __init__(self, nodes, root, occurrences):
+        self.nodes = nodes
+        self.root = root
+        self.occurrences = occurrences
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def evaluate(self, token_list, variables=None, arithmetic=None):
+        """
+        Evaluates the expression, like evaluate_postfix does for the postfix expression it was built from.
+        :param token_list: The token list of the expression, used to highlight errors
+        :type token_list: list
+        :param variables: The values of the variables in the expression by name
+        :type variables: dict
+        :param arithmetic: The operations of the exact mode, the float operations of Operator by default
+        :type arithmetic: ExactArithmetic
+        :return: The result of the evaluated expression.
+        :rtype: float
+        :raises ValueError: If the expression contains runtime errors.
+        :raises ZeroDivisionError: when a division by zero occurs.
+        """
+        values = []
+        append = values.append
+        operations = None if arithmetic is None else arithmetic.operations
+        factorial_limit = FACTORIAL_LIMIT if arithmetic is None else arithmetic.factorial_limit
+        factorial_message_id = postfix_evaluation_utils.factorial_domain_message_id(factorial_limit)
+
+        for kind, token, operand_nodes, index in self.nodes:
+            if kind == NUMBER:
+                append(token)
+            elif kind == VARIABLE:
+                try:
+                    append(token.value(variables or {}))
+                except KeyError:
+                    raise postfix_evaluation_utils.unbound_variable_error(index, token_list)
+            else:
+                operation = OPERATIONS[OPCODES[token]] if operations is None else operations[token]
+                if kind == BINARY:
+                    left_operand, right_operand = values[operand_nodes[0]], values[operand_nodes[1]]
+                    if token == "/" and right_operand == 0:
+                        raise postfix_evaluation_utils.zero_division_error(index[0], index[1], token_list)
+                    append(operation(left_operand, right_operand))
+                else:
+                    operand = values[operand_nodes[0]]
+                    if token == "!" and (operand < 0 or not (operand == int(operand)) or
+                                         (factorial_limit is not None and operand > factorial_limit)):
+                        raise postfix_evaluation_utils.domain_error(factorial_message_id, index, token_list)
+                    if token == "#" and operand < 0:
+                        raise postfix_evaluation_utils.domain_error("hashtag_domain", index, token_list)
+                    append(operation(operand))
+
+        return values[self.root]
+
+
+def _operand_key(token):
+    # 1 and 1.0, or Decimal("1.1") and Decimal("1.10"), are equal but don't give the same results
+    return token.__class__, repr(token)
+
+
+def build_dag(postfix_expression):
+    """
+    Compiles a postfix expression into a hash-consed DAG, identical subexpressions are stored once.
+    :param postfix_expression: The postfix expression, a list of (token, index) pairs
+    :type postfix_expression: list
+    :return: The DAG, or None if the postfix expression is invalid and should be left to evaluate_postfix to
+        report its error at the right point
+    :rtype: ExpressionDag or None
+    """
+    nodes = []
+    node_ids = {}  # The node of every distinct subexpression, keyed by its operator and operand nodes
+    stack = []  # The (node, index) of the evaluated operands, like the stack of evaluate_postfix
+    occurrences = 0
+
+    for token, index in postfix_expression:
+        if isinstance(token, NUMBER_TYPES):
+            kind, key, operand_nodes, node_index = NUMBER, _operand_key(token), (), index
+        elif token.__class__ is Variable:
+            kind, key, operand_nodes, node_index = VARIABLE, token, (), index
+        elif token in OPCODES:
+            if ARITIES[OPCODES[token]] == 2:
+                if len(stack) < 2:
+                    return None
+                (right_node, right_index), (left_node, left_index) = stack.pop(), stack.pop()
+                kind, operand_nodes = BINARY, (left_node, right_node)
+                node_index, index = (index, right_index), (left_index, right_index)
+            else:
+                if not stack:
+                    return None
+                operand_node, index = stack.pop()
+                kind, operand_nodes, node_index = UNARY, (operand_node,), index
+            key = (token, operand_nodes)
+        else:
+            continue  # Markers evaluate_postfix skips, like the "s" of a sign minus before parentheses
+
+        occurrences += 1
+        node = node_ids.get(key)
+        if node is None:
+            node = node_ids[key] = len(nodes)
+            nodes.append((kind, token, operand_nodes, node_index))
+        stack.append((node, index))
+
+    if len(stack) != 1:
+        return None
+    return ExpressionDag(nodes, stack[0][0], occurrences)
@@ -0,0 +1,214 @@
+import mmap
+import os
+import struct
+from collections import deque
+
+DEFAULT_HISTORY_SIZE = 5
+DEFAULT_SYNC_EVERY = 64  # The number of appended entries written to disk with a single fsync
+
+# The log starts with a magic header, followed by one record per entry:
+# the payload length, the payload (the expression length, the expression and the result, UTF-8),
+# and the payload length again, so the log can be read backwards from its end
+LOG_MAGIC = b"MAXHIST1"
+_LENGTH = struct.Struct("<I")
+_LENGTH_SIZE = _LENGTH.size
+
+
+def _encode_record(expression, result):
+    expression = expression.encode("utf-8", "replace")
+    payload = _LENGTH.pack(len(expression)) + expression + str(result).encode("utf-8", "replace")
+    length = _LENGTH.pack(len(payload))
+    return length + payload + length
+
+
+def _decode_result(text):
+    """
+    Reads a result back, the calculator results are ints and floats.
+    """
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def _decode_payload(payload):
+    expression_length = _LENGTH.unpack_from(payload)[0]
+    expression = payload[_LENGTH_SIZE:_LENGTH_SIZE + expression_length].decode("utf-8", "replace")
+    result = payload[_LENGTH_SIZE + expression_length:].decode("utf-8", "replace")
+    return expression, _decode_result(result)
+
+
+def _record_before(log, end):
+    """
+    Reads the record that ends at a position of the log, using the length after its payload.
+    :return: The payload and the position the record starts at, or None if there is no valid record there
+    :rtype: tuple or None
+    """
+    if end - len(LOG_MAGIC) < 2 * _LENGTH_SIZE:
+        return None
+    length = _LENGTH.unpack_from(log, end - _LENGTH_SIZE)[0]
+    start = end - length - 2 * _LENGTH_SIZE
+    if start < len(LOG_MAGIC) or _LENGTH.unpack_from(log, start)[0] != length:
+        return None
+    return log[start + _LENGTH_SIZE:end - _LENGTH_SIZE], start
+
+
+def _valid_end(log):
+    """
+    Finds the end of the last complete record, by walking the log forward from the start. Only needed when
+    the last record is torn, after a crash in the middle of a write.
+    """
+    position = len(LOG_MAGIC)
+    while position + _LENGTH_SIZE <= len(log):
+        length = _LENGTH.unpack_from(log, position)[0]
+        end = position + length + 2 * _LENGTH_SIZE
+        if end > len(log) or _LENGTH.unpack_from(log, end - _LENGTH_SIZE)[0] != length:
+            break
+        position = end
+    return position
+
+
+class HistoryStore:
+    """
+    The calculation history: the most recent entries in a deque bounded by maxlen, appended and trimmed in O(1),
+    and optionally every entry in an append-only binary log on disk.
+
+    The log is written through a buffer and synced to disk with a single fsync every sync_every entries, and
+    when the store is closed. On startup only the end of the log is read, through a memory map, so a log of any
+    size loads in the time it takes to read its last maxlen records. A torn record at the end of the log, left by
+    a crash in the middle of a write, is cut off.
+
+    Attributes:
+        entries (deque): The (expression, result) of the most recent entries, oldest first.
+        path (str): The path of the log, None for a history kept in memory only.
+        sync_every (int): The number of entries written to the log with a single fsync.
+        _log (BufferedWriter): The log opened for appending, None without a log.
+        _unsynced (int): The number of entries appended since the last fsync.
+
+    Methods:
+        append(entry):
+            Adds an (expression, result) entry.
+
+        pages(page_size):
+            Yields the whole history in pages, most recent first.
+
+        sync():
+            Writes the buffered entries to disk.
+
+        close():
+            Syncs and closes the log.
+    """
+
+    def __init__(self, maxlen=DEFAULT_HISTORY_SIZE, path=None, sync_every=DEFAULT_SYNC_EVERY):
+        """
+        :param maxlen: The number of recent entries kept in memory, None to keep every entry
+        :type maxlen: int
+        :param path: The path of the log, None to keep the history in memory only
+        :type path: str
+        :param sync_every: The number of entries written to the log with a single fsync
+        :type sync_every: int
+        :raises ValueError: if the file at the path is not a history log.
+        """
+        self.entries = deque(maxlen=maxlen)
+        self.path = path
+        self.sync_every = max(1, sync_every)
+        self._log = None
+        self._unsynced = 0
+        if path is not None:
+            self._open_log()
+
+    def _open_log(self):
+        with open(self.path, "a+b") as log_file:
+            size = log_file.seek(0, os.SEEK_END)
+            if size == 0:
+                log_file.write(LOG_MAGIC)
+            elif size < len(LOG_MAGIC) or self._read_magic(log_file) != LOG_MAGIC:
+                raise ValueError(f"{self.path} is not a history log")
+            elif size > len(LOG_MAGIC):
+                with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                    valid_end = len(log)
+                    if _record_before(log, valid_end) is None:
+                        valid_end = _valid_end(log)
+                    recent = []
+                    position = valid_end
+                    maxlen = self.entries.maxlen
+                    while maxlen is None or len(recent) < maxlen:
+                        record = _record_before(log, position)
+                        if record is None:
+                            break
+                        payload, position = record
+                        recent.append(_decode_payload(payload))
+                if valid_end != size:
+                    log_file.truncate(valid_end)
+                self.entries.extend(reversed(recent))
+        self._log = open(self.path, "ab")
+
+    @staticmethod
+    def _read_magic(log_file):
+        log_file.seek(0)
+        return log_file.read(len(LOG_MAGIC))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def append(self, entry):
+        """
+        Adds an entry, the oldest entry in memory is dropped when there are maxlen of them.
+        :param entry: The (expression, result) of a calculation
+        :type entry: tuple
+        """
+        self.entries.append(entry)
+        if self._log is not None:
+            self._log.write(_encode_record(*entry))
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self.sync()
+
+    def sync(self):
+        if self._log is not None and self._unsynced:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._log is not None:
+            self.sync()
+            self._log.close()
+            self._log = None
+
+    def pages(self, page_size):
+        """
+        Yields the whole history, the entries of the log and not only the ones in memory, most recent first.
+        The log is read backwards through a memory map one page at a time, so only the pages that are asked for
+        are read.
+        :param page_size: The number of entries in a page
+        :type page_size: int
+        :return: The pages, lists of (expression, result) entries, most recent first
+        :rtype: Iterator[list]
+        """
+        if self._log is None:
+            entries = list(reversed(self.entries))
+            for start in range(0, len(entries), page_size):
+                yield entries[start:start + page_size]
+            return
+        self._log.flush()
+        with open(self.path, "rb") as log_file, \
+                mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            end = len(log)
+            while True:
+                page = []
+                while len(page) < page_size:
+                    record = _record_before(log, end)
+                    if record is None:
+                        break
+                    payload, end = record
+                    page.append(_decode_payload(payload))
+                if not page:
+                    return
+                yield page
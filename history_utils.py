@@ -1,27 +1,37 @@
 from colors import Colors
 
+HISTORY_PAGE_SIZE = 10  # The number of entries displayed before asking whether to show more
 
-def add_to_history(history_list, expression, result):
+
+def add_to_history(history, expression, result):
     """
     Adds a successfully calculated expression and its result to the history.
-    Keeps only the 5 most recent entries.
-    :param history_list: the list that contains the current history
+    The history keeps only its maxlen most recent entries in memory, the oldest one is dropped in O(1).
+    :param history: The history, a HistoryStore or a deque with a maxlen
     :param expression: The evaluated expression.
     :param result: The result of the evaluated expression.
     """
-    history_list.append((expression, result))
-    if len(history_list) > 5:
-        history_list.pop(0)  # Remove the oldest entry to maintain a maximum of 5 items.
+    history.append((expression, result))
 
 
-def display_history(history_list):
+def display_history(history, page_size=HISTORY_PAGE_SIZE, ask_more=input):
     """
-    Displays the 5 most recent expressions and their results.
-    :param history_list: the list that contains the current history
+    Displays the history, most recent first, one page at a time. Only the pages that are displayed are read,
+    so a history logged to disk is never loaded whole.
+    :param history: The history
+    :type history: HistoryStore
+    :param page_size: The number of entries of a page
+    :type page_size: int
+    :param ask_more: Asks whether to display the next page, anything but "q" displays it
+    :type ask_more: Callable[[str], str]
     """
-    if not history_list:
+    number = 0
+    for page in history.pages(page_size):
+        if number == 0:
+            print(f"\n{Colors.BLUE}Recent Calculations:{Colors.ENDC}")
+        elif ask_more(f"{Colors.BLUE}Press Enter for more, or q to stop: {Colors.ENDC}").strip().lower() == "q":
+            return
+        for number, (exp, res) in enumerate(page, start=number + 1):
+            print(f"{Colors.BOLD}{number}) {exp} = {res}{Colors.ENDC}")
+    if number == 0:
         print(f"{Colors.CYAN}History is empty!{Colors.ENDC}")
-    else:
-        print(f"\n{Colors.BLUE}Recent Calculations:{Colors.ENDC}")
-        for i, (exp, res) in enumerate(history_list, start=1):
-            print(f"{Colors.BOLD}{i}) {exp} = {res}{Colors.ENDC}")
\ No newline at end of file
@@ -0,0 +1,241 @@
+from operators import OPCODES, ARITIES, PRIORITIES, RIGHT_ASSOCIATIVE
+from postfix_optimization_utils import POWER_MODULO, OperatorChain
+
+
+class ExpressionMetrics:
+    """
+    The measurements of a single Calculator.calculate call.
+
+    Attributes:
+        stage_seconds (dict): The wall time of every stage that ran, by stage name: lexing (the fused
+            preprocessing and tokenization), preprocessor and tokenization (which only run when the lexer found an
+            error to report), validation, infix_to_postfix and evaluate_postfix. The six validation checks run
+            fused into a single walk over the tokens, so validation is timed as one stage.
+        total_seconds (float): The wall time of the whole calculation.
+        token_count (int): The number of tokens, None if the expression was not tokenized.
+        operator_stack_peak (int): The deepest the operator stack of the conversion got, None if the expression
+            was not converted.
+        operand_stack_peak (int): The deepest the operand stack of the evaluation got, None if the expression
+            was not converted.
+        failed_checks (tuple): The message ids of the validation checks the expression failed.
+        error (str): The error category, an error code of error_codes.ERROR_CODES, None on success.
+        cache_hit (bool): The expression was taken from the expression cache, the compiling stages didn't run.
+        token_list (list): The token list of an expression that failed the validation, only kept while the
+            calculation runs.
+    """
+    __slots__ = ("stage_seconds", "total_seconds", "token_count", "operator_stack_peak", "operand_stack_peak",
+                 "failed_checks", "error", "cache_hit", "token_list")
+
+    def __init__(self):
+        self.stage_seconds = {}
+        self.total_seconds = 0.0
+        self.token_count = None
+        self.operator_stack_peak = None
+        self.operand_stack_peak = None
+        self.failed_checks = ()
+        self.error = None
+        self.cache_hit = False
+        self.token_list = None
+
+
+class Histogram:
+    """
+    A histogram with power of two buckets, a value v falls in the bucket b with 2 ** (b - 1) <= v < 2 ** b.
+
+    Attributes:
+        scale (float): The values are multiplied by the scale and rounded down before being bucketed,
+            1e6 buckets seconds by microseconds.
+        buckets (dict): The number of values in every bucket.
+        count (int): The number of values.
+        total (float): The sum of the values.
+        maximum (float): The largest value.
+
+    Methods:
+        add(value):
+            Adds a value.
+
+        to_dict():
+            Exports the histogram.
+    """
+    __slots__ = ("scale", "buckets", "count", "total", "maximum")
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, value):
+        bucket = int(value * self.scale).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def to_dict(self):
+        """
+        :return: The histogram, with every bucket keyed by its upper bound ("<2^b") in the scaled unit
+        :rtype: dict
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0,
+            "max": self.maximum,
+            "buckets": {f"<2^{bucket}": self.buckets[bucket] for bucket in sorted(self.buckets)}
+        }
+
+
+class HistogramCollector:
+    """
+    A collector that aggregates the metrics of every calculation into histograms.
+    Any object with a record(metrics) method can be plugged into Calculator.collector,
+    this one keeps only aggregates so its memory doesn't grow with the number of calculations.
+
+    The "shapes" histograms group the calculation times by the size of the expression (a power of two of its
+    token count) and its outcome, so the slow expression shapes stand out.
+
+    Attributes:
+        expressions (int): The number of recorded calculations.
+        cache_hits (int): The calculations that took their expression from the cache.
+        stages (dict): A histogram of the wall time of every stage, in microseconds.
+        tokens (Histogram): The token counts.
+        operator_stack (Histogram): The operator stack high-water marks.
+        operand_stack (Histogram): The operand stack high-water marks.
+        errors (dict): The number of calculations that ended with every error category.
+        failed_checks (dict): The number of expressions that failed every validation check.
+        shapes (dict): A histogram of the total wall time by (token count bucket, outcome), in microseconds.
+
+    Methods:
+        record(metrics):
+            Adds the metrics of a calculation.
+
+        export():
+            Exports the aggregates as a JSON serializable dictionary.
+
+        reset():
+            Drops everything recorded.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.expressions = 0
+        self.cache_hits = 0
+        self.stages = {}
+        self.tokens = Histogram()
+        self.operator_stack = Histogram()
+        self.operand_stack = Histogram()
+        self.errors = {}
+        self.failed_checks = {}
+        self.shapes = {}
+
+    def record(self, metrics):
+        """
+        Adds the metrics of a calculation to the aggregates.
+        :param metrics: The metrics of the calculation
+        :type metrics: ExpressionMetrics
+        """
+        self.expressions += 1
+        self.cache_hits += metrics.cache_hit
+        for stage, seconds in metrics.stage_seconds.items():
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(1e6)
+            histogram.add(seconds)
+        outcome = metrics.error or "ok"
+        if metrics.error is not None:
+            self.errors[metrics.error] = self.errors.get(metrics.error, 0) + 1
+        for message_id in metrics.failed_checks:
+            self.failed_checks[message_id] = self.failed_checks.get(message_id, 0) + 1
+        size = "untokenized"
+        if metrics.token_count is not None:
+            self.tokens.add(metrics.token_count)
+            size = f"<2^{metrics.token_count.bit_length()} tokens"
+        if metrics.operator_stack_peak is not None:
+            self.operator_stack.add(metrics.operator_stack_peak)
+            self.operand_stack.add(metrics.operand_stack_peak)
+        shape = f"{size}, {outcome}"
+        histogram = self.shapes.get(shape)
+        if histogram is None:
+            histogram = self.shapes[shape] = Histogram(1e6)
+        histogram.add(metrics.total_seconds)
+
+    def export(self):
+        """
+        :return: The aggregates, the time histograms are bucketed by microseconds
+        :rtype: dict
+        """
+        return {
+            "expressions": self.expressions,
+            "cache_hits": self.cache_hits,
+            "stages": {stage: histogram.to_dict() for stage, histogram in self.stages.items()},
+            "tokens": self.tokens.to_dict(),
+            "operator_stack": self.operator_stack.to_dict(),
+            "operand_stack": self.operand_stack.to_dict(),
+            "errors": dict(self.errors),
+            "failed_checks": dict(self.failed_checks),
+            "shapes": {shape: histogram.to_dict() for shape, histogram in sorted(self.shapes.items())}
+        }
+
+
+def operator_stack_peak(token_list):
+    """
+    Replays the pushes and pops of infix_to_postfix on a validated token list, without producing any output.
+    :return: The deepest the operator stack of the conversion gets
+    :rtype: int
+    """
+    priorities = []
+    peak = 0
+    for token in token_list:
+        if token.__class__ is not str:
+            continue  # Operands
+        if token == "(":
+            priorities.append(-1)
+        elif token == ")":
+            while priorities and priorities[-1] >= 0:
+                priorities.pop()
+            priorities.pop()
+            if priorities and priorities[-1] == -2:  # A sign minus
+                priorities.pop()
+        elif token == "-(":
+            priorities += (-2, -1)
+        else:
+            opcode = OPCODES.get(token)
+            if opcode is None:
+                continue
+            priority = PRIORITIES[opcode]
+            while priorities and (priorities[-1] > priority or
+                                  (priorities[-1] == priority and not RIGHT_ASSOCIATIVE[opcode])):
+                priorities.pop()
+            priorities.append(priority)
+        if len(priorities) > peak:
+            peak = len(priorities)
+    return peak
+
+
+def operand_stack_peak(postfix_expression):
+    """
+    Replays the pushes and pops of evaluate_postfix on a postfix expression, without evaluating anything.
+    :return: The deepest the operand stack of the evaluation gets
+    :rtype: int
+    """
+    depth = peak = 0
+    for token, _ in postfix_expression:
+        opcode = OPCODES.get(token) if token.__class__ is str else None
+        if opcode is None:
+            if token.__class__ is OperatorChain:
+                depth -= token.count - 1
+            elif token.__class__ is not str:  # An operand, the other strings are markers the evaluation skips
+                depth += 1
+                if depth > peak:
+                    peak = depth
+            elif token == POWER_MODULO:
+                depth -= 2
+        elif ARITIES[opcode] == 2:
+            depth -= 1
+    return peak
+
@@ -7,7 +7,8 @@ class InvalidExpressionException(Exception):
         """
         Initialize the exception with a problematic expression message.
 
-        :param message: The error message to display.
+        :param message: The error message to display, or a DiagnosticReport that renders it on demand.
         """
         self.message = message
+        self.diagnostics = getattr(message, "diagnostics", [])
         super().__init__(message)
@@ -0,0 +1,254 @@
+import re
+from itertools import repeat
+
+from invalid_character_exception import InvalidCharacterException
+from invalid_decimal_point_exception import InvalidDecimalPointException
+from operators import Operator
+from variable import Variable
+import preprocessor_utils
+import tokenization_utils
+
+_OPERATOR_CHARACTERS = frozenset(key for key in Operator.get_operators_keys() if key != "u")
+# Characters after which a minus starts a minus sequence (see preprocessor_utils.reduce_minuses)
+_MINUS_SEQUENCE_STARTERS = _OPERATOR_CHARACTERS | {"("}
+
+_NUMBER, _MINUSES, _SYMBOL, _IDENTIFIER, _OTHER = 1, 2, 3, 4, 5
+
+
+def _token_pattern(identifier):
+    return re.compile(
+        r"([0-9]+\.?[0-9]*|\.[0-9]+)"  # Numbers, a decimal point is only valid next to a digit
+        r"|(-+)"  # Minus sequences
+        r"|([()" + "".join(re.escape(char) for char in _OPERATOR_CHARACTERS if char != "-") + r"])"
+        r"|(" + identifier + r")"  # Variable names
+        r"|(.)",  # Anything else is an invalid character or a stand-alone decimal point
+        re.DOTALL)
+
+
+_TOKEN_PATTERN = _token_pattern(r"(?!)")  # Variables are not part of the calculator grammar
+_VARIABLES_TOKEN_PATTERN = _token_pattern(r"[A-Za-z_][A-Za-z0-9_]*")
+_MINUS_SEQUENCE_PATTERN = re.compile(r"-+")
+
+
+def scan(expression, allow_variables=False, number=float, meter=None):
+    """
+    Turns a raw expression into a list of tokens in a single pass over the input.
+    Fuses the preprocessing steps (whitespace removal, character check, minus sequence reduction and
+    special minuses marking), the decimal point check and the tokenization, and produces the same token
+    list as running them one after the other.
+
+    The scanner does not produce diagnostics: when it finds anything the separate steps would report
+    (an invalid character, a misplaced decimal point or an invalid number), it returns None and the
+    caller should run the separate steps to get the error message.
+
+    :param expression: The raw expression
+    :type expression: str
+    :param allow_variables: Accept variable names (letters, digits and underscores) as operands
+    :type allow_variables: bool
+    :param number: The type the numbers with a fraction part are read as, Decimal reads them exactly
+    :type number: type
+    :param meter: The budget of the evaluation, checked for every token (see evaluation_budget)
+    :type meter: BudgetMeter
+    :return: The token list, an empty list for an empty expression, or None if the expression has errors
+    :rtype: list or None
+    :raise BudgetExceededException: if the budget is exceeded
+    """
+    token_list, _ = _scan(expression.replace(" ", ""), allow_variables, number, meter=meter)
+    return token_list
+
+
+def scan_into(expression, tokens, offsets=None):
+    """
+    Scans a raw expression like scan(), into the given containers instead of a list.
+    :param expression: The raw expression
+    :type expression: str
+    :param tokens: The container the tokens are appended to, any object with an append method
+    :param offsets: A container the position of every token in the expression without whitespaces is
+        appended to, if given
+    :return: False if the expression has errors, the caller should run the separate steps to get the error message
+    :rtype: bool
+    """
+    _, error = _scan(expression.replace(" ", ""), False, float, tokens, offsets)
+    return error is None
+
+
+def _scan(expression, allow_variables, number_type=float, tokens=None, offsets=None, meter=None):
+    """
+    Scans an expression without whitespaces.
+    :param tokens: The container the tokens are appended to, a new list by default
+    :param offsets: A container the position of every token in the expression is appended to, if given
+    :param meter: The budget of the evaluation, checked for every token, if given
+    :return: The tokens and None, or None and the match of the first error found
+    :rtype: tuple
+    """
+    pattern = _VARIABLES_TOKEN_PATTERN if allow_variables else _TOKEN_PATTERN
+    expression_length = len(expression)
+    if tokens is None:
+        tokens = []
+    append = tokens.append
+    negative = True  # The sign of a minus sequence, toggles with every minus like in reduce_minuses
+    previous = None  # The previous character of the reduced expression
+    previous_kind = None
+    sign = False  # True if the previous reduced minus is a sign minus
+
+    for match in pattern.finditer(expression):
+        kind = match.lastindex
+        text = match.group()
+
+        if kind == _NUMBER:
+            if previous_kind == _NUMBER:
+                return None, match  # Two numbers in a row are split by a second decimal point
+            if sign:
+                text = "-" + text
+                sign = False
+            if text[-1] == ".":
+                append(number_type(text))
+            else:
+                number = float(text)
+                if number.is_integer():
+                    try:
+                        append(int(text))
+                    except ValueError:
+                        return None, match  # An integer with a decimal point, tokenization fails on it
+                else:
+                    append(number if number_type is float else number_type(text))
+            previous = text[-1]
+
+        elif kind == _MINUSES:
+            minuses = len(text)
+            start = match.start()
+            if start and expression[start - 1] not in _MINUS_SEQUENCE_STARTERS:
+                append("-")  # The first minus is a binary minus
+                previous = "-"
+                minuses -= 1
+            if minuses:
+                if not minuses % 2:
+                    negative = not negative
+                if match.end() == expression_length:
+                    # The sequence is never closed, only a lone odd sequence is kept
+                    if previous is None and negative:
+                        append("u")
+                elif negative:
+                    if previous is None or previous == "(":
+                        append("u")  # Unary minus
+                    elif previous in _OPERATOR_CHARACTERS:
+                        sign = True  # Sign minus, belongs to the next number or parentheses
+                    else:
+                        append("-")
+                    previous = "-"
+
+        elif kind == _SYMBOL:
+            if sign:
+                text = "-" + text  # "-(" for a sign minus before parentheses
+                sign = False
+            append(text)
+            previous = text[-1]
+
+        elif kind == _IDENTIFIER:
+            append(Variable(text, sign))
+            sign = False
+            previous = text[-1]
+
+        else:
+            return None, match
+
+        previous_kind = kind
+        if offsets is not None:
+            offsets.extend(repeat(match.start(), len(tokens) - len(offsets)))
+        if meter is not None:
+            meter.check_tokens(len(tokens))
+
+    return tokens, None
+
+
+def canonicalize(expression):
+    """
+    Removes the whitespaces and reduces the minus sequences of an expression, giving the same result as
+    preprocessor_utils.reduce_minuses in a single pass.
+    :param expression: The raw expression
+    :type expression: str
+    :return: The canonical form of the expression
+    :rtype: str
+    """
+    expression = expression.replace(" ", "")
+    if expression and expression.count("-") == len(expression):
+        return "-" if len(expression) % 2 else ""  # Only minuses, an odd sequence is kept
+    expression_length = len(expression)
+    negative = True
+
+    def reduce_sequence(match):
+        nonlocal negative
+        minuses = len(match.group())
+        start = match.start()
+        reduced = ""
+        if start and expression[start - 1] not in _MINUS_SEQUENCE_STARTERS:
+            reduced = "-"  # The first minus is a binary minus
+            minuses -= 1
+        if minuses:
+            if not minuses % 2:
+                negative = not negative
+            if negative and match.end() != expression_length:
+                reduced += "-"
+        return reduced
+
+    return _MINUS_SEQUENCE_PATTERN.sub(reduce_sequence, expression)
+
+
+def tokenize(expression, allow_variables=False, number=float, meter=None):
+    """
+    Turns a raw expression into a list of tokens like scan(), but raises the error the separate preprocessing
+    and tokenization steps find when the expression has errors. Nothing is printed.
+    :param expression: The raw expression
+    :type expression: str
+    :param allow_variables: Accept variable names (letters, digits and underscores) as operands
+    :type allow_variables: bool
+    :param number: The type the numbers with a fraction part are read as, Decimal reads them exactly
+    :type number: type
+    :param meter: The budget of the evaluation, checked for every token (see evaluation_budget)
+    :type meter: BudgetMeter
+    :return: The token list, an empty list for an empty expression
+    :rtype: list
+    :raise InvalidCharacterException: if invalid characters appear in the expression
+    :raise InvalidDecimalPointException: if the decimal points are misplaced
+    :raise ValueError: if an integer is written with a decimal point
+    :raise BudgetExceededException: if the budget is exceeded
+    """
+    expression = expression.replace(" ", "")
+    token_list, error = _scan(expression, allow_variables, number, meter=meter)
+    if token_list is None and allow_variables:
+        _raise_scan_error(expression, error)
+    elif token_list is None:
+        expression = preprocessor_utils.only_valid_characters_check(expression)
+        expression = preprocessor_utils.mark_special_minuses(preprocessor_utils.reduce_minuses(expression))
+        token_list = tokenization_utils.tokenize(tokenization_utils.decimal_point_check(expression))
+    return token_list
+
+
+def _raise_scan_error(expression, error):
+    """
+    Raises the error found while scanning an expression with variables. The separate preprocessing steps
+    can't be used to report it, they don't know about variable names.
+    :param expression: The expression without whitespaces
+    :type expression: str
+    :param error: The match of the first error found
+    :type error: re.Match
+    """
+    kind, text, position = error.lastindex, error.group(), error.start()
+    if kind == _NUMBER and text[0] != ".":
+        int(text)  # An integer with a decimal point, raises the same ValueError as the tokenization
+    if kind == _OTHER and text != ".":
+        invalid_characters = []
+        checked_expression = ""
+        for match in _VARIABLES_TOKEN_PATTERN.finditer(expression):
+            if match.lastindex == _OTHER and match.group() != ".":
+                if match.group() not in invalid_characters:
+                    invalid_characters.append(match.group())
+                checked_expression += "\033[91m\033[1m" + match.group() + "\033[0m"
+            else:
+                checked_expression += match.group()
+        raise InvalidCharacterException(f"{checked_expression}\n\033[91mInvalid Characters: \033[0m"
+                                        f"{invalid_characters}")
+    raise InvalidDecimalPointException(f"{expression[:position]}\033[91m\033[1m.↙\033[0m{expression[position + 1:]}"
+                                       f"\n\n\033[91mInvalid Decimal Point: \033[0m"
+                                       f"Stand-alone points and Multiple decimal points in one number "
+                                       f"are not allowed.")
@@ -1,8 +1,15 @@
+import argparse
 import sys
 import time
 import history_utils
+from history_store import HistoryStore, DEFAULT_HISTORY_SIZE
 from calculator import Calculator
 from colors import Colors
+from evaluation_engine import EvaluationEngine
+from bulk_evaluation import evaluate_file, OUTPUT_FORMATS
+from exact_arithmetic import MODES, DEFAULT_PRECISION
+
+STREAM_BUFFER_LINES = 4096  # The number of results written to the output at once in stream mode
 
 
 def welcome_animation():
@@ -34,7 +41,95 @@ def welcome_animation():
     time.sleep(0.5)
 
 
-def main():
+def read_expressions(file):
+    """
+    Reads the expressions of a file or a stream lazily, one expression per line.
+    :param file: The file to read from
+    :type file: TextIO
+    :return: The expressions, without the line endings
+    :rtype: Iterator[str]
+    """
+    for line in file:
+        yield line.rstrip("\r\n")
+
+
+def format_result(result):
+    """
+    Formats the result of an expression as a plain line for the stream mode.
+    :param result: The result of the expression
+    :type result: EvaluationResult
+    :return: The value, or "error:" and the error code
+    :rtype: str
+    """
+    if result.ok:
+        return str(result.value)
+    return f"error:{result.error_code}"
+
+
+def stream(input_file, output_file, exact=None, precision=DEFAULT_PRECISION):
+    """
+    Evaluates every line of the input and writes one plain result or error code per line to the output.
+    No animation, colors or history, the output is written in blocks of STREAM_BUFFER_LINES lines.
+    :param input_file: The file the expressions are read from
+    :type input_file: TextIO
+    :param output_file: The file the results are written to
+    :type output_file: TextIO
+    :param exact: The exact mode, "fraction" or "decimal", None for float arithmetic
+    :type exact: str
+    :param precision: The number of significant digits of the results in decimal mode
+    :type precision: int
+    """
+    evaluate = EvaluationEngine(exact=exact, precision=precision).evaluate
+    buffer = []
+    for expression in read_expressions(input_file):
+        buffer.append(format_result(evaluate(expression)))
+        if len(buffer) >= STREAM_BUFFER_LINES:
+            output_file.write("\n".join(buffer) + "\n")
+            buffer.clear()
+    if buffer:
+        output_file.write("\n".join(buffer) + "\n")
+    output_file.flush()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="MAX CALCULATOR")
+    parser.add_argument("--stream", action="store_true",
+                        help="evaluate one expression per line of the input and print one result per line")
+    parser.add_argument("--bulk", metavar="OUTPUT",
+                        help="evaluate the --input file through a memory map and write the results to OUTPUT")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="npy",
+                        help="the format of the bulk output (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="the number of processes of the bulk mode, 0 for every CPU (default: %(default)s)")
+    parser.add_argument("--input", metavar="FILE", help="read the expressions from a file instead of stdin")
+    parser.add_argument("--exact", choices=MODES, help="evaluate with exact fractions or decimals instead of floats")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION,
+                        help="the number of significant digits of decimal results (default: %(default)s)")
+    parser.add_argument("--history-size", type=int, default=DEFAULT_HISTORY_SIZE,
+                        help="the number of recent calculations kept in memory (default: %(default)s)")
+    parser.add_argument("--history-file", metavar="FILE",
+                        help="log every calculation to this file, and load the recent ones from it at startup")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.bulk:
+        if not arguments.input:
+            sys.exit("--bulk needs an --input file")
+        evaluate_file(arguments.input, arguments.bulk, arguments.format, arguments.workers or None)
+        return
+    if arguments.stream:
+        if arguments.exact:
+            sys.set_int_max_str_digits(0)  # Exact integer results can have any number of digits
+        if arguments.input:
+            with open(arguments.input, encoding="utf-8") as input_file:
+                stream(input_file, sys.stdout, arguments.exact, arguments.precision)
+        else:
+            stream(sys.stdin, sys.stdout, arguments.exact, arguments.precision)
+        return
+
+    Calculator.expression_history = HistoryStore(arguments.history_size, arguments.history_file)
     try:
         welcome_animation()  # Show the animation at the start
 
@@ -59,6 +154,8 @@ def main():
 
     except KeyboardInterrupt:
         print(f"\n\n{Colors.BLUE}Goodbye! See you next time!{Colors.ENDC}")
+    finally:
+        Calculator.expression_history.close()  # Syncs the entries logged since the last fsync
 
 
 if __name__ == "__main__":
@@ -176,3 +176,15 @@ class Operator(ABC):
         """
         operator_data = Operator.get_operator_data(operator)
         return operator_data["operation"]
+
+
+# Compact opcode tables precomputed from operators_dict when the module loads. Every operator has a small integer
+# opcode and its attributes are at that position of the tables, so the hot loops look an operator up once and then
+# index tuples instead of calling the static methods above.
+OPERATOR_TOKENS = tuple(Operator.operators_dict)
+OPCODES = {operator: opcode for opcode, operator in enumerate(OPERATOR_TOKENS)}
+ARITIES = tuple(2 if data["type"] == "binary" else 1 for data in Operator.operators_dict.values())
+PRIORITIES = tuple(data["priority"] for data in Operator.operators_dict.values())
+# Right operators are right associative, an operator of the same priority in the stack is not popped before them
+RIGHT_ASSOCIATIVE = tuple(data["position"] == "right" for data in Operator.operators_dict.values())
+OPERATIONS = tuple(data["operation"] for data in Operator.operators_dict.values())
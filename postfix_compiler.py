@@ -0,0 +1,158 @@
+from operators import OPCODES, ARITIES, OPERATIONS
+from variable import Variable
+from exact_arithmetic import NUMBER_TYPES
+from unary_operator import FACTORIAL_LIMIT
+import postfix_evaluation_utils
+
+# Longer postfix expressions are left to evaluate_postfix, compiling them would take longer than it saves
+MAX_COMPILED_LENGTH = 10000
+
+# The name every operation is bound to in the generated code
+_OPERATION_NAMES = {
+    "+": "_add", "-": "_subtract", "*": "_multiply", "/": "_divide", "^": "_power", "%": "_modulo",
+    "$": "_max", "&": "_min", "@": "_avg", "u": "_negative", "~": "_negation", "!": "_factorial", "#": "_hashtag"
+}
+
+# The float operations of BinaryOperator and UnaryOperator that are simple enough to be written inline,
+# {0} is the left operand (or the only operand) and the result, {1} is the right operand
+_INLINE_OPERATIONS = {
+    "+": "{0} = {0} + {1}",
+    "-": "{0} = {0} - {1}",
+    "*": "{0} = {0} * {1}",
+    "/": "{0} = {0} / {1}",
+    "%": "{0} = {0} % {1}",
+    "$": "{0} = {1} if {1} > {0} else {0}",  # Like max(), the left operand wins a tie
+    "&": "{0} = {1} if {1} < {0} else {0}",  # Like min()
+    "@": "{0} = ({0} + {1}) / 2",
+    "u": "{0} = -{0}",
+    "~": "{0} = -{0}"
+}
+
+
+class CompiledExpression:
+    """
+    A postfix expression compiled into a Python function. The function runs the operations of the expression one
+    after the other with the operands in local variables, so nothing is looked up while it runs: the operators,
+    their types and the operand types are all resolved when the expression is compiled.
+    The domain checks of evaluate_postfix are written inline before the operations they guard, and raise the same
+    errors with the same token indexes.
+
+    Attributes:
+        source (str): The source code of the function.
+
+    Methods:
+        evaluate(token_list, variables, arithmetic):
+            Calls the compiled function.
+    """
+    __slots__ = ("source", "_function")
+
+    def __init__(self, source, function):
+        self.source = source
+        self._function = function
+
+    def evaluate(self, token_list=None, variables=None, arithmetic=None):
+        """
+        Evaluates the expression. The token list and the operations were bound when the expression was compiled,
+        the parameters are the ones of evaluate_postfix so both can be called the same way.
+        :param variables: The values of the variables in the expression by name
+        :type variables: dict
+        :return: The result of the evaluated expression.
+        :rtype: float
+        :raises ValueError: If the expression contains runtime errors.
+        :raises ZeroDivisionError: when a division by zero occurs.
+        """
+        return self._function(variables or {})
+
+
+def compile_postfix(postfix_expression, token_list, arithmetic=None):
+    """
+    Compiles a postfix expression into a Python function with the same results and errors as evaluate_postfix.
+    Every stack slot of evaluate_postfix becomes a local variable of the function, so the function has no stack.
+    :param postfix_expression: The postfix expression, a list of (token, index) pairs
+    :type postfix_expression: list
+    :param token_list: The token list of the expression, used to highlight errors
+    :type token_list: list
+    :param arithmetic: The operations of the exact mode, the float operations of Operator by default
+    :type arithmetic: ExactArithmetic
+    :return: The compiled expression, or None if the postfix expression is too long or invalid and should be left
+        to evaluate_postfix
+    :rtype: CompiledExpression or None
+    """
+    if len(postfix_expression) > MAX_COMPILED_LENGTH:
+        return None
+    inline_operations = _INLINE_OPERATIONS if arithmetic is None else {}
+    factorial_limit = FACTORIAL_LIMIT if arithmetic is None else arithmetic.factorial_limit
+    factorial_message_id = postfix_evaluation_utils.factorial_domain_message_id(factorial_limit)
+    namespace = {
+        "_tokens": token_list,
+        "_unbound_variable": postfix_evaluation_utils.unbound_variable_error,
+        "_zero_division": postfix_evaluation_utils.zero_division_error,
+        "_domain_error": postfix_evaluation_utils.domain_error
+    }
+    indexes = []  # The token indexes the errors highlight, only read when an error is raised
+    lines = []
+    stack = []  # The token index of every stack slot, the slot at depth n is the local variable sn
+
+    def error_index(index):
+        indexes.append(index)
+        return f"_indexes[{len(indexes) - 1}]"
+
+    for token, index in postfix_expression:
+        slot = f"s{len(stack)}"
+        if isinstance(token, NUMBER_TYPES):
+            if token.__class__ is int or token.__class__ is float:
+                lines.append(f"{slot} = {token!r}")
+            else:
+                name = f"_constant{len(namespace)}"
+                namespace[name] = token
+                lines.append(f"{slot} = {name}")
+            stack.append(index)
+
+        elif token.__class__ is Variable:
+            lines.append("try:")
+            lines.append(f"    {slot} = {'-' if token.negative else ''}variables[{token.name!r}]")
+            lines.append("except KeyError:")
+            lines.append(f"    raise _unbound_variable({error_index(index)}, _tokens)")
+            stack.append(index)
+
+        elif token in OPCODES:
+            operation = OPERATIONS[OPCODES[token]] if arithmetic is None else arithmetic.operations[token]
+            if ARITIES[OPCODES[token]] == 2:
+                if len(stack) < 2:
+                    return None
+                right_index, left_index = stack.pop(), stack.pop()
+                left, right = f"s{len(stack)}", f"s{len(stack) + 1}"
+                if token == "/":
+                    lines.append(f"if {right} == 0:")
+                    lines.append(f"    raise _zero_division({index}, {error_index(right_index)}, _tokens)")
+                if token in inline_operations:
+                    lines.append(inline_operations[token].format(left, right))
+                else:
+                    namespace[_OPERATION_NAMES[token]] = operation
+                    lines.append(f"{left} = {_OPERATION_NAMES[token]}({left}, {right})")
+                stack.append((left_index, right_index))
+            else:
+                if not stack:
+                    return None
+                operand = f"s{len(stack) - 1}"
+                if token == "!":
+                    limit = "" if factorial_limit is None else f" or {operand} > {factorial_limit}"
+                    lines.append(f"if {operand} < 0 or not ({operand} == int({operand})){limit}:")
+                    lines.append(
+                        f"    raise _domain_error('{factorial_message_id}', {error_index(stack[-1])}, _tokens)")
+                elif token == "#":
+                    lines.append(f"if {operand} < 0:")
+                    lines.append(f"    raise _domain_error('hashtag_domain', {error_index(stack[-1])}, _tokens)")
+                if token in inline_operations:
+                    lines.append(inline_operations[token].format(operand))
+                else:
+                    namespace[_OPERATION_NAMES[token]] = operation
+                    lines.append(f"{operand} = {_OPERATION_NAMES[token]}({operand})")
+        # Anything else is a marker evaluate_postfix skips, like the "s" of a sign minus before parentheses
+
+    if len(stack) != 1:
+        return None
+    namespace["_indexes"] = indexes
+    source = "def _compiled_expression(variables):\n" + "".join(f"    {line}\n" for line in lines) + "    return s0\n"
+    exec(compile(source, "<compiled expression>", "exec"), namespace)
+    return CompiledExpression(source, namespace["_compiled_expression"])
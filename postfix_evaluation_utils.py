@@ -1,3 +1,13 @@
+import diagnostics
+from operators import OPCODES, ARITIES, PRIORITIES, RIGHT_ASSOCIATIVE, OPERATIONS
+from variable import Variable
+from unary_operator import FACTORIAL_LIMIT
+from exact_arithmetic import NUMBER_TYPES
+from postfix_optimization_utils import POWER_MODULO, OperatorChain, power_modulo, evaluate_chain
+
+_OPERAND_TYPES = NUMBER_TYPES + (Variable,)
+
+
 def highlight_infix_error(infix_tokens, problematic_index):
     """
     Highlights the problematic token in the infix expression using its index.
@@ -20,3 +30,232 @@ def highlight_infix_error(infix_tokens, problematic_index):
         else:
             highlighted_expression += str(token)
     return highlighted_expression
+
+
+def infix_to_postfix(token_list):
+    """
+    Converts an infix expression to postfix notation while preserving token indexes to present them
+    in an error message later if needed in a convenient way.
+    :param token_list: The validated token list of the expression
+    :type token_list: list
+    :return: The postfix expression, a list of (token, index) pairs
+    :rtype: list
+    """
+    output = []
+    operator_stack = []
+    priorities = []  # The priority of every entry of the operator stack, -1 for parentheses and sign minuses
+
+    for index, token in enumerate(token_list):
+        if isinstance(token, _OPERAND_TYPES):  # Numbers and variables go directly to the output
+            output.append((token, index))
+        elif token == "(":
+            operator_stack.append((token, index))
+            priorities.append(-1)
+        elif token == ")":
+            # Pop until matching opening parenthesis
+            while priorities and priorities[-1] >= 0:
+                output.append(operator_stack.pop())
+                priorities.pop()
+            operator_stack.pop()  # Remove the opening parenthesis
+            priorities.pop()
+
+            # Check if a sign minus ("s") is in the stack
+            if operator_stack and operator_stack[-1][0] == "s":
+                output.append(operator_stack.pop())
+                priorities.pop()
+        elif token == "-(":
+            # Treat "-(" as a signal for sign minus
+            operator_stack.append(("s", index))
+            operator_stack.append(("(", index))
+            priorities += (-1, -1)
+        else:
+            opcode = OPCODES.get(token)
+            if opcode is None:
+                continue
+            # Handle valid operators based on priority and position, the parentheses stop the popping
+            priority = PRIORITIES[opcode]
+            right_associative = RIGHT_ASSOCIATIVE[opcode]
+            while priorities and (priorities[-1] > priority or
+                                  (priorities[-1] == priority and not right_associative)):
+                output.append(operator_stack.pop())
+                priorities.pop()
+            operator_stack.append((token, index))
+            priorities.append(priority)
+
+    # Pop all remaining operators in the stack
+    while operator_stack:
+        output.append(operator_stack.pop())
+
+    return output
+
+
+def evaluate_postfix(postfix_expression, token_list, variables=None, arithmetic=None, meter=None):
+    """
+    Evaluates the postfix expression.
+    :param postfix_expression: The postfix expression, a list of (token, index) pairs
+    :type postfix_expression: list
+    :param token_list: The token list of the expression, used to highlight errors
+    :type token_list: list
+    :param variables: The values of the variables in the expression by name
+    :type variables: dict
+    :param arithmetic: The operations of the exact mode, the float operations of Operator by default
+    :type arithmetic: ExactArithmetic
+    :param meter: The budget of the evaluation, checked before every operator and on every result
+        (see evaluation_budget)
+    :type meter: BudgetMeter
+    :return: The result of the evaluated expression.
+    :rtype: float
+    :raises ValueError: If the postfix expression is invalid or contains runtime errors.
+    :raises ZeroDivisionError: when a division by zero occurs.
+    :raises BudgetExceededException: if the budget is exceeded.
+    """
+    stack = []
+    operations = None if arithmetic is None else arithmetic.operations
+    factorial_limit = FACTORIAL_LIMIT if arithmetic is None else arithmetic.factorial_limit
+    factorial_message_id = factorial_domain_message_id(factorial_limit)
+
+    for token, index in postfix_expression:
+        if isinstance(token, NUMBER_TYPES):  # Operands
+            stack.append((token, index))
+        elif token.__class__ is Variable:
+            try:
+                stack.append((token.value(variables or {}), index))
+            except KeyError:
+                raise unbound_variable_error(index, token_list)
+        else:
+            opcode = OPCODES.get(token)
+            if opcode is None:
+                if token == POWER_MODULO:  # The fused "(a ^ b) % m" of postfix_optimization_utils
+                    try:
+                        modulus, modulus_index = stack.pop()
+                        exponent, exponent_index = stack.pop()
+                        base, base_index = stack.pop()
+                    except IndexError:  # Incase the checks somehow don't catch it before
+                        raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
+                    if meter is not None:
+                        meter.step("%", base, modulus)
+                    result = power_modulo(base, exponent, modulus, operations)
+                    if meter is not None:
+                        meter.check_value(result)
+                    stack.append((result, ((base_index, exponent_index), modulus_index)))
+                elif token.__class__ is OperatorChain:  # The n-ary "a + b + c" of postfix_optimization_utils
+                    count = token.count
+                    if len(stack) < count:  # Incase the checks somehow don't catch it before
+                        raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
+                    operands = stack[-count:]
+                    del stack[-count:]
+                    result = evaluate_chain(token, [operand for operand, _ in operands], operations, meter)
+                    stack.append((result, (operands[0][1], operands[-1][1])))
+                continue  # Anything else is a marker, like the "s" of a sign minus before parentheses
+            operation = OPERATIONS[opcode] if operations is None else operations[token]
+
+            if ARITIES[opcode] == 2:
+                # Binary operator requires two operands
+                try:
+                    right_operand, right_index = stack.pop()
+                    left_operand, left_index = stack.pop()
+                except IndexError:  # Incase the checks somehow don't catch it before
+                    raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
+
+                # Division by zero check
+                if token == "/" and right_operand == 0:
+                    raise zero_division_error(index, right_index, token_list)
+
+                # Perform the operation
+                if meter is not None:
+                    meter.step(token, left_operand, right_operand)
+                result = operation(left_operand, right_operand)
+                if meter is not None:
+                    meter.check_value(result)
+                combined_index = (left_index, right_index)
+                stack.append((result, combined_index))
+
+            else:
+                # Unary operator requires one operand
+                try:
+                    operand, operand_index = stack.pop()
+                except IndexError:  # Incase the checks somehow don't catch it before
+                    raise ValueError("Invalid postfix expression: insufficient operand for unary operator.")
+
+                if token == "!" and (operand < 0 or not (operand == int(operand)) or
+                                     (factorial_limit is not None and operand > factorial_limit)):
+                    raise domain_error(factorial_message_id, operand_index, token_list)
+
+                if token == "#" and operand < 0:
+                    raise domain_error("hashtag_domain", operand_index, token_list)
+
+                # Perform the operation
+                if meter is not None:
+                    meter.step(token, operand)
+                result = operation(operand)
+                if meter is not None:
+                    meter.check_value(result)
+                stack.append((result, operand_index))
+
+    # Final validation
+    if len(stack) != 1:
+        # Incase the checks somehow don't catch it before
+        raise ValueError("Invalid postfix expression: too many operands or insufficient operators.")
+
+    return stack[0][0]  # Return only the result
+
+
+def unbound_variable_error(index, token_list):
+    """
+    :return: The error of a variable without a value, highlights the variable
+    :rtype: ValueError
+    """
+    return ValueError(diagnostics.Diagnostic("evaluation", "unbound_variable", [(index, index)], token_list))
+
+
+def zero_division_error(operator_index, right_index, token_list):
+    """
+    :param operator_index: The token index of the "/"
+    :type operator_index: int
+    :param right_index: The index of the zero operand, nested like the indexes of evaluate_postfix
+    :type right_index: int or tuple
+    :return: The error of a division by zero, highlights the "/" and the zero operand with its parentheses
+    :rtype: ZeroDivisionError
+    """
+    last = diagnostics.index_span(right_index)[1]
+    if token_list is not None:
+        # The span of the operand ends at its last number or variable, the parentheses it opened close after it
+        last += sum(1 if token == "(" or token == "-(" else -1 if token == ")" else 0
+                    for token in token_list[operator_index + 1:last + 1])
+    return ZeroDivisionError(
+        diagnostics.Diagnostic("evaluation", "zero_division", [(operator_index, last)], token_list))
+
+
+def factorial_domain_message_id(factorial_limit):
+    """
+    :param factorial_limit: The largest factorial of the arithmetic, None for no limit
+    :type factorial_limit: int
+    :return: The message id of a factorial with an invalid operand, which only mentions the limit if there is one
+    :rtype: str
+    """
+    return "factorial_domain" if factorial_limit is not None else "exact_factorial_domain"
+
+
+def domain_error(message_id, operand_index, token_list):
+    """
+    :return: The error of a right unary operator (factorial or hashtag) with an invalid operand,
+        highlights the operand and the operator
+    :rtype: ValueError
+    """
+    first, last = diagnostics.index_span(operand_index)
+    return ValueError(diagnostics.Diagnostic("evaluation", message_id, [(first, last + 1)], token_list))
+
+
+def normalize_result(result):
+    """
+    Converts the result of an evaluation to the number presented to the user.
+    :param result: The evaluated result
+    :type result: int or float
+    :return: The result as a float, or as an int if it is a whole number
+    :rtype: int or float
+    :raises OverflowError: if the result is too big to be converted to a float.
+    """
+    result = float(result)
+    if result.is_integer():
+        result = int(result)
+    return result
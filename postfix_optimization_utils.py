@@ -0,0 +1,188 @@
+import math
+import operator
+import sys
+from functools import reduce
+
+from operators import OPCODES, ARITIES, OPERATIONS
+from exact_arithmetic import NUMBER_TYPES
+from variable import Variable
+
+# The fused "(a ^ b) % m" of fuse_power_modulo, a ternary operator that takes the base, the exponent and the modulus
+POWER_MODULO = "^%"
+
+_POWER = OPERATIONS[OPCODES["^"]]
+_MODULO = OPERATIONS[OPCODES["%"]]
+
+
+def _sum(operands):
+    return sum(operands[1:], operands[0])
+
+
+def _fold_sum(operands):
+    return reduce(operator.add, operands)
+
+
+# The n-ary kernels of the chains of flatten_chains, each one a left fold of its binary operator. Since Python 3.12
+# sum() adds floats with compensation, which doesn't round like the additions one by one, so it's a reduce there
+CHAIN_OPERATIONS = {
+    "+": _sum if sys.version_info < (3, 12) else _fold_sum,
+    "*": math.prod,
+    "$": max,
+    "&": min
+}
+
+
+class OperatorChain:
+    """
+    The n-ary operator of flatten_chains: a chain of the same associative operator, like "a + b + c + d", evaluated
+    at once over its operands.
+
+    Attributes:
+        operator (str): The operator, one of CHAIN_OPERATIONS.
+        count (int): The number of operands, more than two.
+    """
+    __slots__ = ("operator", "count")
+
+    def __init__(self, operator, count):
+        self.operator = operator
+        self.count = count
+
+    def __repr__(self):
+        return f"OperatorChain({self.operator!r}, {self.count})"
+
+    def __eq__(self, other):
+        return isinstance(other, OperatorChain) and self.operator == other.operator and self.count == other.count
+
+    def __hash__(self):
+        return hash((OperatorChain, self.operator, self.count))
+
+
+def flatten_chains(postfix_expression):
+    """
+    An optimization pass over a postfix expression: a chain of the same associative operator, "+", "*", "$" or
+    "&", becomes a single OperatorChain evaluated with sum, math.prod, max or min (see evaluate_chain), instead of
+    a pop, a push and a call for every operator. "a b + c + d +" becomes "a b c d +4".
+
+    Only the left-associative chains the conversion produces are flattened, "(a + b) + c" but not "a + (b + c)",
+    and the kernels fold the operands from the left, so the floats are added and multiplied in the same order and
+    the results are the same. "-", "/", "^" and "@" are left alone.
+
+    Only for float mode, where the chained operators can't fail: the operands are all evaluated before the chain,
+    so their errors are still raised first. For the same reason, a chain with variables, whose values could make
+    an operator fail, is left alone.
+    :param postfix_expression: The postfix expression of infix_to_postfix, a list of (token, index) pairs
+    :type postfix_expression: list
+    :return: The optimized postfix expression, or the same list if there is nothing to flatten
+    :rtype: list
+    """
+    output = []
+    # The (chain operator of the root or None, output position of the root, operand count, has variables) of every
+    # subtree on the evaluation stack
+    subtrees = []
+    flattened = False
+    for pair in postfix_expression:
+        token = pair[0]
+        if isinstance(token, NUMBER_TYPES):
+            subtrees.append((None, 0, 1, False))
+        elif token.__class__ is Variable:
+            subtrees.append((None, 0, 1, True))
+        else:
+            opcode = OPCODES.get(token)
+            if opcode is None:
+                output.append(pair)  # A marker, like the "s" of a sign minus before parentheses
+                continue
+            if ARITIES[opcode] == 1:
+                if not subtrees:
+                    return postfix_expression  # Invalid, left to evaluate_postfix to report
+                subtrees.append((None, 0, 1, subtrees.pop()[3]))
+            else:
+                if len(subtrees) < 2:
+                    return postfix_expression
+                right = subtrees.pop()
+                left = subtrees.pop()
+                variables = left[3] or right[3]
+                if token in CHAIN_OPERATIONS:
+                    count = 2
+                    if left[0] == token and not variables:
+                        output[left[1]] = None  # The chain of the left operand is extended
+                        count = left[2] + 1
+                        pair = (OperatorChain(token, count), pair[1])
+                        flattened = True
+                    subtrees.append((token, len(output), count, variables))
+                else:
+                    subtrees.append((None, 0, 1, variables))
+        output.append(pair)
+    return [pair for pair in output if pair is not None] if flattened else postfix_expression
+
+
+def evaluate_chain(chain, operands, operations=None, meter=None):
+    """
+    Evaluates an OperatorChain.
+    :param chain: The chain
+    :type chain: OperatorChain
+    :param operands: The operands, in order
+    :type operands: list
+    :param operations: The operations of the exact mode, the float operations of Operator by default
+    :type operations: dict
+    :param meter: The budget of the evaluation, checked on every operator of the chain like without the flattening
+    :type meter: BudgetMeter
+    :return: The result
+    :raises BudgetExceededException: if the budget is exceeded.
+    """
+    if operations is None and meter is None:
+        return CHAIN_OPERATIONS[chain.operator](operands)
+    operation = OPERATIONS[OPCODES[chain.operator]] if operations is None else operations[chain.operator]
+    result = operands[0]
+    for operand in operands[1:]:
+        if meter is not None:
+            meter.step(chain.operator, result, operand)
+        result = operation(result, operand)
+        if meter is not None:
+            meter.check_value(result)
+    return result
+
+
+def fuse_power_modulo(postfix_expression):
+    """
+    A peephole pass over a postfix expression: the "a b ^ m %" pattern of "(a ^ b) % m", with a number m, becomes
+    "a b m ^%", a single POWER_MODULO evaluated with the three-argument pow (see power_modulo). The other tokens
+    keep their order and indexes.
+
+    Only for the exact modes, where the power of integers is an exact integer. The float power is math.pow, whose
+    rounded result the three-argument pow would not reproduce. The modulus must be a number, the power is then
+    still the first thing that can fail, so the errors are the ones of the unfused expression.
+    :param postfix_expression: The postfix expression of infix_to_postfix, a list of (token, index) pairs
+    :type postfix_expression: list
+    :return: The optimized postfix expression, or the same list if there is nothing to fuse
+    :rtype: list
+    """
+    output = []
+    for pair in postfix_expression:
+        if (pair[0] == "%" and len(output) >= 2 and isinstance(output[-1][0], NUMBER_TYPES) and
+                output[-2][0] == "^"):
+            modulus = output.pop()
+            output[-1] = modulus
+            output.append((POWER_MODULO, pair[1]))
+        else:
+            output.append(pair)
+    return output if len(output) != len(postfix_expression) else postfix_expression
+
+
+def power_modulo(base, exponent, modulus, operations=None):
+    """
+    Evaluates "(base ^ exponent) % modulus". In the exact modes, integers with a non-negative exponent are
+    evaluated with the three-argument pow, which never builds the power and gives the same result as the exact
+    power followed by the floor modulo, also for the powers too big to build, which overflow without the fusion.
+    Anything else runs the two operations of the arithmetic.
+    :param operations: The operations of the exact mode, the float operations of Operator by default
+    :type operations: dict
+    :return: The result
+    :raises ZeroDivisionError: if the modulus is zero, like the modulo.
+    """
+    if operations is None:
+        return _MODULO(_POWER(base, exponent), modulus)
+    if (base.__class__ is int and exponent.__class__ is int and modulus.__class__ is int and exponent >= 0 and
+            modulus != 0):
+        return pow(base, exponent, modulus)
+    # A zero modulus too, the ZeroDivisionError comes after the errors of the power like without the fusion
+    return operations["%"](operations["^"](base, exponent), modulus)
@@ -1,4 +1,4 @@
-from calculator import Operator
+from operators import Operator
 from invalid_character_exception import InvalidCharacterException
 
 
@@ -0,0 +1,263 @@
+import re
+
+from evaluation_engine import EvaluationEngine, EvaluationResult
+from error_codes import HANDLED_ERRORS, error_code
+from exact_arithmetic import DEFAULT_PRECISION
+from variable import Variable
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")  # The variable names of the lexer
+
+
+class CircularReferenceError(ValueError):
+    """
+    Raised when a formula would make a cell depend on itself, directly or through other cells.
+
+    Attributes:
+        cells (list): The names of the cells on the cycles, and of the cells downstream of them.
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+        super().__init__(f"Circular reference between the cells: {', '.join(cells)}")
+
+
+class Cell:
+    """
+    A named formula of a sheet.
+
+    Attributes:
+        formula (str): The formula, an expression whose variables are the names of other cells.
+        compiled (tuple): The (token list, postfix expression) of the formula, None if it failed to compile.
+        dependencies (frozenset): The names of the cells the formula refers to.
+        result (EvaluationResult): The value of the formula, or the error it failed with.
+    """
+    __slots__ = ("formula", "compiled", "dependencies", "result")
+
+    def __init__(self, formula, compiled, dependencies, result):
+        self.formula = formula
+        self.compiled = compiled
+        self.dependencies = dependencies
+        self.result = result
+
+
+class Sheet:
+    """
+    Named cells defined by formulas over other cells, like "b = a * 4 + 1", kept up to date incrementally.
+
+    The cells and their references form a dependency DAG. Every cell keeps its formula compiled by the engine
+    (the postfix expression of infix_to_postfix), so a change only evaluates again the changed cells and the cells
+    downstream of them, once each, in topological order. The rest of the sheet is not touched.
+
+    A formula that fails to compile or evaluate makes its cell hold the error, and the cells that depend on it
+    hold the same error. A reference to a cell that is not defined is an unbound variable error until the cell
+    is defined. A change that would create a cycle raises CircularReferenceError and leaves the sheet unchanged.
+
+    Attributes:
+        _engine (EvaluationEngine): Compiles and evaluates the formulas, with variables.
+        _cells (dict): The cells by name.
+        _dependents (dict): The names of the cells that refer to a name, by name, defined or not.
+        _values (dict): The values of the cells that evaluated successfully, by name, the variables of the formulas.
+
+    Methods:
+        set(name, formula):
+            Defines or redefines a cell.
+
+        define(statement):
+            Defines a cell from a "name = formula" statement.
+
+        update(formulas):
+            Defines or redefines many cells with a single recalculation.
+
+        delete(name):
+            Removes a cell.
+
+        value(name):
+            Returns the value of a cell.
+    """
+
+    def __init__(self, exact=None, precision=DEFAULT_PRECISION):
+        """
+        :param exact: The exact mode, "fraction" or "decimal" (see exact_arithmetic), None for float arithmetic
+        :type exact: str
+        :param precision: The number of significant digits of the results in decimal mode
+        :type precision: int
+        """
+        self._engine = EvaluationEngine(allow_variables=True, exact=exact, precision=precision)
+        self._cells = {}
+        self._dependents = {}
+        self._values = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __contains__(self, name):
+        return name in self._cells
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __getitem__(self, name):
+        """
+        :return: The value of the cell, or the error it failed with
+        :rtype: EvaluationResult
+        :raise KeyError: if there is no cell with that name
+        """
+        return self._cells[name].result
+
+    def value(self, name):
+        """
+        :return: The value of the cell, None if it failed
+        :raise KeyError: if there is no cell with that name
+        """
+        return self._cells[name].result.value
+
+    def formula(self, name):
+        return self._cells[name].formula
+
+    def set(self, name, formula):
+        """
+        Defines or redefines a cell, and recalculates the cells downstream of it.
+        :param name: The name of the cell, letters, digits and underscores
+        :type name: str
+        :param formula: The formula of the cell
+        :type formula: str
+        :return: The names of the recalculated cells, in the order they were evaluated
+        :rtype: list
+        :raises ValueError: if the name is not a valid variable name.
+        :raises CircularReferenceError: if the cell would depend on itself.
+        """
+        return self.update({name: formula})
+
+    def define(self, statement):
+        """
+        Defines a cell from a statement like "b = a * 4 + 1".
+        :return: The names of the recalculated cells, in the order they were evaluated
+        :rtype: list
+        :raises ValueError: if the statement is not an assignment to a valid name.
+        :raises CircularReferenceError: if the cell would depend on itself.
+        """
+        name, equals, formula = statement.partition("=")
+        if not equals:
+            raise ValueError(f"Expected a 'name = formula' statement, but got '{statement}'")
+        return self.set(name.strip(), formula)
+
+    def update(self, formulas):
+        """
+        Defines or redefines many cells, in any order, and recalculates every cell downstream of them once.
+        Loading a whole model with a single update evaluates every cell exactly once.
+        :param formulas: The formulas by cell name
+        :type formulas: dict
+        :return: The names of the recalculated cells, in the order they were evaluated
+        :rtype: list
+        :raises ValueError: if a name is not a valid variable name.
+        :raises CircularReferenceError: if a cell would depend on itself, none of the cells are changed then.
+        """
+        for name in formulas:
+            if _NAME.fullmatch(name) is None:
+                raise ValueError(f"'{name}' is not a valid cell name")
+        replaced = {name: self._cells.get(name) for name in formulas}
+        for name, formula in formulas.items():
+            self._replace(name, self._compile(formula))
+        try:
+            return self._recalculate(formulas)
+        except CircularReferenceError:
+            for name, cell in replaced.items():
+                self._replace(name, cell)
+            raise
+
+    def delete(self, name):
+        """
+        Removes a cell, the cells that refer to it get an unbound variable error.
+        :return: The names of the recalculated cells, in the order they were evaluated
+        :rtype: list
+        :raise KeyError: if there is no cell with that name
+        """
+        if name not in self._cells:
+            raise KeyError(name)
+        self._replace(name, None)
+        self._values.pop(name, None)
+        return self._recalculate(self._dependents.get(name, ()))
+
+    def _compile(self, formula):
+        """
+        :return: The cell of a formula, not evaluated yet
+        :rtype: Cell
+        """
+        try:
+            compiled = self._engine.compile(formula)
+        except HANDLED_ERRORS as e:
+            return Cell(formula, None, frozenset(), EvaluationResult(None, e, error_code(e)))
+        dependencies = frozenset() if compiled is None else frozenset(
+            token.name for token in compiled[0] if token.__class__ is Variable)
+        return Cell(formula, compiled, dependencies, None)
+
+    def _replace(self, name, cell):
+        """
+        Puts a cell in place of another, moving the dependency edges. None removes the cell.
+        """
+        old = self._cells.get(name)
+        if old is not None:
+            for dependency in old.dependencies:
+                dependents = self._dependents[dependency]
+                dependents.discard(name)
+                if not dependents:
+                    del self._dependents[dependency]
+        if cell is None:
+            self._cells.pop(name, None)
+            return
+        self._cells[name] = cell
+        for dependency in cell.dependencies:
+            self._dependents.setdefault(dependency, set()).add(name)
+
+    def _dirty(self, names):
+        """
+        :return: The defined cells among the names and every cell downstream of them
+        :rtype: set
+        """
+        cells = self._cells
+        dependents = self._dependents
+        dirty = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in dirty:
+                continue
+            if name in cells:
+                dirty.add(name)
+            pending.extend(dependents.get(name, ()))
+        return dirty
+
+    def _recalculate(self, names):
+        """
+        Evaluates the cells among the names and the cells downstream of them, in topological order.
+        :return: The names of the evaluated cells, in the order they were evaluated
+        :rtype: list
+        :raises CircularReferenceError: if the dirty cells contain a cycle, nothing is evaluated then.
+        """
+        cells = self._cells
+        dirty = self._dirty(names)
+        # Kahn's algorithm on the dirty cells, counting only the dependencies on other dirty cells
+        waiting = {name: sum(dependency in dirty for dependency in cells[name].dependencies) for name in dirty}
+        order = [name for name, count in waiting.items() if count == 0]
+        for name in order:  # The list grows while it is walked
+            for dependent in self._dependents.get(name, ()):
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        order.append(dependent)
+        if len(order) < len(dirty):
+            raise CircularReferenceError(sorted(name for name, count in waiting.items() if count))
+
+        values = self._values
+        evaluate = self._engine.evaluate_compiled
+        for name in order:
+            cell = cells[name]
+            if cell.compiled is not None or cell.result is None:
+                failed = next((cells[dependency].result for dependency in sorted(cell.dependencies)
+                               if dependency in cells and not cells[dependency].result.ok), None)
+                cell.result = failed or evaluate(cell.compiled, values)
+            if cell.result.ok:
+                values[name] = cell.result.value
+            else:
+                values.pop(name, None)
+        return order
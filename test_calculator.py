@@ -1,5 +1,11 @@
+import math
+import traceback
 import pytest
 from calculator import Calculator
+from invalid_expression_exception import InvalidExpressionException
+from unary_operator import UnaryOperator
+from instrumentation import HistogramCollector
+from operators import Operator, OPCODES, OPERATOR_TOKENS, ARITIES, PRIORITIES, RIGHT_ASSOCIATIVE, OPERATIONS
 
 
 @pytest.mark.parametrize("expression", [
@@ -145,3 +151,183 @@ def test_complex_expressions(expression, expected):
         assert result == expected, (
             f"Expected {expected}, got {result} for '{expression}'"
         )
+
+
+def test_expression_cache_hits_and_evictions():
+    cache = Calculator.expression_cache
+    cache.clear()
+    cache.resize(2)
+    try:
+        assert Calculator("1 + 2").calculate() == 3
+        assert Calculator("1+2").calculate() == 3  # Same canonical form, should hit the cache
+        assert Calculator("---1+2").calculate() == 1
+        assert Calculator("2*3").calculate() == 6  # Evicts "1+2"
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1), (
+            f"Unexpected cache counters {stats}"
+        )
+    finally:
+        cache.resize(1024)
+        cache.clear()
+
+
+def test_expression_cache_remembers_failed_validation():
+    cache = Calculator.expression_cache
+    cache.clear()
+    try:
+        assert Calculator("2*^3").calculate() is None
+        assert Calculator("2 * ^ 3").calculate() is None
+        assert cache.stats()["negative_hits"] == 1, (
+            f"Expected the second invalid expression to hit the negative cache, got {cache.stats()}"
+        )
+    finally:
+        cache.clear()
+
+
+def test_negative_cache_raises_a_new_exception():
+    cache = Calculator.expression_cache
+    cache.clear()
+    try:
+        raised = []
+        for _ in range(3):
+            with pytest.raises(InvalidExpressionException) as error:
+                Calculator("2*^3").compile()
+            raised.append(error.value)
+        assert raised[1] is not raised[2] and str(raised[1]) == str(raised[2]), (
+            "Expected every negative cache hit to raise a new exception with the same message"
+        )
+        assert len(traceback.extract_tb(raised[2].__traceback__)) == len(
+            traceback.extract_tb(raised[1].__traceback__)), "Expected the traceback not to grow on every hit"
+    finally:
+        cache.clear()
+
+
+@pytest.mark.parametrize("expression", [
+    "1 + 2", "--5+--3", "5--3", "2*-(3)", "-(~3)", "(10@2)^-.5", "1.+2.5", "3!-2", "---", "5+-", "2*-~3"
+])
+def test_lexer_matches_preprocessor_and_tokenization(expression):
+    lexed, staged = Calculator(expression), Calculator(expression)
+    lexed.lexing()
+    staged.preprocessor()
+    staged.tokenization()
+    assert lexed._expression == staged._expression, (
+        f"Expected {staged._expression} but got {lexed._expression} for '{expression}'"
+    )
+
+
+@pytest.mark.parametrize("expression", ["2*^3", "((((((", "())(", "~(3)", "3!~4", "+", "(2)3", "-(!)"])
+def test_fused_validation_matches_separate_checks(expression):
+    import validation_utils
+    calc = Calculator(expression)
+    calc.lexing()
+    error_positions = validation_utils.validate(calc._expression)
+    for (check, _), positions in zip(validation_utils.CHECKS, error_positions):
+        check_passed, _ = check(calc._expression)
+        assert check_passed == (not positions), (
+            f"{check.__name__} disagrees with the fused validator for '{expression}'"
+        )
+
+
+def test_diagnostics_render_a_window_around_the_error():
+    expression = "+".join(["1"] * 5000) + "+*2"
+    calc = Calculator(expression)
+    calc.lexing()
+    with pytest.raises(Exception) as error:
+        calc.validation()
+    diagnostic, = error.value.diagnostics
+    assert diagnostic.message_id == "misplaced_binary_operator"
+    assert len(str(error.value)) < 1000, "The rendered message should only show the tokens around the error"
+    assert len(diagnostic.render(window=None)) > 10000
+
+
+def test_fail_fast_stops_at_the_first_error():
+    calc = Calculator("(2*^3)(", fail_fast=True)
+    calc.lexing()
+    with pytest.raises(Exception) as error:
+        calc.validation()
+    assert [diagnostic.message_id for diagnostic in error.value.diagnostics] == ["misplaced_binary_operator"]
+
+
+def test_zero_division_of_a_combined_operand():
+    assert Calculator("1/(1-1)").calculate() is None
+
+
+@pytest.mark.parametrize("operand", [0, 1, 5, 20, 169, 170])
+def test_factorial_table(operand):
+    assert UnaryOperator.factorial(operand) == float(math.factorial(operand)), (
+        f"Expected the float factorial of {operand}"
+    )
+    assert UnaryOperator.exact_factorial(operand + 100) == math.factorial(operand + 100), (
+        f"Expected the exact factorial of {operand + 100}"
+    )
+
+
+@pytest.mark.parametrize("operand, expected", [
+    (0, 0),
+    (123, 6),
+    (12.5, 8),
+    (1e20, 1),
+    (1.5e-05, 6),
+    pytest.param(10 ** 5000 - 1, 9 * 5000, id="5000 nines"),
+    pytest.param(7 * 10 ** 12345 + 3, 10, id="12346 digits")
+])
+def test_hashtag_digit_sum(operand, expected):
+    assert UnaryOperator.hashtag(operand) == expected, (
+        f"Expected the digit sum of the operand to be {expected}"
+    )
+
+
+def test_hashtag_of_exponent_notation_result():
+    assert Calculator("(10^20)#").calculate() == 1, "Expected the digit sum of 10^20 to be 1"
+
+
+def test_opcode_tables_match_the_operators_dictionary():
+    for operator in Operator.get_operators_keys():
+        opcode = OPCODES[operator]
+        assert (OPERATOR_TOKENS[opcode] == operator and
+                ARITIES[opcode] == (2 if Operator.get_type(operator) == "binary" else 1) and
+                PRIORITIES[opcode] == Operator.get_priority(operator) and
+                RIGHT_ASSOCIATIVE[opcode] == (Operator.get_position(operator) == "right") and
+                OPERATIONS[opcode] is Operator.get_operation(operator)), f"The opcode tables disagree on {operator}"
+
+
+@pytest.fixture
+def collector():
+    collector = HistogramCollector()
+    Calculator.collector = collector
+    yield collector
+    Calculator.collector = None
+
+
+@pytest.mark.parametrize("expression, error, operator_stack, operand_stack", [
+    ("1 + 2 * 3 ^ 4", None, 3, 4),
+    ("((1 + 1) + 1)", None, 3, 2),
+    ("5 / (2 - 2)", "zero_division", 3, 3),
+    ("2 + * 3", "invalid_expression", None, None),
+    ("3 $ a", "invalid_character", None, None),
+    ("   ", "empty_expression", None, None)
+])
+def test_instrumentation_records_every_calculation(collector, expression, error, operator_stack, operand_stack):
+    Calculator(expression).calculate()
+    exported = collector.export()
+    assert exported["expressions"] == 1 and exported["errors"] == ({error: 1} if error else {}), (
+        f"Expected a single calculation ending with {error} to be recorded for '{expression}'"
+    )
+    if operator_stack is not None:
+        assert (exported["operator_stack"]["max"], exported["operand_stack"]["max"]) == (
+            operator_stack, operand_stack), f"Expected the stack high-water marks of '{expression}'"
+        assert {"lexing", "validation", "infix_to_postfix", "evaluate_postfix"} <= set(exported["stages"])
+    if error == "invalid_expression":
+        assert exported["failed_checks"] == {"misplaced_binary_operator": 1}
+        assert "validation" in exported["stages"] and not any(
+            stage.startswith("check:") for stage in exported["stages"]), "Expected validation to be a single stage"
+
+
+def test_instrumentation_counts_cache_hits(collector):
+    Calculator.expression_cache.clear()
+    for _ in range(3):
+        Calculator("7 * 6").calculate()
+    exported = collector.export()
+    assert (exported["expressions"], exported["cache_hits"], exported["stages"]["lexing"]["count"]) == (3, 2, 1), (
+        "Expected the repeated calculations to skip the compiling stages"
+    )
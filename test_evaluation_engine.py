@@ -0,0 +1,397 @@
+import array
+import io
+import traceback
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+import main_calculator
+from calculator import Calculator
+import error_codes
+import evaluation_engine
+from evaluation_engine import EvaluationEngine
+from evaluation_budget import EvaluationBudget, CancelToken
+from expression_dag import build_dag
+from postfix_compiler import compile_postfix
+import lexer_utils
+import postfix_evaluation_utils
+import postfix_optimization_utils
+import token_stream
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1+2", 3),
+    ("(10 @ 20 ) + (3 ^ 2 ) / (2 & 4)", 19.5),
+    ("12! / ((10@2) ^ (3&5))", 2217600),
+    ("-(~3)", 3)
+])
+def test_evaluate(expression, expected):
+    result = EvaluationEngine().evaluate(expression)
+    assert result.ok and result.value == expected, (
+        f"Expected {expected} for '{expression}', but got {result}"
+    )
+
+
+@pytest.mark.parametrize("expression, error_code", [
+    ("1??2", "invalid_character"),
+    ("3..4", "invalid_decimal_point"),
+    ("2*^3", "invalid_expression"),
+    ("1/0", "zero_division"),
+    ("171!", "value_error"),
+    ("   ", "empty_expression")
+])
+def test_evaluate_errors(expression, error_code):
+    result = EvaluationEngine().evaluate(expression)
+    assert result.value is None and result.error_code == error_code, (
+        f"Expected the error code {error_code} for '{expression}', but got {result}"
+    )
+
+
+def test_evaluate_many_has_no_side_effects(capsys):
+    history_length = len(Calculator.expression_history)
+    engine = EvaluationEngine()
+    results = engine.evaluate_many(["1+1", "1/0", "1+1", "2*^3", "2*^3"])
+    assert [result.value for result in results] == [2, None, 2, None, None]
+    assert capsys.readouterr().out == ""
+    assert len(Calculator.expression_history) == history_length
+    stats = engine.cache_stats()
+    assert (stats["hits"], stats["negative_hits"]) == (1, 1), f"Unexpected cache counters {stats}"
+
+
+def test_negative_cache_hits_get_new_errors():
+    engine = EvaluationEngine()
+    first, second, third = engine.evaluate_many(["2*^3"] * 3)
+    assert second.error is not third.error and str(second.error) == str(first.error), (
+        "Expected every negative cache hit to get a new error with the same message"
+    )
+    assert second.error.__traceback__ is not None and (
+        len(traceback.extract_tb(third.error.__traceback__)) == len(traceback.extract_tb(second.error.__traceback__))
+    ), "Expected the traceback not to grow on every hit"
+
+
+def test_evaluate_with_variables():
+    engine = EvaluationEngine(allow_variables=True)
+    assert engine.evaluate("2*-x + rate^2", {"x": 3, "rate": 2}).value == -2
+    assert engine.evaluate("sum + 1").error_code == "value_error"  # No value for the variable
+    assert EvaluationEngine().evaluate("x + 1").error_code == "invalid_character"
+
+
+def test_bulk_evaluation_keeps_order_and_errors(tmp_path):
+    from bulk_evaluation import evaluate_bulk, iter_evaluate_file
+    expressions = [f"{number} * 2 + 1" if number % 7 else f"{number} / 0" for number in range(500)]
+    expected = EvaluationEngine().evaluate_many(expressions)
+    assert evaluate_bulk(expressions, max_workers=2) == expected
+    path = tmp_path / "expressions.txt"
+    path.write_text("\n".join(expressions) + "\n")
+    assert list(iter_evaluate_file(str(path), max_workers=2, chunk_size=50)) == expected
+
+
+def test_stream_mode_writes_one_line_per_expression(capsys):
+    output = io.StringIO()
+    main_calculator.stream(io.StringIO("1+2\n\n2*^3\n1/0\n(10@20)+(3^2)/(2&4)"), output)
+    assert output.getvalue() == "3\nerror:empty_expression\nerror:invalid_expression\nerror:zero_division\n19.5\n", (
+        f"Unexpected stream output: {output.getvalue()!r}"
+    )
+    assert capsys.readouterr().out == "", "The stream mode should not print anything besides its output"
+
+
+@pytest.mark.parametrize("expression, fraction_value, decimal_value", [
+    ("0.1 + 0.2", Fraction(3, 10), Decimal("0.3")),
+    ("1 / 3", Fraction(1, 3), Decimal("0.3333333333")),
+    ("2 ^ -2", Fraction(1, 4), Decimal("0.25")),
+    ("200! / 199!", 200, 200),
+    ("7.5 % -2", Fraction(-1, 2), Decimal("-0.5")),
+    ("10 ^ 30 + 1", 10 ** 30 + 1, 10 ** 30 + 1),
+    ("1.10 * 3", Fraction(33, 10), Decimal("3.30"))
+])
+def test_exact_modes(expression, fraction_value, decimal_value):
+    for mode, expected in (("fraction", fraction_value), ("decimal", decimal_value)):
+        result = EvaluationEngine(exact=mode, precision=10).evaluate(expression)
+        assert result.ok and result.value == expected and type(result.value) is type(expected), (
+            f"Expected {expected!r} for '{expression}' in {mode} mode, but got {result}"
+        )
+
+
+@pytest.mark.parametrize("expression, error_code", [
+    ("1 / 0", "zero_division"),
+    ("0 ^ -1", "value_error"),
+    ("(1 / 3)#", "value_error"),
+    ("2 ^ (10 ^ 9)", "overflow")
+])
+def test_exact_mode_errors(expression, error_code):
+    result = EvaluationEngine(exact="fraction").evaluate(expression)
+    assert result.error_code == error_code, f"Expected the error code {error_code} for '{expression}', but got {result}"
+
+
+@pytest.mark.parametrize("options, message_id", [
+    ({}, "factorial_domain"),
+    ({"exact": "fraction"}, "exact_factorial_domain"),
+    ({"exact": "decimal", "code_generation": True}, "exact_factorial_domain"),
+    ({"exact": "fraction", "eliminate_common_subexpressions": True}, "exact_factorial_domain")
+])
+def test_factorial_domain_message(options, message_id):
+    result = EvaluationEngine(**options).evaluate("(1 - 2.5)! + (1 - 2.5)!")
+    assert result.error_code == "value_error" and result.error.args[0].message_id == message_id, (
+        f"Expected the {message_id} message with {options}, but got {result}"
+    )
+    assert ("170" in str(result.error)) == (message_id == "factorial_domain")
+
+
+@pytest.mark.parametrize("expression, span", [
+    ("5 / 0", (1, 2)),
+    ("1/(1-1)", (1, 6)),
+    ("2 * 1/-(1-1) + 3", (3, 8)),
+    ("1/((2-2)*1)", (1, 10)),
+    ("(1/(3-3))", (2, 7))
+])
+@pytest.mark.parametrize("options", [
+    {}, {"exact": "fraction"}, {"code_generation": True}, {"eliminate_common_subexpressions": True}
+])
+def test_zero_division_highlights_the_operator_and_the_divisor(expression, span, options, monkeypatch):
+    for stream_length in (evaluation_engine.TOKEN_STREAM_MIN_LENGTH, 0):
+        monkeypatch.setattr(evaluation_engine, "TOKEN_STREAM_MIN_LENGTH", stream_length)
+        result = EvaluationEngine(**options).evaluate(expression)
+        assert result.error_code == "zero_division" and result.error.args[0].spans == [span], (
+            f"Expected the span {span} for '{expression}' with {options}, but got {result.error.args[0].spans}"
+        )
+
+
+def test_common_subexpressions_are_evaluated_once():
+    expression = " + ".join(["(12.5 ^ 3!)"] * 20)
+    postfix_expression = postfix_evaluation_utils.infix_to_postfix(lexer_utils.tokenize(expression))
+    dag = build_dag(postfix_expression)
+    # The 20 copies share 4 nodes (12.5, 3, ! and ^), and each of the 19 additions is a node of its own
+    assert len(dag) == 4 + 19 and dag.occurrences == 20 * 4 + 19, (
+        f"Expected the copies to share their nodes, but got {len(dag)} nodes for {dag.occurrences} occurrences"
+    )
+    engine = EvaluationEngine(eliminate_common_subexpressions=True)
+    assert engine.evaluate(expression) == EvaluationEngine().evaluate(expression), (
+        f"Expected the same result with and without the elimination for '{expression}'"
+    )
+
+
+@pytest.mark.parametrize("expression", [
+    "2 * (1 - 1) + 5 / (1 - 1)",
+    "(3 - 5)! + 2 * (3 - 5)!",
+    "(2 - 7)# * 4 + (2 - 7)#"
+])
+def test_common_subexpression_errors_keep_their_spans(expression):
+    expected = EvaluationEngine().evaluate(expression)
+    result = EvaluationEngine(eliminate_common_subexpressions=True).evaluate(expression)
+    assert result.error_code == expected.error_code and str(result.error) == str(expected.error), (
+        f"Expected the same error message with and without the elimination for '{expression}'"
+    )
+
+
+@pytest.mark.parametrize("expression", [
+    "(10 @ 20 ) + (3 ^ 2 ) / (2 & 4)",
+    "12! / ((10@2) ^ (3&5)) + 5 * 3 - 7 % 4 $ 2 - ~3",
+    "123# * 4.5 - (6 $ 7 & 8) @ 9",
+    "2 * -(3) + -2",
+    "5 / (2 - 2)",
+    "(3 - 5)!",
+    "-(~7)#"
+])
+def test_code_generation_matches_the_interpreter(expression):
+    for exact in (None, "fraction"):
+        expected = EvaluationEngine(exact=exact).evaluate(expression)
+        result = EvaluationEngine(exact=exact, code_generation=True).evaluate(expression)
+        assert result == expected and str(result.error) == str(expected.error), (
+            f"Expected {expected} for '{expression}' from the compiled expression, but got {result}"
+        )
+
+
+def test_code_generation_source():
+    token_list = lexer_utils.tokenize("(1 + 2) / (x & 3)", allow_variables=True)
+    compiled = compile_postfix(postfix_evaluation_utils.infix_to_postfix(token_list), token_list)
+    assert "_divide" not in compiled.source and compiled.evaluate(variables={"x": 4}) == 1, (
+        f"Expected straight-line code with the operations inline, but got:\n{compiled.source}"
+    )
+    with pytest.raises(ZeroDivisionError):
+        compiled.evaluate(variables={"x": 0})
+
+
+@pytest.mark.parametrize("expression", [
+    "12! / ((10@2) ^ (3&5)) + 5 * 3 - 7 % 4 $ 2 - ~3",
+    "-(2 + 3) * 4!# / -5 + 2 ^ 0.5",
+    "123# * 4.5 - (6 $ 7 & 8) @ 9",
+    "5 / (2 - 2)",
+    "(3 - 5)!",
+    "2 + * 3)",
+    "99999999999999999999 + 1",
+    "3 + 4a"
+])
+def test_token_stream_matches_the_token_list(expression, monkeypatch):
+    expected = EvaluationEngine().evaluate(expression)
+    monkeypatch.setattr(evaluation_engine, "TOKEN_STREAM_MIN_LENGTH", 0)
+    result = EvaluationEngine().evaluate(expression)
+    assert result == expected and str(result.error) == str(expected.error), (
+        f"Expected {expected} for '{expression}' from the token stream, but got {result}"
+    )
+
+
+def test_long_expressions_use_the_token_stream():
+    expression = " + ".join(["(12 * 3.5 - 7)"] * 1000)
+    stream, postfix_expression = EvaluationEngine().compile(expression)
+    assert isinstance(stream, token_stream.TokenStream) and len(stream) == 7 * 1000 + 999, (
+        "Expected a long float expression to be compiled into a token stream"
+    )
+    assert stream.to_list() == lexer_utils.tokenize(expression), "Expected the stream to hold the lexer tokens"
+    assert token_stream.evaluate_postfix(postfix_expression, stream) == 35000.0
+
+
+@pytest.mark.parametrize("limits, expression, exact, limit", [
+    ({"max_input_length": 6}, "1 + 2 + 3", None, "input_length"),
+    ({"max_tokens": 5}, "1+2+3+4", None, "tokens"),
+    ({"max_steps": 2}, "1+2+3+4", None, "steps"),
+    ({"max_bits": 64}, "2 ^ 100", None, "bits"),
+    ({"max_bits": 64}, "(2 ^ 40) * (2 ^ 40)", None, "bits"),
+    ({"max_bits": 1000}, "500!", "fraction", "bits"),
+    ({"max_bits": 1000}, "(1 / 3) ^ 1000", "fraction", "bits"),
+    ({"max_bits": 10 ** 6}, "(10 ^ 10) ^ (10 ^ 10)", "fraction", "bits"),
+    ({"timeout": 0}, "+".join(["1"] * 1000), None, "deadline")
+])
+def test_evaluation_budgets(limits, expression, exact, limit):
+    engine = EvaluationEngine(exact=exact, budget=EvaluationBudget(**limits))
+    result = engine.evaluate(expression)
+    assert result.error_code == "budget_exceeded" and result.error.limit == limit, (
+        f"Expected '{expression}' to exceed the {limit} budget, but got {result}"
+    )
+
+
+@pytest.mark.parametrize("expression", ["1+2+3+4", "2 ^ 60", "20! / 3", "1 / 0", "2 + * 3"])
+def test_evaluation_within_budget(expression):
+    budget = EvaluationBudget(max_input_length=100, max_tokens=7, max_steps=3, max_bits=64, timeout=60)
+    assert EvaluationEngine(budget=budget).evaluate(expression) == EvaluationEngine().evaluate(expression)
+
+
+def test_cancel_token():
+    token = CancelToken()
+    engine = EvaluationEngine()
+    assert engine.evaluate("1+1", cancel_token=token).value == 2
+    token.cancel()
+    results = engine.evaluate_many(["1+1", "2*3"], token)
+    assert [result.error.limit for result in results] == ["cancelled", "cancelled"]
+
+
+def test_calculator_budget(monkeypatch, capsys):
+    monkeypatch.setattr(Calculator, "budget", EvaluationBudget(max_bits=64))
+    assert Calculator("3 ^ 200").calculate() is None
+    assert "bigger than 64 bits" in capsys.readouterr().out
+    assert Calculator("3 ^ 20").calculate() == 3 ** 20
+
+
+def test_calculator_budget_counts_the_tokens_of_cached_expressions(monkeypatch, capsys):
+    expression = "+".join(["1"] * 50)
+    assert Calculator(expression).calculate() == 50
+    monkeypatch.setattr(Calculator, "budget", EvaluationBudget(max_tokens=10))
+    assert Calculator(expression).calculate() is None, "Expected the cached expression to exceed the token budget"
+    assert "too many tokens" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("(3 ^ 100000000) % 1000007", pow(3, 10 ** 8, 1000007)),
+    ("(2305843009213693951 ^ 1000003) % -97", pow(2 ** 61 - 1, 1000003, -97)),
+    ("(-7 ^ 5) % 3 + (10 ^ 0) % 1", (-7) ** 5 % 3),
+    ("(2 ^ -2) % 3", Fraction(1, 4)),
+    ("(2.5 ^ 2) % 4", Fraction(9, 4)),
+    ("(2 ^ 3) % 0", None)
+])
+def test_power_modulo_fusion(expression, expected):
+    fused = EvaluationEngine(exact="fraction").evaluate(expression)
+    assert fused.value == expected, f"Expected {expected} for '{expression}', but got {fused}"
+    if expected is None:
+        assert fused.error_code == "zero_division"
+
+
+def test_power_modulo_fusion_shape():
+    token_list = lexer_utils.tokenize("(7 ^ 2) % 5 + 2 ^ 3 % 4")
+    fused = postfix_optimization_utils.fuse_power_modulo(postfix_evaluation_utils.infix_to_postfix(token_list))
+    assert [token for token, _ in fused] == [7, 2, 5, "^%", 2, 3, 4, "%", "^", "+"], (
+        "Expected only the power on the left of the modulo to be fused"
+    )
+    token_list, postfix_expression = EvaluationEngine().compile("(7 ^ 2) % 5")
+    assert "^" in [token for token, _ in postfix_expression], "Expected no fusion in float mode, math.pow rounds"
+
+
+@pytest.mark.parametrize("output_format", ["npy", "bin", "csv"])
+def test_bulk_file_mode(tmp_path, output_format):
+    from bulk_evaluation import STATUS_CODES, status_path
+    lines = ["1+2", "3/0", "", "2^0.5", "4!", "2+*3", "5 ÷ 2"]
+    input_path = tmp_path / "expressions.txt"
+    input_path.write_bytes("\r\n".join(lines).encode())
+    output_path = str(tmp_path / f"results.{output_format}")
+    main_calculator.main(["--bulk", output_path, "--input", str(input_path), "--format", output_format])
+
+    expected = EvaluationEngine().evaluate_many(lines)
+    if output_format == "csv":
+        with open(output_path) as output_file:
+            rows = output_file.read().splitlines()[1:]
+        assert rows == [f"{result.value},ok" if result.ok else f",{result.error_code}" for result in expected]
+        return
+    values = array.array("d")
+    statuses = array.array("B")
+    with open(output_path, "rb") as values_file, open(status_path(output_path), "rb") as status_file:
+        if output_format == "npy":
+            values_file.seek(128)
+            status_file.seek(128)
+        values.frombytes(values_file.read())
+        statuses.frombytes(status_file.read())
+    assert [STATUS_CODES[status] for status in statuses] == [result.error_code or "ok" for result in expected]
+    assert [value for value, status in zip(values, statuses) if not status] == [
+        result.value for result in expected if result.ok]
+
+
+def test_status_codes_cover_every_error_code():
+    from bulk_evaluation import STATUS_CODES
+    assert {code for _, code in error_codes.ERROR_CODES} | {error_codes.EMPTY_EXPRESSION} <= set(
+        STATUS_CODES)
+
+
+@pytest.mark.parametrize("expression", [
+    "0.1 + 0.2 + 0.3 + 1e16 + 1 + 1 - 1e16",
+    "1.1 * 1.3 * 1.7 * 1e308 * 10 * 0",
+    "3 $ -0 $ 0 $ 1.5 & 2 & 0.5 & 0.75",
+    "1 + 2 * 3 * 4 + (5 + 6 + 7) * 8 * 9 - 10 - 11 / 12 / 13 @ 14 @ 15 ^ 2 ^ 0.5",
+    "1 + 2 + (3 - 3)! + 4 / (1 - 1) + 5",
+    "-(1 + 2 + 3) * 4 * 5 + ~6 + 7#",
+    " + ".join(f"{number}.1 * 3 * 0.7" for number in range(700))
+])
+def test_flattened_chains_match_the_binary_operators(expression, monkeypatch):
+    flattened = EvaluationEngine().evaluate(expression)
+    monkeypatch.setattr(evaluation_engine, "TOKEN_STREAM_MIN_LENGTH", 0)
+    streamed = EvaluationEngine().evaluate(expression)
+    monkeypatch.setattr(postfix_optimization_utils, "flatten_chains", lambda postfix_expression: postfix_expression)
+    monkeypatch.setattr(token_stream, "flatten_chains", lambda postfix_expression, stream: postfix_expression)
+    monkeypatch.setattr(evaluation_engine, "TOKEN_STREAM_MIN_LENGTH", 10 ** 9)
+    expected = EvaluationEngine().evaluate(expression)
+    for result in (flattened, streamed):
+        assert repr(result.value) == repr(expected.value) and str(result.error) == str(expected.error), (
+            f"Expected {expected} for '{expression}' with flattened chains, but got {result}"
+        )
+
+
+def test_flattened_chains_shape():
+    token_list = lexer_utils.tokenize("1 + 2 + 3 * 4 * 5 - 6 - 7 + (8 + 9 + 10)")
+    flattened = postfix_optimization_utils.flatten_chains(postfix_evaluation_utils.infix_to_postfix(token_list))
+    chain = postfix_optimization_utils.OperatorChain
+    assert [token for token, _ in flattened] == [1, 2, 3, 4, 5, chain("*", 3), chain("+", 3), 6, "-", 7, "-",
+                                                 8, 9, 10, chain("+", 3), "+"], (
+        "Expected only the left-associative chains of the same associative operator to be flattened"
+    )
+    token_list = lexer_utils.tokenize("1 + x + 2", allow_variables=True)
+    postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+    assert postfix_optimization_utils.flatten_chains(postfix_expression) is postfix_expression, (
+        "Expected the chains with variables to be left alone"
+    )
+
+
+@pytest.mark.parametrize("expression", [
+    "1+" * 3000 + "(-#)",
+    "-#+" + "1+" * 3000 + "1"
+])
+def test_flattened_chains_leave_invalid_streams_to_the_evaluation(expression):
+    result = EvaluationEngine().evaluate(expression)
+    assert len(expression) >= evaluation_engine.TOKEN_STREAM_MIN_LENGTH and result.error_code == "value_error", (
+        f"Expected a value_error for a long invalid expression, but got {result}"
+    )
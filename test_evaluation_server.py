@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+from evaluation_engine import EvaluationEngine
+from evaluation_server import EvaluationServer, encode_response, decode_request, BAD_REQUEST, LINE_TOO_LONG
+
+
+async def _exchange(server, lines, connections=1, unix_path=None):
+    """
+    Starts the server, sends the lines on every connection without waiting for the responses,
+    and reads one response line per request line.
+    """
+    if unix_path:
+        listener = await server.start_unix(unix_path)
+    else:
+        listener = await server.start_tcp("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+
+    async def client():
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"".join(line + b"\n" for line in lines))
+        await writer.drain()
+        responses = []
+        for _ in lines:
+            line = await reader.readline()
+            if not line:
+                break
+            responses.append(json.loads(line))
+        writer.close()
+        return responses
+
+    try:
+        return await asyncio.gather(*(client() for _ in range(connections)))
+    finally:
+        listener.close()
+        await server.close()
+
+
+def _request(request_id, expression):
+    return json.dumps({"id": request_id, "expression": expression}).encode()
+
+
+EXPRESSIONS = ["1 + 2", "5 / 0", "2 + * 3", "170!", "(10^20)#", "", "3.5 * 2", "2 $ a", "-(2 + 3) * 4"]
+
+
+def test_server_results_match_the_engine():
+    lines = [_request(index, expression) for index, expression in enumerate(EXPRESSIONS * 20)]
+    results = asyncio.run(_exchange(EvaluationServer(batch_size=8), lines, connections=8))
+    engine = EvaluationEngine()
+    expected = [json.loads(encode_response(index, engine.evaluate(expression)))
+                for index, expression in enumerate(EXPRESSIONS * 20)]
+    for responses in results:
+        assert responses == expected, "Expected every connection to get the engine's results, in request order"
+
+
+def test_server_exact_mode():
+    [responses] = asyncio.run(_exchange(EvaluationServer(exact="fraction"), [_request("a", "1 / 3 + 1 / 6")]))
+    assert responses == [{"id": "a", "value": "1/2"}], "Expected fractions to be sent as strings"
+
+
+@pytest.mark.parametrize("line", [b"not json", b"[1, 2]", b'{"id": 3}', b'{"id": 3, "expression": 4}'])
+def test_server_bad_requests(line):
+    [responses] = asyncio.run(_exchange(EvaluationServer(), [line, _request(9, "2 ^ 3")]))
+    assert responses[1] == {"id": 9, "value": 8} and responses[0]["error"] == BAD_REQUEST, (
+        f"Expected a bad request error for {line!r} and the connection to keep working"
+    )
+
+
+def test_server_closes_connections_with_too_long_lines():
+    lines = [_request(1, "1 + 1"), _request(2, "+".join(["1"] * 1000)), _request(3, "2 + 2")]
+    [responses] = asyncio.run(_exchange(EvaluationServer(max_line_length=1024), lines))
+    assert responses == [{"id": 1, "value": 2}, {"id": None, "error": LINE_TOO_LONG}], (
+        "Expected the connection to be closed after a line longer than the limit"
+    )
+
+
+def test_server_unix_socket(tmp_path):
+    [responses] = asyncio.run(_exchange(EvaluationServer(), [_request(1, "4!")], unix_path=str(tmp_path / "sock")))
+    assert responses == [{"id": 1, "value": 24}]
+
+
+def test_decode_request():
+    assert decode_request(b'{"id": [1, 2], "expression": "1+1"}') == ([1, 2], "1+1")
+    assert decode_request(b"\xff") == (None, None)
@@ -0,0 +1,90 @@
+import pytest
+import history_utils
+from history_store import HistoryStore, LOG_MAGIC
+
+
+def _fill(history, count):
+    for i in range(count):
+        history_utils.add_to_history(history, f"{i} + 1", i + 1)
+
+
+@pytest.mark.parametrize("maxlen", [1, 5, 100])
+def test_history_keeps_the_most_recent_entries(maxlen):
+    history = HistoryStore(maxlen)
+    _fill(history, 250)
+    assert list(history) == [(f"{i} + 1", i + 1) for i in range(250 - maxlen, 250)], (
+        f"Expected only the {maxlen} most recent entries to be kept"
+    )
+
+
+def test_history_log_loads_the_most_recent_entries(tmp_path):
+    path = str(tmp_path / "history.log")
+    history = HistoryStore(100, path, sync_every=7)
+    _fill(history, 1000)
+    history.close()
+    reloaded = HistoryStore(5, path)
+    assert list(reloaded) == [(f"{i} + 1", i + 1) for i in range(995, 1000)]
+    history_utils.add_to_history(reloaded, "2 ^ 0.5", 2 ** 0.5)
+    reloaded.close()
+    assert list(HistoryStore(2, path)) == [("999 + 1", 1000), ("2 ^ 0.5", 2 ** 0.5)], (
+        "Expected the results to be read back with their type"
+    )
+
+
+def test_unbounded_history_loads_the_whole_log(tmp_path):
+    path = str(tmp_path / "history.log")
+    history = HistoryStore(None, path)
+    _fill(history, 20)
+    history.close()
+    reloaded = HistoryStore(None, path)
+    assert list(reloaded) == [(f"{i} + 1", i + 1) for i in range(20)], (
+        "Expected an unbounded history to load every entry of the log"
+    )
+    reloaded.close()
+
+
+def test_history_pages_read_the_whole_log(tmp_path):
+    path = str(tmp_path / "history.log")
+    history = HistoryStore(3, path)
+    _fill(history, 25)
+    pages = list(history.pages(10))  # Unsynced entries included
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [entry for page in pages for entry in page] == [(f"{i} + 1", i + 1) for i in reversed(range(25))]
+    history.close()
+
+
+def test_history_log_cuts_a_torn_record(tmp_path):
+    path = tmp_path / "history.log"
+    history = HistoryStore(5, str(path))
+    _fill(history, 3)
+    history.close()
+    size = path.stat().st_size
+    with open(path, "ab") as log:
+        log.write(b"\x20\x00\x00\x00half a rec")  # A write interrupted by a crash
+    history = HistoryStore(5, str(path))
+    assert list(history) == [(f"{i} + 1", i + 1) for i in range(3)]
+    assert path.stat().st_size == size, "Expected the torn record to be cut off"
+    history_utils.add_to_history(history, "7 # ", 7)
+    history.close()
+    assert list(HistoryStore(5, str(path)))[-1] == ("7 # ", 7)
+
+
+def test_history_log_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a history log")
+    with pytest.raises(ValueError):
+        HistoryStore(5, str(path))
+    assert path.read_bytes() == b"not a history log"
+    assert LOG_MAGIC not in path.read_bytes()
+
+
+def test_display_history_pages(capsys):
+    history = HistoryStore(25)
+    history_utils.display_history(history)
+    assert "History is empty!" in capsys.readouterr().out
+    _fill(history, 25)
+    answers = iter(["", "q"])
+    history_utils.display_history(history, page_size=10, ask_more=lambda prompt: next(answers))
+    out = capsys.readouterr().out
+    assert "1) 24 + 1 = 25" in out and "20) 5 + 1 = 6" in out, "Expected the two first pages, most recent first"
+    assert "21)" not in out, "Expected the display to stop when asked to"
@@ -0,0 +1,65 @@
+from fractions import Fraction
+
+import pytest
+from spreadsheet import Sheet, CircularReferenceError
+
+
+def test_cells_refer_to_other_cells():
+    sheet = Sheet()
+    sheet.define("a = 3^2")
+    sheet.define("b = a * 4 + 1")
+    sheet.set("c", "b - a")
+    assert (sheet.value("a"), sheet.value("b"), sheet.value("c")) == (9, 37, 28)
+
+
+def test_only_downstream_cells_are_recalculated():
+    sheet = Sheet()
+    sheet.update({"total": "x + y", "y": "b * 2", "x": "a + 1", "a": "1", "b": "2", "other": "a ^ 3"})
+    assert sheet.value("total") == 6
+    assert sheet.set("b", "10") == ["b", "y", "total"], "Expected only b and its dependents, in topological order"
+    assert sheet.value("total") == 22 and sheet.value("other") == 1
+
+
+def test_update_evaluates_every_cell_once():
+    sheet = Sheet()
+    formulas = {f"c{i}": f"c{i - 1} + 1" for i in range(1, 5000)}
+    formulas["c0"] = "0"
+    order = sheet.update(formulas)
+    assert len(order) == 5000 and sheet.value("c4999") == 4999
+    assert len(sheet.set("c4990", "0")) == 10
+
+
+@pytest.mark.parametrize("formulas", [
+    {"a": "a + 1"},
+    {"a": "b", "b": "c * 2", "c": "a"}
+])
+def test_cycles_are_rejected(formulas):
+    sheet = Sheet()
+    sheet.update({"a": "1", "b": "2", "c": "3"})
+    with pytest.raises(CircularReferenceError):
+        sheet.update(formulas)
+    assert [sheet.value(name) for name in "abc"] == [1, 2, 3], "Expected the sheet to be left unchanged"
+    assert sheet.set("c", "a + b") == ["c"], "Expected the dependency edges to be restored"
+
+
+def test_errors_propagate_downstream():
+    sheet = Sheet()
+    sheet.update({"a": "1 / 0", "b": "a + 1", "c": "missing * 2", "d": "2 +* 3"})
+    assert [sheet[name].error_code for name in "abcd"] == [
+        "zero_division", "zero_division", "value_error", "invalid_expression"]
+    sheet.update({"a": "4", "missing": "5"})
+    assert (sheet.value("b"), sheet.value("c")) == (5, 10)
+    sheet.delete("missing")
+    assert sheet["c"].error_code == "value_error" and "missing" not in sheet
+
+
+def test_exact_cells():
+    sheet = Sheet(exact="fraction")
+    sheet.update({"third": "1 / 3", "sum": "third + third + third", "half": "third * 3 / 2"})
+    assert (sheet.value("sum"), sheet.value("half")) == (1, Fraction(1, 2))
+
+
+@pytest.mark.parametrize("statement", ["no assignment", "2x = 1", " = 3"])
+def test_invalid_statements(statement):
+    with pytest.raises(ValueError):
+        Sheet().define(statement)
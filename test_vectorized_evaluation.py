@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from evaluation_engine import EvaluationEngine
+from vectorized_evaluation import compile_expression, NO_ERROR, ZERO_DIVISION, FACTORIAL_DOMAIN
+
+
+@pytest.mark.parametrize("expression", [
+    "x + rate * 2",
+    "(x ^ 2) @ -rate",
+    "((x $ rate) & 10)!",
+    "(x * 100)# % 7",
+    "2*-x - ~3"
+])
+def test_vectorized_matches_engine(expression):
+    x = np.array([0, 1, 2.5, 3, 7])
+    rate = np.array([1, 0.5, 4, 2, 3])
+    result = compile_expression(expression).evaluate({"x": x, "rate": rate})
+    engine = EvaluationEngine(allow_variables=True)
+    for row in range(len(x)):
+        expected = engine.evaluate(expression, {"x": x[row], "rate": rate[row]})
+        assert expected.ok == bool(result.ok[row]), f"Row {row} of '{expression}' disagrees on the error"
+        if expected.ok:
+            assert result.values[row] == pytest.approx(expected.value), (
+                f"Expected {expected.value} but got {result.values[row]} for row {row} of '{expression}'"
+            )
+
+
+def test_vectorized_domain_errors():
+    result = compile_expression("(1 / x)!").evaluate({"x": np.array([0, 1, 0.5, -1])})
+    assert result.error_codes.tolist() == [ZERO_DIVISION, NO_ERROR, NO_ERROR, FACTORIAL_DOMAIN]
+    assert np.isnan(result.values[0]) and result.values[1] == 1 and result.values[2] == 2
+
+
+def test_vectorized_missing_variable():
+    with pytest.raises(ValueError):
+        compile_expression("x + y").evaluate({"x": np.arange(3)})
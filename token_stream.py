@@ -0,0 +1,292 @@
+from array import array
+
+from operators import OPERATOR_TOKENS, OPCODES, ARITIES, PRIORITIES, RIGHT_ASSOCIATIVE, OPERATIONS
+from unary_operator import FACTORIAL_LIMIT
+import lexer_utils
+import validation_utils
+import postfix_evaluation_utils
+from postfix_optimization_utils import CHAIN_OPERATIONS
+
+# The kinds of the tokens, an operator's kind is its opcode (see operators.OPCODES)
+INT, FLOAT, OPEN, SIGN_OPEN, CLOSE = range(len(OPERATOR_TOKENS), len(OPERATOR_TOKENS) + 5)
+_KIND_TOKENS = tuple(OPERATOR_TOKENS) + (None, None, "(", "-(", ")")  # The token of every kind but the numbers
+_KINDS = {token: kind for kind, token in enumerate(_KIND_TOKENS) if token is not None}
+_DIVIDE, _FACTORIAL, _HASHTAG = OPCODES["/"], OPCODES["!"], OPCODES["#"]
+_EXACT_INT_LIMIT = 2 ** 53  # Integers below it are stored exactly in a float
+_CHAIN_KERNELS = {OPCODES[operator]: kernel for operator, kernel in CHAIN_OPERATIONS.items()}
+
+# The validator class of every token kind, as a bytes.translate table
+_CLASS_TABLE = bytes(
+    validation_utils.NUMBER if kind == INT or kind == FLOAT else validation_utils.token_class(_KIND_TOKENS[kind])
+    for kind in range(len(_KIND_TOKENS))).ljust(256, bytes((validation_utils.OTHER,)))
+
+
+class _UnrepresentableToken(Exception):
+    """
+    A token the stream can't hold (an integer above 2 ** 53 or a marker of an invalid expression).
+    """
+
+
+class TokenStream:
+    """
+    A compact token list held in parallel typed arrays instead of a list of Python objects.
+    Every token takes 17 bytes: its kind, its numeric value and its position in the expression.
+    The postfix expression of a stream is an array of token positions too, see to_postfix().
+
+    Attributes:
+        kinds (array): The kind of every token, the opcode of an operator or one of INT, FLOAT, OPEN, SIGN_OPEN
+            and CLOSE.
+        values (array): The value of every number, the operand count of the last operator of a flattened chain
+            (see flatten_chains()), 0 for the other tokens.
+        offsets (array): The position of every token in the expression without whitespaces.
+
+    Methods:
+        append(token):
+            Appends a token from the lexer.
+
+        to_list():
+            Converts the stream back to a token list, for the error messages.
+    """
+    __slots__ = ("kinds", "values", "offsets")
+
+    def __init__(self):
+        self.kinds = array("b")
+        self.values = array("d")
+        self.offsets = array("l")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, token):
+        """
+        Appends a token, the lexer fills the stream through this method.
+        :param token: A token of the lexer
+        :type token: str, int or float
+        :raises _UnrepresentableToken: if the stream can't hold the token
+        """
+        kind = _KINDS.get(token) if token.__class__ is str else None
+        if kind is not None:
+            self.values.append(0.0)
+        elif token.__class__ is float:
+            kind = FLOAT
+            self.values.append(token)
+        elif token.__class__ is int and -_EXACT_INT_LIMIT < token < _EXACT_INT_LIMIT:
+            kind = INT
+            self.values.append(token)
+        else:
+            raise _UnrepresentableToken(token)
+        self.kinds.append(kind)
+
+    def token(self, index):
+        """
+        :return: The token at a position of the stream, like it is in a token list
+        :rtype: str, int or float
+        """
+        kind = self.kinds[index]
+        if kind == INT:
+            return int(self.values[index])
+        if kind == FLOAT:
+            return self.values[index]
+        return _KIND_TOKENS[kind]
+
+    def to_list(self):
+        """
+        :return: The token list of the stream, for the error messages
+        :rtype: list
+        """
+        return [self.token(index) for index in range(len(self))]
+
+
+def from_expression(expression):
+    """
+    Scans a raw expression into a token stream.
+    :param expression: The raw expression
+    :type expression: str
+    :return: The token stream, or None if the expression has errors or tokens the stream can't hold, and should
+        be tokenized into a list
+    :rtype: TokenStream or None
+    """
+    stream = TokenStream()
+    try:
+        if lexer_utils.scan_into(expression, stream, stream.offsets):
+            return stream
+    except _UnrepresentableToken:
+        pass
+    return None
+
+
+def validate(stream, fail_fast=False):
+    """
+    Runs all the validation checks over a token stream, see validation_utils.validate().
+    The tokens are classified with a single bytes.translate over the kinds.
+    :return: A list with the error positions of every check, indexed by the check constants
+    :rtype: list
+    """
+    boundary = bytes((validation_utils.OTHER,))
+    classes = boundary + stream.kinds.tobytes().translate(_CLASS_TABLE) + boundary
+    return validation_utils.validate_classes(classes, fail_fast)
+
+
+def to_postfix(stream):
+    """
+    Converts a validated token stream to postfix notation, like infix_to_postfix.
+    :param stream: The token stream
+    :type stream: TokenStream
+    :return: The positions of the tokens in postfix order. The sign minus of a "-(" at position p is ~p, a negative
+        position the evaluation skips like the "s" marker of infix_to_postfix
+    :rtype: array
+    """
+    output = array("l")
+    append = output.append
+    operator_stack = []  # The positions of the operators and parentheses
+    priorities = []  # The priority of every entry of the operator stack, -1 for parentheses and sign minuses
+    operator_count = len(OPERATOR_TOKENS)
+
+    for index, kind in enumerate(stream.kinds):
+        if kind == INT or kind == FLOAT:
+            append(index)
+        elif kind < operator_count:
+            priority = PRIORITIES[kind]
+            right_associative = RIGHT_ASSOCIATIVE[kind]
+            while priorities and (priorities[-1] > priority or
+                                  (priorities[-1] == priority and not right_associative)):
+                append(operator_stack.pop())
+                priorities.pop()
+            operator_stack.append(index)
+            priorities.append(priority)
+        elif kind == OPEN:
+            operator_stack.append(index)
+            priorities.append(-1)
+        elif kind == CLOSE:
+            while priorities and priorities[-1] >= 0:
+                append(operator_stack.pop())
+                priorities.pop()
+            operator_stack.pop()  # Remove the opening parenthesis
+            priorities.pop()
+            if operator_stack and operator_stack[-1] < 0:  # A sign minus
+                append(operator_stack.pop())
+                priorities.pop()
+        elif kind == SIGN_OPEN:
+            operator_stack += (~index, index)
+            priorities += (-1, -1)
+
+    while operator_stack:
+        append(operator_stack.pop())
+    return output
+
+
+def flatten_chains(postfix_expression, stream):
+    """
+    Flattens the chains of the same associative operator of the postfix expression of a stream, like
+    postfix_optimization_utils.flatten_chains. Only the last operator of a chain is kept, and its operand count is
+    stored in the values of the stream, where the evaluation finds it.
+    :param postfix_expression: The postfix token positions, see to_postfix()
+    :type postfix_expression: array
+    :param stream: The token stream, its values are updated
+    :type stream: TokenStream
+    :return: The optimized postfix token positions, or the same array if there is nothing to flatten
+    :rtype: array
+    """
+    kinds, values = stream.kinds, stream.values
+    removed = set()  # The slots of the operators merged into a chain
+    subtrees = []  # The (chain kind of the root or -1, slot of the root, operand count) of every operand in the stack
+
+    for slot, position in enumerate(postfix_expression):
+        if position < 0:
+            continue  # A sign minus
+        kind = kinds[position]
+        if kind == INT or kind == FLOAT:
+            subtrees.append((-1, 0, 1))
+        elif ARITIES[kind] == 1:
+            if not subtrees:
+                return postfix_expression  # Invalid, left to evaluate_postfix to report
+            subtrees[-1] = (-1, 0, 1)
+        else:
+            if len(subtrees) < 2:
+                return postfix_expression
+            subtrees.pop()
+            left_kind, left_slot, left_count = subtrees.pop()
+            if kind not in _CHAIN_KERNELS:
+                subtrees.append((-1, 0, 1))
+            elif left_kind == kind:
+                removed.add(left_slot)
+                values[postfix_expression[left_slot]] = 0
+                values[position] = left_count + 1
+                subtrees.append((kind, slot, left_count + 1))
+            else:
+                subtrees.append((kind, slot, 2))
+
+    if not removed:
+        return postfix_expression
+    return array("l", (position for slot, position in enumerate(postfix_expression) if slot not in removed))
+
+
+def evaluate_postfix(postfix_expression, stream, variables=None, arithmetic=None):
+    """
+    Evaluates the postfix expression of a token stream, like postfix_evaluation_utils.evaluate_postfix.
+    Instead of the nested token indexes, the stack keeps the first and the last token position of every operand,
+    which are all the error messages need.
+    :param postfix_expression: The postfix token positions, see to_postfix()
+    :type postfix_expression: array
+    :param stream: The token stream
+    :type stream: TokenStream
+    :return: The result of the evaluated expression.
+    :rtype: float
+    :raises ValueError: If the postfix expression is invalid or contains runtime errors.
+    :raises ZeroDivisionError: when a division by zero occurs.
+    """
+    kinds, values = stream.kinds, stream.values
+    operator_count = len(OPERATOR_TOKENS)
+    stack = []
+    firsts = []  # The first token position of every operand in the stack
+    lasts = []  # The last token position of every operand in the stack
+
+    for position in postfix_expression:
+        if position < 0:
+            continue  # A sign minus, skipped like evaluate_postfix skips the "s" marker
+        kind = kinds[position]
+        if kind == INT or kind == FLOAT:
+            stack.append(int(values[position]) if kind == INT else values[position])
+            firsts.append(position)
+            lasts.append(position)
+        elif kind < operator_count:
+            operation = OPERATIONS[kind]
+            if ARITIES[kind] == 2:
+                count = values[position]
+                if count:  # A flattened chain
+                    count = int(count)
+                    if len(stack) < count:  # Incase the checks somehow don't catch it before
+                        raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
+                    operands = stack[-count:]
+                    del stack[1 - count:]
+                    stack[-1] = _CHAIN_KERNELS[kind](operands)
+                    del firsts[1 - count:]
+                    lasts[-count] = lasts[-1]
+                    del lasts[1 - count:]
+                    continue
+                if len(stack) < 2:  # Incase the checks somehow don't catch it before
+                    raise ValueError("Invalid postfix expression: insufficient operands for binary operator.")
+                right_operand = stack.pop()
+                right_first = firsts.pop()
+                right_last = lasts.pop()
+                if kind == _DIVIDE and right_operand == 0:
+                    raise postfix_evaluation_utils.zero_division_error(
+                        position, (right_first, right_last), stream.to_list())
+                stack[-1] = operation(stack[-1], right_operand)
+                lasts[-1] = right_last
+            else:
+                if not stack:  # Incase the checks somehow don't catch it before
+                    raise ValueError("Invalid postfix expression: insufficient operand for unary operator.")
+                operand = stack[-1]
+                if kind == _FACTORIAL and (operand < 0 or not (operand == int(operand)) or operand > FACTORIAL_LIMIT):
+                    raise postfix_evaluation_utils.domain_error(
+                        "factorial_domain", (firsts[-1], lasts[-1]), stream.to_list())
+                if kind == _HASHTAG and operand < 0:
+                    raise postfix_evaluation_utils.domain_error(
+                        "hashtag_domain", (firsts[-1], lasts[-1]), stream.to_list())
+                stack[-1] = operation(operand)
+
+    if len(stack) != 1:
+        # Incase the checks somehow don't catch it before
+        raise ValueError("Invalid postfix expression: too many operands or insufficient operators.")
+    return stack[0]
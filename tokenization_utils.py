@@ -69,3 +69,48 @@ def decimal_point_check(expression):
                                                f"Stand-alone points "
                                                f"are not allowed.")
     return checked_expression
+
+
+def tokenize(expression):
+    """
+    Converts an expression that passed the decimal point check into a list of numbers and operators.
+    Sign minuses are merged into the number or parentheses after them.
+
+    :param expression: The preprocessed expression after the decimal point check
+    :type expression: str
+    :return: The token list
+    :rtype: list
+    :raise ValueError: if an integer is written with a decimal point
+    """
+    token_list = []
+    current_token = ""
+
+    for index, char in enumerate(expression):
+        next_char = expression[index + 1] if index + 1 < len(expression) else None
+
+        if char.isdecimal():
+            current_token += char
+            if not (next_char and (next_char.isdecimal() or next_char == ".")):
+                number = float(current_token)
+                if number.is_integer():
+                    token_list.append(int(current_token))
+                else:
+                    token_list.append(number)  # Add a float token
+                current_token = ""  # Reset for next token
+        elif char == ".":
+            current_token += char
+            if next_char:
+                if not next_char.isdecimal():
+                    token_list.append(float(current_token))
+                    current_token = ""
+        elif char == "s":  # Handle sign minus
+            current_token += "-"
+        else:
+            current_token += char
+            token_list.append(current_token)
+            current_token = ""  # Add operator or special character
+
+    # Add any remaining token at the end
+    if current_token:
+        token_list.append(float(current_token))
+    return token_list
@@ -1,3 +1,16 @@
+import functools
+import math
+
+FACTORIAL_LIMIT = 170  # The largest factorial that fits in a float
+EXACT_FACTORIALS = tuple(math.factorial(number) for number in range(FACTORIAL_LIMIT + 1))
+FLOAT_FACTORIALS = tuple(float(factorial) for factorial in EXACT_FACTORIALS)
+_STRING_DIGITS = 1024  # Integers up to this many digits are converted with str(), well below sys.int_info's limit
+_STRING_BITS = (10 ** _STRING_DIGITS).bit_length()
+
+# math.factorial splits the product in halves recursively (binary splitting) in C, the memo keeps the few
+# big factorials an expression or a batch repeats
+_memoized_factorial = functools.lru_cache(maxsize=128)(math.factorial)
+
 
 class UnaryOperator:
     """
@@ -8,6 +21,8 @@ class UnaryOperator:
     Methods:
         negative(operand): Perform negation operation
         factorial(operand): Perform factorial operation
+        exact_factorial(operand): Perform factorial operation on integers of any size
+        hashtag(operand): Sum the digits of the operand
     """
 
     @staticmethod
@@ -23,26 +38,72 @@ class UnaryOperator:
         :return: The factorial value of the given operand
         :rtype: int
         :raise ValueError: The factorial operation is only defined for non-negative integers
+        :raise OverflowError: if the factorial is too big for a float (operand above FACTORIAL_LIMIT)
         """
         operand = int(operand)
-        factorial_sum = 1
-        for number in range(1, operand + 1):
-            factorial_sum *= number
-        return float(factorial_sum)
+        if 0 <= operand <= FACTORIAL_LIMIT:
+            return FLOAT_FACTORIALS[operand]
+        return float(UnaryOperator.exact_factorial(operand))
+
+    @staticmethod
+    def exact_factorial(operand):
+        """
+        Calculates the exact factorial value of a given operand, without the float limit
+        :param operand: A given operand
+        :type operand: int
+        :return: The factorial value of the given operand
+        :rtype: int
+        :raise ValueError: The factorial operation is only defined for non-negative integers
+        """
+        operand = int(operand)
+        if 0 <= operand <= FACTORIAL_LIMIT:
+            return EXACT_FACTORIALS[operand]
+        return _memoized_factorial(operand)
 
     @staticmethod
     def hashtag(operand):
         """
-        Calculates the sum of the digits of a given operand
+        Calculates the sum of the digits of a given operand, straight from its decimal digits
         :param operand:  A given operand
-        :type operand: int, float
+        :type operand: int, float, Decimal
         :return: the sum of the operand's digits
         :rtype: int
+        :raise ValueError: if the operand is not a finite number
         """
-        # Handle float operands
-        operand = int(str(operand).replace(".", ""))
-        hashtag_sum = 0
-        while operand != 0:
-            hashtag_sum += operand % 10
-            operand //= 10
-        return hashtag_sum
+        if isinstance(operand, int):
+            operand = abs(operand)
+            if operand.bit_length() > _STRING_BITS:
+                return _split_digit_sum(operand)
+            return _digit_sum(str(operand))
+        # Handle float and decimal operands, the digits of "1.5e-05" are the digits of "0.000015"
+        digits = str(operand).lower().lstrip("-").partition("e")[0]
+        digits = digits.replace(".", "", 1)
+        if not digits.isdigit():
+            raise ValueError(f"Cannot sum the digits of {operand}")
+        return _digit_sum(digits)
+
+
+def _digit_sum(digits):
+    """
+    Sums a string of decimal digits in a single pass in C, the digit characters are the ASCII codes 48 to 57.
+    """
+    return sum(digits.encode("ascii")) - 48 * len(digits)
+
+
+def _split_digit_sum(number):
+    """
+    Sums the digits of a huge non-negative integer. The number is split in two halves of decimal digits
+    recursively, instead of peeling one digit at a time off the whole number, the zeros a split leaves at
+    the front of the low half don't change the sum.
+    """
+    if number.bit_length() <= _STRING_BITS:
+        return _digit_sum(str(number))
+    # The largest split of _STRING_DIGITS * 2 ** level digits below the number, so both halves get smaller
+    level = ((number.bit_length() - 1) // _STRING_BITS).bit_length() - 1
+    high, low = divmod(number, _power_of_ten(_STRING_DIGITS << level))
+    return _split_digit_sum(high) + _split_digit_sum(low)
+
+
+@functools.lru_cache(maxsize=64)
+def _power_of_ten(exponent):
+    return 10 ** exponent
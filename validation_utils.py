@@ -1,6 +1,147 @@
 import operators
+import diagnostics
+from variable import Variable
+from exact_arithmetic import NUMBER_TYPES
 from colors import Colors
 
+# Token classes used by the fused validator, the boundaries of the expression are treated as OTHER
+OTHER, NUMBER, OPEN, SIGN_OPEN, CLOSE, BINARY, LEFT_UNARY, NEGATION, RIGHT_UNARY = range(9)
+_CLASS_COUNT = 9
+_OPERAND_TYPES = NUMBER_TYPES + (Variable,)
+
+# The validation checks, in the order they are reported
+PARENTHESES, EMPTY_PARENTHESES, BINARY_OPERATORS, NEGATION_OPERATOR, STAND_ALONE_UNARY, MISSING_OPERATOR = range(6)
+
+
+def _build_token_classes():
+    """
+    Maps every operator and parenthesis token to its token class.
+    :return: A dictionary of token classes
+    :rtype: dict
+    """
+    token_classes = {"(": OPEN, "-(": SIGN_OPEN, ")": CLOSE}
+    for operator in operators.Operator.get_operators_keys():
+        if operator == "~":
+            token_classes[operator] = NEGATION
+        elif operators.Operator.get_type(operator) == "binary":
+            token_classes[operator] = BINARY
+        elif operators.Operator.get_position(operator) == "left":
+            token_classes[operator] = LEFT_UNARY
+        else:
+            token_classes[operator] = RIGHT_UNARY
+    return token_classes
+
+
+def _adjacency_errors(prev_class, token_class, next_class):
+    """
+    Finds the checks a token fails, given its class and the classes of its neighbours.
+    Follows the rules of the separate check functions below.
+    :return: A bit mask of the failed checks
+    :rtype: int
+    """
+    unary = (LEFT_UNARY, NEGATION, RIGHT_UNARY)
+    errors = 0
+    if token_class in (OPEN, SIGN_OPEN) and next_class == CLOSE:
+        errors |= 1 << EMPTY_PARENTHESES
+    if token_class == BINARY and not (next_class in (OPEN, SIGN_OPEN, NUMBER) + unary and
+                                      prev_class in (CLOSE, NUMBER) + unary):
+        errors |= 1 << BINARY_OPERATORS
+    if token_class == NEGATION and next_class != NUMBER:
+        errors |= 1 << NEGATION_OPERATOR
+    if token_class == RIGHT_UNARY and prev_class not in (NUMBER, CLOSE) + unary:
+        errors |= 1 << STAND_ALONE_UNARY
+    if token_class in (LEFT_UNARY, NEGATION) and next_class not in (NUMBER, OPEN) + unary:
+        errors |= 1 << STAND_ALONE_UNARY
+    if ((token_class in (CLOSE, RIGHT_UNARY, NUMBER) and next_class in (OPEN, NUMBER, LEFT_UNARY, NEGATION)) or
+            (token_class in (LEFT_UNARY, NEGATION) and prev_class in (CLOSE, NUMBER, RIGHT_UNARY))):
+        errors |= 1 << MISSING_OPERATOR
+    return errors
+
+
+_TOKEN_CLASSES = _build_token_classes()
+# The failed checks bit mask of every (previous, current, next) token classes triplet
+_ADJACENCY_TABLE = tuple(
+    _adjacency_errors(prev_class, token_class, next_class)
+    for prev_class in range(_CLASS_COUNT)
+    for token_class in range(_CLASS_COUNT)
+    for next_class in range(_CLASS_COUNT))
+
+
+def token_class(token):
+    """
+    :param token: A token of the lexer
+    :type token: str, int, float or Variable
+    :return: The token class the validator gives the token
+    :rtype: int
+    """
+    if token.__class__ is str:
+        return _TOKEN_CLASSES.get(token, OTHER)
+    return NUMBER if isinstance(token, _OPERAND_TYPES) else OTHER
+
+
+def validate(token_list, fail_fast=False):
+    """
+    Runs all the validation checks in a single walk over the token list.
+    Every token is classified once, and the checks it fails are looked up in a precomputed table by the
+    classes of the token and its neighbours. Only the positions of the errors are recorded, the check
+    functions below can be used to highlight them.
+    :param token_list: The token list of the expression
+    :type token_list: list
+    :param fail_fast: Stop at the first error found
+    :type fail_fast: bool
+    :return: A list with the error positions of every check, indexed by the check constants
+    :rtype: list
+    """
+    token_classes = _TOKEN_CLASSES
+    classes = [OTHER]
+    for token in token_list:
+        token_class = token_classes.get(token) if token.__class__ is str else None
+        if token_class is None:
+            token_class = NUMBER if isinstance(token, _OPERAND_TYPES) else OTHER
+        classes.append(token_class)
+    classes.append(OTHER)
+    return validate_classes(classes, fail_fast)
+
+
+def validate_classes(classes, fail_fast=False):
+    """
+    Runs all the validation checks over the token classes of an expression, see validate().
+    :param classes: The class of every token, with an OTHER class before the first token and after the last one
+    :type classes: Sequence[int]
+    :param fail_fast: Stop at the first error found
+    :type fail_fast: bool
+    :return: A list with the error positions of every check, indexed by the check constants
+    :rtype: list
+    """
+    error_positions = [[], [], [], [], [], []]
+    open_parentheses = []
+    table = _ADJACENCY_TABLE
+    row = _CLASS_COUNT * _CLASS_COUNT
+    for index in range(len(classes) - 2):
+        token_class = classes[index + 1]
+        errors = table[classes[index] * row + token_class * _CLASS_COUNT + classes[index + 2]]
+        if errors:
+            for check in range(1, 6):
+                if errors & (1 << check):
+                    error_positions[check].append(index)
+                    if fail_fast:
+                        return error_positions
+        if token_class == OPEN or token_class == SIGN_OPEN:
+            open_parentheses.append(index)
+        elif token_class == CLOSE:
+            if open_parentheses:
+                open_parentheses.pop()
+            else:
+                error_positions[PARENTHESES].append(index)  # Unmatched closing parenthesis
+                if fail_fast:
+                    return error_positions
+    if open_parentheses:
+        if fail_fast:
+            del open_parentheses[1:]
+        error_positions[PARENTHESES].extend(open_parentheses)
+        error_positions[PARENTHESES].sort()
+    return error_positions
+
 
 def parentheses_check(token_list):
     """
@@ -239,3 +380,34 @@ def missing_operator_check(token_list):
         return False, checked_expression.replace("u", "-")
     else:
         return True, None
+
+
+# The function that highlights the errors of every check and the message id of the check, in the check order
+CHECKS = (
+    (parentheses_check, "unbalanced_parentheses"),
+    (empty_parentheses_check, "empty_parentheses"),
+    (binary_operators_between_valid_operands_check, "misplaced_binary_operator"),
+    (negation_operator_next_to_number_check, "misplaced_negation_operator"),
+    (stand_alone_unary_operators_check, "stand_alone_unary_operator"),
+    (missing_operator_check, "missing_operator")
+)
+
+
+def diagnose(token_list, fail_fast=False):
+    """
+    Runs all the validation checks and turns the errors found into diagnostics, one for every failed check.
+    :param token_list: The token list of the expression
+    :type token_list: list
+    :param fail_fast: Stop at the first error found
+    :type fail_fast: bool
+    :return: The diagnostics, in the check order, an empty list if the expression is valid
+    :rtype: list
+    """
+    error_positions = validate(token_list, fail_fast)
+    found = []
+    for (_, message_id), positions in zip(CHECKS, error_positions):
+        if positions:
+            span_length = 1 if message_id == "empty_parentheses" else 0  # "()" spans two tokens
+            spans = [(position, position + span_length) for position in positions]
+            found.append(diagnostics.Diagnostic("validation", message_id, spans, token_list))
+    return found
@@ -0,0 +1,36 @@
+class Variable:
+    """
+    A named operand in an expression, its value is given when the expression is evaluated.
+
+    Attributes:
+        name (str): The name of the variable.
+        negative (bool): True if a sign minus is merged into the variable, like in "2*-x".
+    """
+    __slots__ = ("name", "negative")
+
+    def __init__(self, name, negative=False):
+        self.name = name
+        self.negative = negative
+
+    def __str__(self):
+        return f"-{self.name}" if self.negative else self.name
+
+    def __repr__(self):
+        return f"Variable({self.name!r}, negative={self.negative})"
+
+    def __eq__(self, other):
+        return isinstance(other, Variable) and self.name == other.name and self.negative == other.negative
+
+    def __hash__(self):
+        return hash((Variable, self.name, self.negative))
+
+    def value(self, variables):
+        """
+        Retrieve the value of the variable.
+        :param variables: The values of the variables by name
+        :type variables: dict
+        :return: The value, negated if a sign minus is merged into the variable
+        :raise KeyError: if the variable has no value
+        """
+        value = variables[self.name]
+        return -value if self.negative else value
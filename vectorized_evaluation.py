@@ -0,0 +1,196 @@
+import numpy as np
+
+from invalid_expression_exception import InvalidExpressionException
+from diagnostics import DiagnosticReport
+from operators import OPCODES, ARITIES
+from unary_operator import UnaryOperator, FLOAT_FACTORIALS, FACTORIAL_LIMIT
+from variable import Variable
+import lexer_utils
+import validation_utils
+import postfix_evaluation_utils
+
+# The error code of every row, a row keeps the first error it ran into like evaluate_postfix does
+NO_ERROR, ZERO_DIVISION, FACTORIAL_DOMAIN, HASHTAG_DOMAIN, POWER_DOMAIN, OVERFLOW = range(6)
+ERROR_NAMES = ("", "zero_division", "value_error", "value_error", "value_error", "overflow")
+
+_FACTORIALS = np.array(FLOAT_FACTORIALS, dtype=np.float64)
+_EXACT_DIGITS_LIMIT = 2.0 ** 53  # Whole floats below it are exact integers
+
+
+def _flag(error_codes, mask, code):
+    """
+    Marks the rows of the mask with an error code, rows that already failed keep their first error.
+    """
+    error_codes[mask & (error_codes == NO_ERROR)] = code
+
+
+def _divide(left, right, error_codes):
+    zero = right == 0
+    _flag(error_codes, zero, ZERO_DIVISION)
+    return left / np.where(zero, 1.0, right)
+
+
+def _power(left, right, error_codes):
+    # math.pow fails for a negative base with a fraction exponent, and for a zero base with a negative exponent
+    _flag(error_codes, ((left < 0) & (right != np.floor(right))) | ((left == 0) & (right < 0)), POWER_DOMAIN)
+    result = np.power(left, right)
+    _flag(error_codes, np.isinf(result) & np.isfinite(left) & np.isfinite(right), OVERFLOW)
+    return result
+
+
+def _modulo(left, right, error_codes):
+    zero = right == 0
+    _flag(error_codes, zero, ZERO_DIVISION)
+    return np.mod(left, np.where(zero, 1.0, right))  # np.mod takes the sign of the divisor like Python's %
+
+
+def _factorial(operand, error_codes):
+    invalid = ~((operand >= 0) & (operand == np.floor(operand)) & (operand <= FACTORIAL_LIMIT))
+    _flag(error_codes, invalid, FACTORIAL_DOMAIN)
+    return _FACTORIALS[np.where(invalid, 0, operand).astype(np.intp)]
+
+
+def _hashtag(operand, error_codes):
+    _flag(error_codes, operand < 0, HASHTAG_DOMAIN)
+    operand = np.abs(operand)
+    whole = (operand == np.floor(operand)) & (operand < _EXACT_DIGITS_LIMIT)
+    digits = np.where(whole, operand, 0).astype(np.int64)
+    result = np.zeros(operand.shape, dtype=np.float64)
+    while digits.any():
+        result += digits % 10
+        digits //= 10
+    for row in np.flatnonzero(~whole):  # Fractions and huge numbers are summed from their digits one by one
+        try:
+            result[row] = UnaryOperator.hashtag(float(operand[row]))
+        except ValueError:
+            if error_codes[row] == NO_ERROR:
+                error_codes[row] = HASHTAG_DOMAIN
+    return result
+
+
+# A vectorized kernel for every operator of Operator.operators_dict
+_KERNELS = {
+    "+": lambda left, right, error_codes: left + right,
+    "-": lambda left, right, error_codes: left - right,
+    "*": lambda left, right, error_codes: left * right,
+    "/": _divide,
+    "^": _power,
+    "%": _modulo,
+    "$": lambda left, right, error_codes: np.maximum(left, right),
+    "&": lambda left, right, error_codes: np.minimum(left, right),
+    "@": lambda left, right, error_codes: (left + right) / 2,
+    "u": lambda operand, error_codes: -operand,
+    "~": lambda operand, error_codes: -operand,
+    "!": _factorial,
+    "#": _hashtag
+}
+
+
+class VectorizedResult:
+    """
+    The results of evaluating an expression over arrays of variable values.
+
+    Attributes:
+        values (numpy.ndarray): The result of every row, NaN for the rows that failed.
+        error_codes (numpy.ndarray): The error code of every row (see ERROR_NAMES), NO_ERROR for valid rows.
+    """
+    __slots__ = ("values", "error_codes")
+
+    def __init__(self, values, error_codes):
+        self.values = values
+        self.error_codes = error_codes
+
+    @property
+    def ok(self):
+        """
+        :return: A boolean mask of the rows that were evaluated successfully
+        :rtype: numpy.ndarray
+        """
+        return self.error_codes == NO_ERROR
+
+
+class VectorizedExpression:
+    """
+    An expression with variables compiled once and evaluated over NumPy arrays of variable values.
+    Every operator is evaluated for all the rows at once, and the domain errors evaluate_postfix checks for
+    (division by zero, factorial and hashtag domains) are kept per row as error codes.
+    The evaluation is done with float64 numbers, so results can differ from evaluate_postfix in the last bits
+    where NumPy's power differs from math.pow or where evaluate_postfix keeps exact integers.
+
+    Attributes:
+        variables (frozenset): The names of the variables in the expression.
+
+    Methods:
+        evaluate(variables):
+            Evaluates the expression for every row of the variable arrays.
+    """
+    __slots__ = ("variables", "_token_list", "_postfix_expression")
+
+    def __init__(self, expression):
+        """
+        Compiles the expression.
+        :param expression: The raw expression
+        :type expression: str
+        :raises InvalidCharacterException: if invalid characters appear in the expression.
+        :raises InvalidDecimalPointException: if the decimal points are misplaced.
+        :raises InvalidExpressionException: if the validation fails.
+        """
+        token_list = lexer_utils.tokenize(expression, allow_variables=True)
+        if not token_list:
+            raise ValueError("Empty Expression.")
+        found = validation_utils.diagnose(token_list)
+        if found:
+            raise InvalidExpressionException(DiagnosticReport(found))
+        self._token_list = token_list
+        self._postfix_expression = postfix_evaluation_utils.infix_to_postfix(token_list)
+        self.variables = frozenset(token.name for token in token_list if isinstance(token, Variable))
+
+    def evaluate(self, variables):
+        """
+        Evaluates the expression for every row of the variable arrays.
+        :param variables: The values of the variables by name, arrays of the same length or scalars
+        :type variables: dict
+        :return: The values and the error codes of the rows
+        :rtype: VectorizedResult
+        :raises ValueError: if a variable has no value, or the postfix expression is invalid
+        """
+        missing = self.variables - variables.keys()
+        if missing:
+            raise ValueError(f"Variables without a value: {sorted(missing)}")
+        arrays = {name: np.asarray(variables[name], dtype=np.float64) for name in self.variables}
+        # The rows of all the variables, scalars and expressions without variables give a single row
+        shape = np.broadcast_shapes((1,), *(array.shape for array in arrays.values()))
+        error_codes = np.zeros(shape, dtype=np.int8)
+        stack = []
+
+        with np.errstate(all="ignore"):
+            for token, _ in self._postfix_expression:
+                if isinstance(token, Variable):
+                    operand = np.broadcast_to(arrays[token.name], shape)
+                    stack.append(-operand if token.negative else operand)
+                elif isinstance(token, (int, float)):
+                    stack.append(np.full(shape, token, dtype=np.float64))
+                elif token in OPCODES:
+                    kernel = _KERNELS[token]
+                    if ARITIES[OPCODES[token]] == 2:
+                        right = stack.pop()
+                        stack.append(kernel(stack.pop(), right, error_codes))
+                    else:
+                        stack.append(kernel(stack.pop(), error_codes))
+
+        if len(stack) != 1:
+            # Incase the checks somehow don't catch it before, like evaluate_postfix
+            raise ValueError("Invalid postfix expression: too many operands or insufficient operators.")
+        values = np.where(error_codes == NO_ERROR, stack[0], np.nan)
+        return VectorizedResult(values, error_codes)
+
+
+def compile_expression(expression):
+    """
+    Compiles an expression with variables for vectorized evaluation.
+    :param expression: The raw expression
+    :type expression: str
+    :return: The compiled expression
+    :rtype: VectorizedExpression
+    """
+    return VectorizedExpression(expression)